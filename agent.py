@@ -0,0 +1,60 @@
+"""
+Checker agent: serves the status of this host's services for the bot's aggregator.
+
+Usage:
+    python agent.py [--host 127.0.0.1] [--port 9200] [--socket /run/bot-checker.sock]
+                    [--token SECRET] [--name HOSTNAME] [--units units.json] [--fake-states states.json]
+
+--fake-states takes a JSON object of unit name to systemd properties and
+serves them instead of querying systemd, to run several agents on one machine.
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+
+from tgbot.services.agent import serve_agent
+from tgbot.services.checker import FakeBackend, NoLogs, ServiceChecker, StatusSnapshot
+from tgbot.services.discovery import discovery
+from tgbot.services.logs import setup_queue_logging
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default=os.getenv("AGENT_HOST", "127.0.0.1"))
+    parser.add_argument("--port", type=int, default=int(os.getenv("AGENT_PORT", "9200")))
+    parser.add_argument("--socket", default=os.getenv("AGENT_SOCKET"), help="Unix socket path instead of TCP")
+    parser.add_argument("--token", default=os.getenv("AGENT_TOKEN"), help="Shared secret of the aggregator")
+    parser.add_argument("--name", default=os.getenv("AGENT_NAME"), help="Host name shown in the bot")
+    parser.add_argument("--units", default=os.getenv("UNITS_PATH", "units.json"), help="Units file")
+    parser.add_argument("--ttl", type=int, default=int(os.getenv("SERVICES_SNAPSHOT_TTL", "15")))
+    parser.add_argument("--fake-states", help="JSON file with unit states for a fake backend")
+    return parser.parse_args()
+
+
+async def main():
+    args = parse_args()
+    setup_queue_logging(level=logging.INFO)
+
+    if args.fake_states:
+        with open(args.fake_states) as f:
+            states = json.load(f)
+        # Fake agents must not read the real journal
+        agent_checker = ServiceChecker(list(states), backend=FakeBackend(states), logs=NoLogs())
+    else:
+        discovery.path = args.units
+        await discovery.refresh()
+        discovery.start(int(os.getenv("UNITS_REFRESH_INTERVAL", "300")))
+        agent_checker = discovery.checker
+
+    snapshot = StatusSnapshot(agent_checker, ttl=args.ttl)
+    logging.getLogger(__name__).info(f"Starting agent on {args.socket or f'{args.host}:{args.port}'}")
+    await serve_agent(snapshot, args.host, args.port, args.socket, args.token, args.name)
+
+
+if __name__ == "__main__":
+    try:
+        asyncio.run(main())
+    except (KeyboardInterrupt, SystemExit):
+        logging.error("Агент был выключен!")
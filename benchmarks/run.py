@@ -0,0 +1,333 @@
+"""
+Offline benchmarks for the service checker, keyboards, scheduler and status handlers.
+
+Stand-in systemctl/journalctl from benchmarks/bin are put first on PATH and
+Telegram requests are answered by FakeSession, so nothing here needs systemd,
+a database or network access. The config comes from BENCH_ENV only, the .env
+of the working directory is not read, and the alert state is written to a
+temporary directory.
+
+Usage:
+    python -m benchmarks.run [--sizes 7,100,1000] [--iterations 3]
+                             [--output benchmarks/results.json]
+                             [--thresholds benchmarks/thresholds.json]
+
+Exits with code 1 when a median time is above its threshold.
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime
+from pathlib import Path
+
+BENCH_DIR = Path(__file__).resolve().parent
+FAKE_BIN = BENCH_DIR / "bin"
+
+# Config values required by load_config
+BENCH_ENV = {
+    "BOT_TOKEN": "123456:benchmark",
+    "ADMINS": "1,2,3",
+    "DB_HOST": "localhost",
+    "DB_USER": "bench",
+    "DB_PASSWORD": "bench",
+    "DB_NAME": "bench",
+    "KPI_CHECK_ENABLE": "False",
+    "KPI_CHECK_HOUR": "11",
+    "SERVICES_CHECK_ENABLE": "True",
+    "SERVICES_CHECK_INTERVAL": "1",
+    "SERVICES_CHECK_COOLDOWN": "5",
+}
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", default="7,100,1000", help="Comma separated unit counts")
+    parser.add_argument("--iterations", type=int, default=3)
+    parser.add_argument("--output", default=str(BENCH_DIR / "results.json"))
+    parser.add_argument("--thresholds", default=str(BENCH_DIR / "thresholds.json"))
+    parser.add_argument("--systemctl-latency", type=float, default=0.0, help="Seconds per systemctl call")
+    parser.add_argument("--journalctl-latency", type=float, default=0.0, help="Seconds per journalctl call")
+    parser.add_argument("--journal-lines", type=int, default=5, help="Entries per journalctl call")
+    parser.add_argument("--fail-every", type=int, default=10, help="Every N-th unit is failed, 0 - none")
+    parser.add_argument("--send-latency", type=float, default=0.0, help="Seconds per Telegram request")
+    return parser.parse_args()
+
+
+def setup_environment(args, work_dir: Path) -> Path:
+    """Point the config and the fake binaries at benchmark values, returns the env file for load_config"""
+    for key, value in BENCH_ENV.items():
+        os.environ[key] = value
+    # Never touch the alert state and units file of a real installation
+    os.environ["ALERT_STATE_PATH"] = str(work_dir / "alert_state.sqlite3")
+    os.environ["UNITS_PATH"] = str(work_dir / "units.json")
+
+    os.environ["PATH"] = f"{FAKE_BIN}{os.pathsep}{os.environ['PATH']}"
+    os.environ["FAKE_SYSTEMCTL_LATENCY"] = str(args.systemctl_latency)
+    os.environ["FAKE_JOURNALCTL_LATENCY"] = str(args.journalctl_latency)
+    os.environ["FAKE_JOURNAL_LINES"] = str(args.journal_lines)
+    os.environ["FAKE_FAIL_EVERY"] = str(args.fail_every)
+
+    env_file = work_dir / "bench.env"
+    env_file.write_text("")
+    return env_file
+
+
+async def measure(func, iterations: int, setup=None) -> dict:
+    """Run an async callable several times and return timings in milliseconds."""
+    timings = []
+    for _ in range(iterations):
+        if setup is not None:
+            setup()
+        started = time.perf_counter()
+        await func()
+        timings.append((time.perf_counter() - started) * 1000)
+
+    return {
+        "iterations": iterations,
+        "min_ms": round(min(timings), 3),
+        "median_ms": round(statistics.median(timings), 3),
+        "mean_ms": round(statistics.mean(timings), 3),
+        "max_ms": round(max(timings), 3),
+    }
+
+
+def use_units(count: int) -> list:
+    """Replace the monitored units with `count` generated ones."""
+    from tgbot.services.checker import snapshot
+    from tgbot.services.discovery import discovery
+
+    units = [f"bench{i:04d}.service" for i in range(count)]
+    discovery.apply({unit: f"Bench {i}" for i, unit in enumerate(units)})
+    snapshot.invalidate()
+    return units
+
+
+def make_callback(bot, data: str):
+    """Build a callback query bound to the bot, like the dispatcher does."""
+    from aiogram.types import CallbackQuery
+
+    return CallbackQuery.model_validate(
+        {
+            "id": "1",
+            "from": {"id": 1, "is_bot": False, "first_name": "Bench"},
+            "chat_instance": "1",
+            "message": {
+                "message_id": 1,
+                "date": int(time.time()),
+                "chat": {"id": 1, "type": "private"},
+                "text": "bench",
+            },
+            "data": data,
+        },
+        context={"bot": bot},
+    )
+
+
+# Updates posted per webhook_updates iteration
+WEBHOOK_UPDATES = 50
+
+
+def make_update(update_id: int, data: str) -> dict:
+    """A callback query update as Telegram posts it to the webhook."""
+    return {
+        "update_id": update_id,
+        "callback_query": {
+            "id": str(update_id),
+            "from": {"id": 1, "is_bot": False, "first_name": "Bench"},
+            "chat_instance": "1",
+            "message": {
+                "message_id": update_id,
+                "date": int(time.time()),
+                "chat": {"id": 1, "type": "private"},
+                "text": "bench",
+            },
+            "data": data,
+        },
+    }
+
+
+async def run_size(count: int, args, bot, dp) -> dict:
+    from tgbot.handlers import status as status_handlers
+    from tgbot.keyboards.inline import ServiceMenu, MainMenu, StatusMenu, STATUS_PAGE_SIZE, services_status_kb
+    from tgbot.services import broadcaster as broadcaster_module
+    from tgbot.services import scheduler as scheduler_module
+    from tgbot.services.checker import ServiceChecker, checker, snapshot
+    from tgbot.services.discovery import UnitDiscovery
+
+    units = use_units(count)
+    iterations = args.iterations
+    results = {}
+
+    os.environ["FAKE_UNIT_COUNT"] = str(count)
+    units_file = Path(args.output).with_name("bench_units.json")
+    units_file.write_text(json.dumps({"units": ["bench*.service"]}))
+
+    async def discover():
+        await UnitDiscovery(ServiceChecker([]), str(units_file)).refresh()
+
+    results["discover_units"] = await measure(discover, iterations)
+    units_file.unlink()
+
+    async def check_all():
+        await ServiceChecker(units).check_all_services()
+
+    results["check_all_services"] = await measure(check_all, iterations)
+
+    probe = await checker.check_all_services()
+
+    async def format_all():
+        for result in probe:
+            checker.format_service_message(result["service"], result)
+
+    results["format_service_message"] = await measure(format_all, iterations)
+
+    by_service = {result["service"]: result for result in probe}
+    pages = -(-count // STATUS_PAGE_SIZE)
+
+    async def build_kb():
+        services_status_kb(units[:STATUS_PAGE_SIZE], by_service, StatusMenu(action="page"), pages)
+
+    results["services_status_kb"] = await measure(build_kb, iterations)
+
+    def reset_alert_state():
+        snapshot.invalidate()
+        scheduler_module.alert_state.offline_services = set()
+        scheduler_module.alert_state.notification_time.clear()
+        # Per-chat limits would make every iteration after the first wait
+        broadcaster_module.broadcaster = broadcaster_module.Broadcaster(rate=1e6, per_chat_rate=1e6)
+
+    async def status_check():
+        await scheduler_module.services_status_check(bot)
+
+    default_broadcaster = broadcaster_module.broadcaster
+    try:
+        results["services_status_check"] = await measure(status_check, iterations, setup=reset_alert_state)
+    finally:
+        broadcaster_module.broadcaster = default_broadcaster
+
+    menu_data = MainMenu(choice="status").pack()
+
+    async def bots_check():
+        await status_handlers.bots_check(make_callback(bot, menu_data))
+
+    results["bots_check"] = await measure(bots_check, iterations, setup=snapshot.invalidate)
+    results["bots_check_cached"] = await measure(bots_check, iterations)
+
+    flip = StatusMenu(action="page", page=1)
+
+    async def status_page_flip():
+        await status_handlers.status_page(make_callback(bot, flip.pack()), flip)
+
+    results["status_page_flip"] = await measure(status_page_flip, iterations)
+
+    detail = ServiceMenu.of(units[0], "view")
+
+    async def service_detail():
+        await status_handlers.service_detail(make_callback(bot, detail.pack()), detail)
+
+    results["service_detail"] = await measure(service_detail, iterations, setup=snapshot.invalidate)
+
+    # Recorded page flips posted to the webhook, timed until all of them are processed
+    from aiohttp import ClientSession
+    from aiohttp.test_utils import TestServer
+    from tgbot.services.webhook import SECRET_HEADER, create_app
+
+    server = TestServer(create_app(dp, bot, "/webhook", secret="bench", max_concurrent=10))
+    await server.start_server()
+    handler = server.app["handler"]
+    update_ids = iter(range(1, 10 ** 9))
+
+    async def webhook_updates():
+        async with ClientSession() as client:
+            for _ in range(WEBHOOK_UPDATES):
+                async with client.post(server.make_url("/webhook"), json=make_update(next(update_ids), flip.pack()),
+                                       headers={SECRET_HEADER: "bench"}) as response:
+                    assert response.status == 200, response.status
+        await handler.drain(timeout=60)
+
+    results["webhook_updates"] = await measure(webhook_updates, iterations)
+    await server.close()
+
+    return results
+
+
+def check_thresholds(report: dict, thresholds: dict) -> list:
+    """Return the list of benchmarks slower than their threshold."""
+    failures = []
+    for size, benchmarks in report["results"].items():
+        for name, timing in benchmarks.items():
+            key = f"{name}[{size}]"
+            limit = thresholds.get(key)
+            if limit is not None and timing["median_ms"] > limit:
+                failures.append({"benchmark": key, "median_ms": timing["median_ms"], "threshold_ms": limit})
+    return failures
+
+
+async def main():
+    args = parse_args()
+    with tempfile.TemporaryDirectory(prefix="checker-bench-") as work_dir:
+        return await run(args, setup_environment(args, Path(work_dir)))
+
+
+async def run(args, env_file: Path) -> int:
+    sys.path.insert(0, str(BENCH_DIR.parent))
+    from aiogram import Bot, Dispatcher
+    from aiogram.client.default import DefaultBotProperties
+
+    from benchmarks.session import FakeSession
+
+    session = FakeSession(latency=args.send_latency)
+    bot = Bot(token=BENCH_ENV["BOT_TOKEN"], session=session, default=DefaultBotProperties(parse_mode="HTML"))
+
+    from tgbot.config import load_config
+    from tgbot.handlers import routers_list
+    from tgbot.services import db, scheduler as scheduler_module
+
+    config = load_config(str(env_file))
+    db.configure(config.db)
+    scheduler_module.configure(config)
+
+    dp = Dispatcher()
+    dp.include_routers(*routers_list)
+
+    report = {
+        "created_at": datetime.now().isoformat(),
+        "python": platform.python_version(),
+        "parameters": {
+            "iterations": args.iterations,
+            "systemctl_latency": args.systemctl_latency,
+            "journalctl_latency": args.journalctl_latency,
+            "journal_lines": args.journal_lines,
+            "fail_every": args.fail_every,
+            "send_latency": args.send_latency,
+        },
+        "results": {},
+    }
+
+    for size in (int(size) for size in args.sizes.split(",")):
+        report["results"][str(size)] = await run_size(size, args, bot, dp)
+        for name, timing in report["results"][str(size)].items():
+            print(f"{name}[{size}]: median {timing['median_ms']} ms")
+
+    thresholds = {}
+    if args.thresholds and Path(args.thresholds).exists():
+        thresholds = json.loads(Path(args.thresholds).read_text())
+    report["telegram_requests"] = len(session.requests)
+    report["failures"] = check_thresholds(report, thresholds)
+
+    Path(args.output).write_text(json.dumps(report, indent=2, ensure_ascii=False))
+    print(f"Results written to {args.output}")
+
+    for failure in report["failures"]:
+        print(f"REGRESSION {failure['benchmark']}: {failure['median_ms']} ms > {failure['threshold_ms']} ms")
+    return 1 if report["failures"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(main()))
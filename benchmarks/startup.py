@@ -0,0 +1,181 @@
+"""
+Cold-start profile of the bot process.
+
+Imports bot.py and runs its startup() in fresh interpreters, with the
+stand-in systemctl from benchmarks/bin and a DB host that does not exist,
+and reports:
+- the slowest modules by cumulative import time (python -X importtime);
+- the import time of the bot's own modules, without aiogram and other
+  libraries, which mostly depends on the machine;
+- the time of `import bot` and of startup();
+- whether pyodbc.connect() was called, which import and startup must
+  never do.
+
+Usage:
+    python -m benchmarks.startup [--runs 3] [--own-import-budget 300]
+                                 [--import-budget 5000] [--startup-budget 1000]
+                                 [--output benchmarks/startup.json]
+
+Exits with code 1 when a median time is above its budget or the DB was touched.
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+from pathlib import Path
+
+from benchmarks.run import BENCH_DIR, BENCH_ENV, FAKE_BIN
+
+ROOT = BENCH_DIR.parent
+
+# Default budgets in ms, also enforced by tests/test_startup.py
+OWN_IMPORT_BUDGET = 300
+IMPORT_BUDGET = 5000
+STARTUP_BUDGET = 1000
+
+# Runs in a fresh interpreter, prints timings as JSON
+PROBE = """
+import asyncio, json, sys, time, types
+
+# Record every connection attempt, whichever code path makes it
+connect_calls = []
+try:
+    import pyodbc
+except ImportError:
+    # No driver here: a module with only connect() is enough to see the attempts
+    pyodbc = sys.modules["pyodbc"] = types.ModuleType("pyodbc")
+    pyodbc.connect = lambda *args, **kwargs: None
+real_connect = pyodbc.connect
+
+def recording_connect(*args, **kwargs):
+    connect_calls.append(time.perf_counter())
+    return real_connect(*args, **kwargs)
+
+pyodbc.connect = recording_connect
+
+started = time.perf_counter()
+import bot
+imported = time.perf_counter()
+
+from tgbot.config import load_config
+
+config = load_config()
+startup_started = time.perf_counter()
+asyncio.run(bot.startup(config))
+finished = time.perf_counter()
+
+print(json.dumps({
+    "import_ms": (imported - started) * 1000,
+    "startup_ms": (finished - startup_started) * 1000,
+    "db_connected": bool(connect_calls),
+}))
+"""
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--own-import-budget", type=float, default=OWN_IMPORT_BUDGET,
+                        help="Max ms of importing bot and tgbot.*")
+    parser.add_argument("--import-budget", type=float, default=IMPORT_BUDGET, help="Max median ms of `import bot`")
+    parser.add_argument("--startup-budget", type=float, default=STARTUP_BUDGET, help="Max median ms of startup()")
+    parser.add_argument("--top", type=int, default=15, help="Modules shown in the import profile")
+    parser.add_argument("--output", default=str(BENCH_DIR / "startup.json"))
+    return parser.parse_args()
+
+
+def bench_env() -> dict:
+    env = {**os.environ, **BENCH_ENV}
+    env["PATH"] = f"{FAKE_BIN}{os.pathsep}{env['PATH']}"
+    env["FAKE_UNIT_COUNT"] = "100"
+    # Nothing listens there, startup must not wait for it
+    env["DB_HOST"] = "192.0.2.1"
+    env["UNITS_PATH"] = str(BENCH_DIR / "missing_units.json")
+    env["ALERT_STATE_PATH"] = ":memory:"
+    env["PYTHONPATH"] = os.pathsep.join(filter(None, [str(ROOT), env.get("PYTHONPATH")]))
+    return env
+
+
+def is_own_module(name: str) -> bool:
+    return name in ("bot", "tgbot") or name.startswith("tgbot.")
+
+
+def own_import_ms(profile: list) -> float:
+    """Import time of the bot's own modules, without the libraries they import"""
+    return round(sum(module["self_ms"] for module in profile if is_own_module(module["module"])), 3)
+
+
+def import_profile(env: dict) -> list:
+    """Self and cumulative import time of every module imported by `import bot`."""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import bot"],
+        cwd=ROOT, env=env, capture_output=True, text=True, check=True,
+    )
+    modules = []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, self_us, cumulative_us, name = (part.strip() for part in line.replace("import time:", "|").split("|"))
+        modules.append({"module": name.strip(), "self_ms": int(self_us) / 1000, "cumulative_ms": int(cumulative_us) / 1000})
+    return modules
+
+
+def probe(env: dict) -> dict:
+    result = subprocess.run([sys.executable, "-c", PROBE], cwd=ROOT, env=env, capture_output=True, text=True)
+    if result.returncode != 0:
+        raise RuntimeError(result.stderr)
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def main():
+    args = parse_args()
+    env = bench_env()
+
+    profile = import_profile(env)
+    own_ms = own_import_ms(profile)
+    modules = sorted(profile, key=lambda module: module["cumulative_ms"], reverse=True)[:args.top]
+    print("Slowest imports (cumulative):")
+    for module in modules:
+        print(f"  {module['cumulative_ms']:9.1f} ms  {module['module']}")
+
+    runs = [probe(env) for _ in range(args.runs)]
+    report = {
+        "import_profile": modules,
+        "own_import_ms": own_ms,
+        "runs": runs,
+        "import_ms": round(statistics.median(run["import_ms"] for run in runs), 3),
+        "startup_ms": round(statistics.median(run["startup_ms"] for run in runs), 3),
+        "db_connected": any(run["db_connected"] for run in runs),
+        "budget": {
+            "own_import_ms": args.own_import_budget,
+            "import_ms": args.import_budget,
+            "startup_ms": args.startup_budget,
+        },
+    }
+    print(f"bot modules: {own_ms} ms (budget {args.own_import_budget} ms)")
+    print(f"import bot: median {report['import_ms']} ms (budget {args.import_budget} ms)")
+    print(f"startup(): median {report['startup_ms']} ms (budget {args.startup_budget} ms)")
+
+    failures = []
+    if own_ms > args.own_import_budget:
+        failures.append(f"bot modules took {own_ms} ms to import > {args.own_import_budget} ms")
+    if report["import_ms"] > args.import_budget:
+        failures.append(f"import bot took {report['import_ms']} ms > {args.import_budget} ms")
+    if report["startup_ms"] > args.startup_budget:
+        failures.append(f"startup() took {report['startup_ms']} ms > {args.startup_budget} ms")
+    if report["db_connected"]:
+        failures.append("pyodbc.connect() was called during import or startup")
+    report["failures"] = failures
+
+    Path(args.output).write_text(json.dumps(report, indent=2, ensure_ascii=False))
+    print(f"Results written to {args.output}")
+
+    for failure in failures:
+        print(f"BUDGET EXCEEDED: {failure}")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,14 +1,35 @@
 import asyncio
 import logging
+from datetime import datetime
+from functools import partial
 
-import betterlogging as bl
+import pytz
 from aiogram import Bot, Dispatcher
 from aiogram.client.default import DefaultBotProperties
+from apscheduler.events import EVENT_JOB_MISSED, EVENT_JOB_MAX_INSTANCES
 
 from tgbot.config import load_config, Config
 from tgbot.handlers import routers_list
 from tgbot.middlewares.config import ConfigMiddleware
-from tgbot.services.scheduler import scheduler, kpi_check, services_status_check
+from tgbot.middlewares.log_context import LogContextMiddleware, HandlerNameMiddleware
+from tgbot.services import db
+from tgbot.services import scheduler as scheduler_module
+from tgbot.services.actions import service_actions
+from tgbot.services.admins import admin_cache
+from tgbot.services.aggregator import Agent, aggregator
+from tgbot.services.checker import checker, snapshot
+from tgbot.services.completeness import kpi_completeness
+from tgbot.services.discovery import discovery
+from tgbot.services.executors import MonitoredExecutor
+from tgbot.services.jobs import job_runner
+from tgbot.services.journal import JournalFollower
+from tgbot.services.logs import setup_queue_logging
+from tgbot.services.metrics import start_metrics_server
+from tgbot.services.remediation import remediator
+from tgbot.services.scheduler import scheduler, kpi_check, services_status_check, log_error_alert, unit_state_changed, \
+    job_missed, alert_state, remediation_report
+from tgbot.services.watcher import UnitWatcher
+from tgbot.services.webhook import run_webhook
 
 
 def register_global_middlewares(dp: Dispatcher, config: Config, session_pool=None):
@@ -31,15 +52,20 @@ def register_global_middlewares(dp: Dispatcher, config: Config, session_pool=Non
         dp.message.outer_middleware(middleware_type)
         dp.callback_query.outer_middleware(middleware_type)
 
+    # Update id, handler name and duration for the logs
+    dp.update.outer_middleware(LogContextMiddleware())
+    dp.message.middleware(HandlerNameMiddleware())
+    dp.callback_query.middleware(HandlerNameMiddleware())
+
 
 def setup_logging():
     """
     Set up logging configuration for the application.
 
-    This method initializes the logging configuration for the application.
-    It sets the log level to INFO and configures a basic colorized log for
-    output. The log format includes the filename, line number, log level,
-    timestamp, logger name, and log message.
+    Records are put on a queue and written as JSON lines to stdout by a
+    separate thread, so handlers never wait for the log output. Every record
+    carries the update id and the handler of the update it was logged for;
+    high-volume success records are sampled.
 
     Returns:
         None
@@ -48,19 +74,86 @@ def setup_logging():
         setup_logging()
     """
     log_level = logging.INFO
-    bl.basic_colorized_config(level=log_level)
+    setup_queue_logging(level=log_level)
+
+    # Updates are logged with their duration by LogContextMiddleware
+    logging.getLogger("aiogram.event").setLevel(logging.WARNING)
 
-    logging.basicConfig(
-        level=logging.INFO,
-        format="%(filename)s:%(lineno)d #%(levelname)-8s [%(asctime)s] - %(name)s - %(message)s",
-    )
     logger = logging.getLogger(__name__)
     logger.info("Starting bot")
 
 
+# Journal follower and unit watcher, updated when discovery changes the units
+followers = []
+
+
+async def units_changed(added, removed):
+    for follower in followers:
+        follower.set_services(checker.services)
+    snapshot.invalidate(removed)
+    # Per-unit logs and resource series must not outlive the unit
+    for unit in removed:
+        checker.forget(unit)
+
+
+async def startup(config: Config):
+    """
+    Configure the services and do the work needed before updates are handled.
+
+    Nothing here waits for the DB: connections are opened on first use and
+    admin roles are preloaded by the scheduler in the background. The unit
+    list and the alert state are loaded concurrently.
+    """
+    db.configure(config.db)
+    scheduler_module.configure(config)
+
+    snapshot.ttl = config.checkers.services_snapshot_ttl
+
+    # Start/stop/restart wait for the unit state, bulk restarts are limited in concurrency
+    service_actions.timeout = config.checkers.services_action_timeout
+    service_actions.bulk_concurrency = config.checkers.services_bulk_concurrency
+    service_actions.rolling_concurrency = config.checkers.services_rolling_concurrency
+
+    # Opt-in automatic restarts of failed units
+    remediator.enable = config.remediation.enable
+    remediator.max_attempts = config.remediation.max_attempts
+    remediator.backoff = config.remediation.backoff
+    remediator.max_backoff = config.remediation.max_backoff
+    remediator.flap_window = config.remediation.flap_window
+    remediator.flap_threshold = config.remediation.flap_threshold
+
+    # Monitored units come from the units file and are re-discovered periodically
+    discovery.path = config.checkers.units_path
+
+    # KPI procedures run in the background and are cancelled after the timeout
+    job_runner.timeout = config.db.procedure_timeout
+
+    # Divisions expected in KPI, from the config or a reference table
+    if config.checkers.kpi_divisions:
+        kpi_completeness.divisions = config.checkers.kpi_divisions
+    if config.checkers.kpi_excluded_divisions is not None:
+        kpi_completeness.excluded = config.checkers.kpi_excluded_divisions
+    if config.checkers.kpi_divisions_table:
+        # Fails at startup on a name that cannot be used in the query
+        db.quote_table(config.checkers.kpi_divisions_table)
+    kpi_completeness.table = config.checkers.kpi_divisions_table
+
+    # Checker agents on other hosts
+    aggregator.agents = [Agent.parse(agent) for agent in config.agents.agents]
+    aggregator.token = config.agents.token
+    aggregator.timeout = config.agents.timeout
+
+    admin_cache.ttl = config.tg_bot.admin_cache_ttl
+
+    await asyncio.gather(discovery.refresh(), alert_state.load())
+
+
 async def main():
     setup_logging()
 
+    # Alert state writes and DB helpers run in the default executor, its backlog is exported as a metric
+    asyncio.get_running_loop().set_default_executor(MonitoredExecutor("default"))
+
     config = load_config(".env")
 
     bot = Bot(token=config.tg_bot.token, default=DefaultBotProperties(parse_mode='HTML'))
@@ -70,17 +163,54 @@ async def main():
 
     register_global_middlewares(dp, config)
 
+    await startup(config)
+
+    discovery.on_change.append(units_changed)
+    remediator.report = partial(remediation_report, bot)
+    discovery.start(config.checkers.units_refresh_interval)
+
+    # Admin roles are kept in memory and refreshed in the background, the first load starts right away
+    scheduler.add_job(admin_cache.preload, "interval", seconds=max(config.tg_bot.admin_cache_ttl // 2, 1),
+                      id="admin_cache_preload", next_run_time=datetime.now(pytz.utc))
+
+    # Journal follower replaces per-probe journalctl calls
+    if config.checkers.journal_follow_enable:
+        follower = JournalFollower(checker.services, on_error=partial(log_error_alert, bot))
+        checker.follower = follower
+        follower.start()
+        followers.append(follower)
+
     # KPI Check job
     if config.checkers.kpi_check_enable:
-        scheduler.add_job(kpi_check, "cron", hour=str(config.checkers.kpi_check_hour), args=[bot])
+        scheduler.add_job(kpi_check, "cron", hour=str(config.checkers.kpi_check_hour), args=[bot], id="kpi_check")
 
     # Services Check job
     if config.checkers.services_check_enable:
-        scheduler.add_job(services_status_check, "interval", minutes=config.checkers.services_check_interval, args=[bot])
+        interval = config.checkers.services_check_interval
+
+        # State changes come from systemd signals, polling is only a safety net
+        if config.checkers.services_watch_enable:
+            watcher = UnitWatcher(checker.services, on_change=partial(unit_state_changed, bot))
+            watcher.start()
+            followers.append(watcher)
+            interval = config.checkers.services_watch_interval
 
+        scheduler.add_job(services_status_check, "interval", minutes=interval, args=[bot], id="services_status_check")
+
+    scheduler.add_listener(job_missed, EVENT_JOB_MISSED | EVENT_JOB_MAX_INSTANCES)
     scheduler.start()
 
-    await dp.start_polling(bot)
+    if config.metrics.enable:
+        await start_metrics_server(config.metrics.host, config.metrics.port)
+
+    try:
+        if config.webhook.enable:
+            await run_webhook(dp, bot, config.webhook)
+        else:
+            await dp.start_polling(bot)
+    finally:
+        await alert_state.close()
+        await aggregator.close()
 
 
 if __name__ == "__main__":
@@ -0,0 +1,38 @@
+import asyncio
+
+from tgbot.services import db
+from tgbot.services.admins import AdminCache
+
+
+def test_reload_drops_revoked_admins(monkeypatch):
+    cache = AdminCache()
+    admins = {1, 2}
+    monkeypatch.setattr(db, "get_admin_ids", lambda: set(admins))
+    monkeypatch.setattr(db, "is_admin", lambda user_id: user_id in admins)
+
+    async def main():
+        await cache.preload()
+        assert await cache.is_admin(2)
+
+        admins.discard(2)
+        assert await cache.is_admin(2), "cached until the TTL or a reload"
+        assert await cache.reload()
+        return await cache.is_admin(1), await cache.is_admin(2)
+
+    assert asyncio.run(main()) == (True, False)
+
+
+def test_reload_keeps_the_cache_when_the_db_fails(monkeypatch):
+    cache = AdminCache()
+    monkeypatch.setattr(db, "get_admin_ids", lambda: {1})
+
+    def db_down():
+        raise ConnectionError("DB is down")
+
+    async def main():
+        await cache.preload()
+        monkeypatch.setattr(db, "get_admin_ids", db_down)
+        assert not await cache.reload()
+        return cache.peek(1)
+
+    assert asyncio.run(main()) is True
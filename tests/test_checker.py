@@ -0,0 +1,61 @@
+import asyncio
+
+from tgbot.services import checker as checker_module
+from tgbot.services.checker import FakeBackend, NoLogs, ServiceChecker, SystemctlBackend, parse_systemctl_show
+
+
+def test_parse_systemctl_show_matches_blocks_by_id():
+    # b.service is skipped by systemctl, c.service must not get its neighbour's state
+    output = (
+        "Id=a.service\nActiveState=active\n\n"
+        "Id=c.service\nActiveState=failed\n\n"
+    )
+    states = parse_systemctl_show(output, ["a.service", "b.service", "c.service"])
+
+    assert states["a.service"]["ActiveState"] == "active"
+    assert states["c.service"]["ActiveState"] == "failed"
+    assert "b.service" not in states
+
+
+def test_parse_systemctl_show_matches_alias_by_names():
+    output = "Id=real.service\nNames=real.service alias.service\nActiveState=active\n"
+    states = parse_systemctl_show(output, ["alias.service"])
+
+    assert states["alias.service"]["ActiveState"] == "active"
+
+
+def test_systemctl_failure_is_reported_as_error(monkeypatch):
+    async def failed_run_command(cmd, timeout=None, unit=""):
+        return 1, "", "Failed to connect to bus: Connection timed out"
+
+    monkeypatch.setattr(checker_module, "run_command", failed_run_command)
+    service_checker = ServiceChecker(["a.service", "b.service"], SystemctlBackend(), logs=NoLogs())
+
+    results = asyncio.run(service_checker.check_services(service_checker.services))
+
+    assert [result["status"] for result in results] == ["error", "error"]
+    assert all("Connection timed out" in result["error"] for result in results)
+
+
+def test_fake_backend_results():
+    backend = FakeBackend({"a.service": {"ActiveState": "active", "SubState": "running", "NRestarts": "2"}})
+    service_checker = ServiceChecker(["a.service", "b.service"], backend, logs=NoLogs())
+
+    a, b = asyncio.run(service_checker.check_services(service_checker.services))
+
+    assert a["active"] and a["sub_state"] == "running" and a["restarts"] == 2
+    assert not b["active"] and b["load_state"] == "not-found"
+    assert backend.calls == 1
+
+
+def test_journal_failure_keeps_states():
+    class SlowJournal(NoLogs):
+        async def read(self, services, watched=()):
+            raise asyncio.TimeoutError
+
+    service_checker = ServiceChecker(["a.service"], FakeBackend({"a.service": {"ActiveState": "active"}}),
+                                     logs=SlowJournal())
+
+    (result,) = asyncio.run(service_checker.check_services(service_checker.services))
+
+    assert result["active"] and result["error"] is None and result["last_logs"] == []
@@ -0,0 +1,57 @@
+import time
+
+import pytest
+
+from tgbot.services import db
+from tgbot.services.db import ConnectionPool, ProcedureRun
+
+
+class FakeConnection:
+    timeout = 0
+
+    def cursor(self):
+        return self
+
+    def execute(self, query):
+        pass
+
+    def commit(self):
+        pass
+
+    def rollback(self):
+        pass
+
+    def close(self):
+        pass
+
+
+class FakePool(ConnectionPool):
+    def _connect(self):
+        return FakeConnection()
+
+
+def test_pool_is_warmed_to_min_size_after_first_checkout():
+    pool = FakePool("", min_size=3, max_size=5)
+    assert pool.stats()["size"] == 0
+
+    with pool.connection():
+        pass
+
+    deadline = time.monotonic() + 1
+    while pool.stats()["size"] < 3 and time.monotonic() < deadline:
+        time.sleep(0.01)
+    stats = pool.stats()
+    assert stats["size"] == 3
+    assert stats["idle"] == 3
+
+
+def test_procedure_timeout_below_one_second_is_not_disabled(monkeypatch):
+    pyodbc = pytest.importorskip("pyodbc")
+    connection = FakeConnection()
+    monkeypatch.setattr(pyodbc, "connect", lambda dsn: connection)
+    monkeypatch.setattr(db, "connection_string", lambda: "")
+
+    success, _ = ProcedureRun("dbo.Test", timeout=0.3).execute()
+
+    assert success
+    assert connection.timeout == 1
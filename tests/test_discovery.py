@@ -0,0 +1,46 @@
+import asyncio
+import json
+
+import pytest
+
+from tgbot.services import discovery as discovery_module
+from tgbot.services.checker import NoLogs, ServiceChecker
+from tgbot.services.discovery import UnitDiscovery, parse_list_units
+
+
+def test_parse_list_units_rejects_invalid_output():
+    assert parse_list_units('[{"unit": "a.service"}, {"load": "x"}]') == ["a.service"]
+    with pytest.raises(ValueError):
+        parse_list_units("")
+    with pytest.raises(ValueError):
+        parse_list_units('{"unit": "a.service"}')
+
+
+@pytest.mark.parametrize("returncode, output", [(1, "[]"), (0, "")])
+def test_failed_listing_keeps_pattern_units(tmp_path, monkeypatch, returncode, output):
+    path = tmp_path / "units.json"
+    path.write_text(json.dumps({"units": ["exact.service", "*bot.service"]}), encoding="utf-8")
+    discovery = UnitDiscovery(ServiceChecker([], logs=NoLogs()), path=str(path))
+
+    # The first listing succeeds, the second one fails
+    results = [(0, '[{"unit": "one.bot.service"}, {"unit": "two.bot.service"}]', ""),
+               (returncode, output, "Failed to connect to bus")]
+
+    async def fake_run_command(cmd, timeout=None, unit=""):
+        return results.pop(0)
+
+    monkeypatch.setattr(discovery_module, "run_command", fake_run_command)
+    changes = []
+
+    async def on_change(added, removed):
+        changes.append((added, removed))
+
+    discovery.on_change.append(on_change)
+
+    async def main():
+        assert await discovery.refresh() is True
+        return await discovery.refresh()
+
+    assert asyncio.run(main()) is False
+    assert discovery.units == ["exact.service", "one.bot.service", "two.bot.service"]
+    assert len(changes) == 1
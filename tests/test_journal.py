@@ -0,0 +1,121 @@
+import asyncio
+import json
+import time
+
+from tgbot.services import journal as journal_module
+from tgbot.services.journal import JournalFollower
+
+
+def journal_line(unit: str, message: str, priority: int = 6, cursor: str = None, timestamp: float = None) -> bytes:
+    raw = {
+        "_SYSTEMD_UNIT": unit,
+        "MESSAGE": message,
+        "PRIORITY": str(priority),
+        "__REALTIME_TIMESTAMP": str(int((timestamp or time.time()) * 1_000_000)),
+    }
+    if cursor:
+        raw["__CURSOR"] = cursor
+    return json.dumps(raw).encode() + b"\n"
+
+
+def stream_of(*lines: bytes) -> asyncio.StreamReader:
+    stream = asyncio.StreamReader()
+    for line in lines:
+        stream.feed_data(line)
+    stream.feed_eof()
+    return stream
+
+
+def test_entries_are_kept_per_unit_in_ring_buffers():
+    follower = JournalFollower(["a.service", "b.service"], buffer_size=3)
+
+    async def main():
+        await follower.consume(stream_of(
+            *(journal_line("a.service", f"a{i}") for i in range(5)),
+            journal_line("b.service", "b0"),
+            journal_line("other.service", "ignored"),
+            b"not json\n",
+        ))
+
+    asyncio.run(main())
+
+    assert [entry.message for entry in follower.drain("a.service")] == ["a2", "a3", "a4"]
+    assert follower.drain("a.service") == []
+    assert [entry.message for entry in follower.drain("b.service")] == ["b0"]
+    assert follower.drain("other.service") == []
+
+
+def test_restart_continues_after_the_last_cursor(monkeypatch):
+    follower = JournalFollower(["a.service"])
+    commands = []
+    outputs = [
+        [journal_line("a.service", "first", cursor="s=1"), journal_line("a.service", "second", cursor="s=2")],
+        [],
+    ]
+
+    class FakeProcess:
+        def __init__(self, lines):
+            self.stdout = stream_of(*lines)
+            self.returncode = 0
+
+        def kill(self):
+            pass
+
+        async def wait(self):
+            return self.returncode
+
+    async def fake_exec(*cmd, **kwargs):
+        commands.append(cmd)
+        return FakeProcess(outputs.pop(0))
+
+    monkeypatch.setattr(journal_module.asyncio, "create_subprocess_exec", fake_exec)
+
+    async def main():
+        await follower._follow()
+        await follower._follow()
+
+    asyncio.run(main())
+
+    assert "-n" in commands[0] and not any(arg.startswith("--after-cursor") for arg in commands[0])
+    assert "--after-cursor=s=2" in commands[1]
+
+
+def test_new_errors_are_alerted_and_backlog_is_not():
+    alerts = []
+
+    async def on_error(service_name, message):
+        alerts.append((service_name, message))
+
+    follower = JournalFollower(["a.service"], on_error=on_error)
+
+    async def main():
+        follower.start()
+        await follower.consume(stream_of(
+            journal_line("a.service", "old failure", priority=3, timestamp=time.time() - 3600),
+            journal_line("a.service", "all good"),
+            journal_line("a.service", "connection lost", priority=3),
+        ))
+        await asyncio.sleep(0.01)
+        await follower.stop()
+
+    asyncio.run(main())
+
+    assert len(alerts) == 1
+    assert alerts[0][0] == "a.service" and "connection lost" in alerts[0][1]
+
+
+def test_alerts_are_dropped_when_delivery_is_behind():
+    async def on_error(service_name, message):
+        pass
+
+    follower = JournalFollower(["a.service"], on_error=on_error)
+
+    async def main():
+        # Nothing delivers the alerts, the queue fills up
+        await follower.consume(stream_of(
+            *(journal_line("a.service", f"error {i}", priority=3) for i in range(journal_module.ALERT_QUEUE_SIZE + 5))
+        ))
+
+    asyncio.run(main())
+
+    assert follower.dropped_alerts == 5
@@ -0,0 +1,12 @@
+from benchmarks.startup import IMPORT_BUDGET, OWN_IMPORT_BUDGET, STARTUP_BUDGET, bench_env, import_profile, \
+    own_import_ms, probe
+
+
+def test_cold_start_fits_the_budget_without_db():
+    env = bench_env()
+    run = probe(env)
+
+    assert not run["db_connected"], "pyodbc.connect() was called during import or startup"
+    assert run["import_ms"] <= IMPORT_BUDGET
+    assert run["startup_ms"] <= STARTUP_BUDGET
+    assert own_import_ms(import_profile(env)) <= OWN_IMPORT_BUDGET
@@ -0,0 +1,63 @@
+import asyncio
+import threading
+import time
+
+from tgbot.services.state import AlertStateStore
+
+
+def test_failed_write_is_retried(tmp_path):
+    store = AlertStateStore(str(tmp_path / "state.sqlite3"), flush_delay=0.01)
+    write = store._write
+    calls = []
+
+    def flaky_write(rows):
+        calls.append(rows)
+        if len(calls) == 1:
+            raise OSError("disk is full")
+        write(rows)
+
+    store._write = flaky_write
+
+    async def main():
+        store.offline_services.add("a.service")
+        store.save()
+        await asyncio.sleep(0.2)
+
+        restored = AlertStateStore(store.path)
+        await restored.load()
+        return restored.offline_services
+
+    assert asyncio.run(main()) == {"a.service"}
+    assert len(calls) == 2
+
+
+def test_close_waits_for_running_write(tmp_path):
+    store = AlertStateStore(str(tmp_path / "state.sqlite3"), flush_delay=0.01)
+    write = store._write
+    active = []
+    overlapped = threading.Event()
+
+    def slow_write(rows):
+        if active:
+            overlapped.set()
+        active.append(rows)
+        time.sleep(0.1)
+        write(rows)
+        active.pop()
+
+    store._write = slow_write
+
+    async def main():
+        store.offline_services.add("a.service")
+        store.save()
+        # The delayed flush is writing now
+        await asyncio.sleep(0.05)
+        store.offline_services.add("b.service")
+        await store.close()
+
+        restored = AlertStateStore(store.path)
+        await restored.load()
+        return restored.offline_services
+
+    assert asyncio.run(main()) == {"a.service", "b.service"}
+    assert not overlapped.is_set()
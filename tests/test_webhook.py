@@ -0,0 +1,76 @@
+import asyncio
+
+from aiogram import Bot, Dispatcher
+from aiohttp.test_utils import TestClient, TestServer
+
+from tgbot.services.webhook import SECRET_HEADER, create_app
+
+SECRET = "test-secret"
+
+
+def make_app(max_concurrent: int = 2, max_pending: int = 3):
+    """App with a dispatcher that records updates and holds them until `release` is set"""
+    dp = Dispatcher()
+    bot = Bot("123456:test")
+    processed = []
+    release = asyncio.Event()
+
+    async def feed_raw_update(bot, update, **kwargs):
+        await release.wait()
+        processed.append(update["update_id"])
+
+    dp.feed_raw_update = feed_raw_update
+    app = create_app(dp, bot, "/webhook", secret=SECRET, max_concurrent=max_concurrent, max_pending=max_pending)
+    return app, bot, processed, release
+
+
+def post(client: TestClient, update_id: int, secret: str = SECRET):
+    return client.post("/webhook", json={"update_id": update_id}, headers={SECRET_HEADER: secret})
+
+
+def test_updates_are_accepted_and_processed():
+    async def main():
+        app, bot, processed, release = make_app()
+        release.set()
+        async with TestClient(TestServer(app)) as client:
+            statuses = [(await post(client, update_id)).status for update_id in (1, 2)]
+            await app["handler"].drain(timeout=1)
+        await bot.session.close()
+        return statuses, processed
+
+    statuses, processed = asyncio.run(main())
+    assert statuses == [200, 200]
+    assert sorted(processed) == [1, 2]
+
+
+def test_wrong_secret_is_rejected():
+    async def main():
+        app, bot, processed, release = make_app()
+        release.set()
+        async with TestClient(TestServer(app)) as client:
+            status = (await post(client, 1, secret="wrong")).status
+        await bot.session.close()
+        return status, processed
+
+    assert asyncio.run(main()) == (401, [])
+
+
+def test_full_backlog_gets_503():
+    async def main():
+        app, bot, processed, release = make_app(max_concurrent=2, max_pending=3)
+        handler = app["handler"]
+        async with TestClient(TestServer(app)) as client:
+            statuses = [(await post(client, update_id)).status for update_id in range(5)]
+            pending = handler.pending
+            release.set()
+            await handler.drain(timeout=1)
+            # Accepted again once the backlog is processed
+            statuses.append((await post(client, 5)).status)
+            await handler.drain(timeout=1)
+        await bot.session.close()
+        return statuses, pending, processed
+
+    statuses, pending, processed = asyncio.run(main())
+    assert statuses == [200, 200, 200, 503, 503, 200]
+    assert pending == 3
+    assert sorted(processed) == [0, 1, 2, 5]
@@ -15,6 +15,10 @@ class DbConfig:
     password: str
     user: str
     database: str
+    pool_min_size: int = 1
+    pool_max_size: int = 5
+    pool_timeout: int = 10
+    procedure_timeout: int = 1800
 
     @staticmethod
     def from_env(env: Env):
@@ -25,8 +29,14 @@ class DbConfig:
         password = env.str("DB_PASSWORD")
         user = env.str("DB_USER")
         database = env.str("DB_NAME")
+        pool_min_size = env.int("DB_POOL_MIN_SIZE", 1)
+        pool_max_size = env.int("DB_POOL_MAX_SIZE", 5)
+        pool_timeout = env.int("DB_POOL_TIMEOUT", 10)
+        procedure_timeout = env.int("DB_PROCEDURE_TIMEOUT", 1800)
         return DbConfig(
-            host=host, password=password, user=user, database=database
+            host=host, password=password, user=user, database=database,
+            pool_min_size=pool_min_size, pool_max_size=pool_max_size, pool_timeout=pool_timeout,
+            procedure_timeout=procedure_timeout
         )
 
 
@@ -38,6 +48,7 @@ class TgBot:
 
     token: str
     admin_ids: list[int]
+    admin_cache_ttl: int = 300
     # use_redis: bool
 
     @staticmethod
@@ -47,8 +58,9 @@ class TgBot:
         """
         token = env.str("BOT_TOKEN")
         admin_ids = env.list("ADMINS", subcast=int)
+        admin_cache_ttl = env.int("ADMIN_CACHE_TTL", 300)
         # use_redis = env.bool("USE_REDIS")
-        return TgBot(token=token, admin_ids=admin_ids)
+        return TgBot(token=token, admin_ids=admin_ids, admin_cache_ttl=admin_cache_ttl)
 
 
 @dataclass
@@ -63,6 +75,20 @@ class Checkers:
     services_check_enable: bool
     services_check_interval: int
     services_check_cooldown: int
+    services_snapshot_ttl: int = 15
+    journal_follow_enable: bool = False
+    services_watch_enable: bool = False
+    services_watch_interval: int = 15
+    alert_state_path: str = "alert_state.sqlite3"
+    units_path: str = "units.json"
+    units_refresh_interval: int = 300
+    kpi_check_days: int = 1
+    kpi_divisions: Optional[list[str]] = None
+    kpi_excluded_divisions: Optional[list[str]] = None
+    kpi_divisions_table: Optional[str] = None
+    services_action_timeout: int = 30
+    services_bulk_concurrency: int = 4
+    services_rolling_concurrency: int = 1
 
     @staticmethod
     def from_env(env: Env):
@@ -75,8 +101,145 @@ class Checkers:
         services_check_enable = env.bool("SERVICES_CHECK_ENABLE")
         services_check_interval = env.int("SERVICES_CHECK_INTERVAL")
         services_check_cooldown = env.int("SERVICES_CHECK_COOLDOWN")
+        services_snapshot_ttl = env.int("SERVICES_SNAPSHOT_TTL", 15)
+        journal_follow_enable = env.bool("JOURNAL_FOLLOW_ENABLE", False)
+        services_watch_enable = env.bool("SERVICES_WATCH_ENABLE", False)
+        services_watch_interval = env.int("SERVICES_WATCH_INTERVAL", 15)
+        alert_state_path = env.str("ALERT_STATE_PATH", "alert_state.sqlite3")
+        units_path = env.str("UNITS_PATH", "units.json")
+        units_refresh_interval = env.int("UNITS_REFRESH_INTERVAL", 300)
+        kpi_check_days = env.int("KPI_CHECK_DAYS", 1)
+        kpi_divisions = env.list("KPI_DIVISIONS", []) or None
+        kpi_excluded_divisions = env.list("KPI_EXCLUDED_DIVISIONS", None)
+        kpi_divisions_table = env.str("KPI_DIVISIONS_TABLE", None) or None
+        services_action_timeout = env.int("SERVICES_ACTION_TIMEOUT", 30)
+        services_bulk_concurrency = env.int("SERVICES_BULK_CONCURRENCY", 4)
+        services_rolling_concurrency = env.int("SERVICES_ROLLING_CONCURRENCY", 1)
+
+        return Checkers(kpi_check_enable, kpi_check_hour, services_check_enable, services_check_interval, services_check_cooldown,
+                        services_snapshot_ttl, journal_follow_enable, services_watch_enable, services_watch_interval,
+                        alert_state_path, units_path, units_refresh_interval, kpi_check_days, kpi_divisions,
+                        kpi_excluded_divisions, kpi_divisions_table, services_action_timeout,
+                        services_bulk_concurrency, services_rolling_concurrency)
+
+@dataclass
+class MetricsConfig:
+    """
+    Creates the MetricsConfig object from environment variables.
+    """
+
+    enable: bool
+    host: str
+    port: int
+
+    @staticmethod
+    def from_env(env: Env):
+        """
+        Creates the MetricsConfig object from environment variables.
+        """
+        enable = env.bool("METRICS_ENABLE", False)
+        host = env.str("METRICS_HOST", "127.0.0.1")
+        port = env.int("METRICS_PORT", 9108)
+
+        return MetricsConfig(enable=enable, host=host, port=port)
+
+
+@dataclass
+class AgentsConfig:
+    """
+    Creates the AgentsConfig object from environment variables.
+
+    agents holds `name=url` entries of checker agents on other hosts.
+    """
+
+    agents: list[str]
+    token: Optional[str]
+    timeout: int
+
+    @staticmethod
+    def from_env(env: Env):
+        """
+        Creates the AgentsConfig object from environment variables.
+        """
+        agents = env.list("AGENTS", [])
+        token = env.str("AGENT_TOKEN", None)
+        timeout = env.int("AGENT_TIMEOUT", 5)
+
+        return AgentsConfig(agents=agents, token=token, timeout=timeout)
+
+
+@dataclass
+class WebhookConfig:
+    """
+    Creates the WebhookConfig object from environment variables.
+
+    When enabled, updates are received on a webhook instead of long polling.
+    """
+
+    enable: bool
+    url: Optional[str]
+    path: str
+    host: str
+    port: int
+    secret: Optional[str]
+    max_concurrent_updates: int = 20
+    max_pending_updates: int = 200
+    shutdown_timeout: int = 30
+
+    @staticmethod
+    def from_env(env: Env):
+        """
+        Creates the WebhookConfig object from environment variables.
+        """
+        enable = env.bool("WEBHOOK_ENABLE", False)
+        url = env.str("WEBHOOK_URL", None) or None
+        path = env.str("WEBHOOK_PATH", "/webhook")
+        host = env.str("WEBHOOK_HOST", "127.0.0.1")
+        port = env.int("WEBHOOK_PORT", 8080)
+        secret = env.str("WEBHOOK_SECRET", None) or None
+        max_concurrent_updates = env.int("WEBHOOK_MAX_CONCURRENT_UPDATES", 20)
+        max_pending_updates = env.int("WEBHOOK_MAX_PENDING_UPDATES", 200)
+        shutdown_timeout = env.int("WEBHOOK_SHUTDOWN_TIMEOUT", 30)
+
+        return WebhookConfig(
+            enable=enable, url=url, path=path, host=host, port=port, secret=secret,
+            max_concurrent_updates=max_concurrent_updates, max_pending_updates=max_pending_updates,
+            shutdown_timeout=shutdown_timeout
+        )
+
+
+@dataclass
+class RemediationConfig:
+    """
+    Creates the RemediationConfig object from environment variables.
+
+    When enabled, failed units marked with "remediate" in the units file are restarted automatically.
+    """
+
+    enable: bool
+    max_attempts: int = 3
+    backoff: int = 10
+    max_backoff: int = 300
+    flap_window: int = 600
+    flap_threshold: int = 5
+
+    @staticmethod
+    def from_env(env: Env):
+        """
+        Creates the RemediationConfig object from environment variables.
+        """
+        enable = env.bool("REMEDIATION_ENABLE", False)
+        max_attempts = env.int("REMEDIATION_MAX_ATTEMPTS", 3)
+        backoff = env.int("REMEDIATION_BACKOFF", 10)
+        max_backoff = env.int("REMEDIATION_MAX_BACKOFF", 300)
+        flap_window = env.int("REMEDIATION_FLAP_WINDOW", 600)
+        flap_threshold = env.int("REMEDIATION_FLAP_THRESHOLD", 5)
+
+        return RemediationConfig(
+            enable=enable, max_attempts=max_attempts, backoff=backoff, max_backoff=max_backoff,
+            flap_window=flap_window, flap_threshold=flap_threshold
+        )
 
-        return Checkers(kpi_check_enable, kpi_check_hour, services_check_enable, services_check_interval, services_check_cooldown)
 
 @dataclass
 class RedisConfig:
@@ -154,6 +317,14 @@ class Config:
         Holds the settings specific to the database (default is None).
     redis : Optional[RedisConfig]
         Holds the settings specific to Redis (default is None).
+    metrics : Optional[MetricsConfig]
+        Holds the settings of the metrics endpoint (default is None).
+    agents : Optional[AgentsConfig]
+        Holds the checker agents on other hosts (default is None).
+    webhook : Optional[WebhookConfig]
+        Holds the webhook settings, long polling is used when disabled (default is None).
+    remediation : Optional[RemediationConfig]
+        Holds the automatic restart policy of failed units (default is None).
     """
 
     tg_bot: TgBot
@@ -161,6 +332,10 @@ class Config:
     misc: Miscellaneous
     db: Optional[DbConfig] = None
     redis: Optional[RedisConfig] = None
+    metrics: Optional[MetricsConfig] = None
+    agents: Optional[AgentsConfig] = None
+    webhook: Optional[WebhookConfig] = None
+    remediation: Optional[RemediationConfig] = None
 
 
 def load_config(path: str = None) -> Config:
@@ -181,4 +356,8 @@ def load_config(path: str = None) -> Config:
         db=DbConfig.from_env(env),
         checkers=Checkers.from_env(env),
         misc=Miscellaneous(),
+        metrics=MetricsConfig.from_env(env),
+        agents=AgentsConfig.from_env(env),
+        webhook=WebhookConfig.from_env(env),
+        remediation=RemediationConfig.from_env(env),
     )
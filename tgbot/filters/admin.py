@@ -2,11 +2,11 @@ from aiogram.filters import BaseFilter
 from aiogram.types import Message
 
 from tgbot.config import Config
-from tgbot.services.db import is_admin
+from tgbot.services.admins import admin_cache
 
 
 class AdminFilter(BaseFilter):
     is_admin: bool = True
 
     async def __call__(self, obj: Message, config: Config) -> bool:
-        return (is_admin(obj.from_user.id)) == self.is_admin
+        return (await admin_cache.is_admin(obj.from_user.id)) == self.is_admin
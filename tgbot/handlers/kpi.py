@@ -1,39 +1,79 @@
+import html
+
 from aiogram import Router, F
 from aiogram.types import CallbackQuery, InlineKeyboardMarkup, InlineKeyboardButton
 
 from tgbot.filters.admin import AdminFilter
-from tgbot.keyboards.inline import MainMenu, procedures_kb, ProceduresMenu, procedures_confirm_kb, ProceduresConfirmMenu
-from tgbot.services.db import run_procedure
+from tgbot.keyboards.inline import MainMenu, procedures_kb, ProceduresMenu, procedures_confirm_kb, ProceduresConfirmMenu, \
+    JobMenu, procedure_progress_kb, KpiMenu
+from tgbot.config import Config
+from tgbot.services.completeness import format_kpi_gaps, kpi_completeness
+from tgbot.services.editor import editor
+from tgbot.services.jobs import job_runner
 
 kpi_router = Router()
 kpi_router.message.filter(AdminFilter())
 
+PROCEDURES = {
+    "day": "UpdateKPIStatsDay",
+    "week": "UpdateKPIStatsWeek",
+    "month": "UpdateKPIStatsMonth",
+}
+
+# Map procedure codes to display names
+PROCEDURE_NAMES = {
+    "day": "обновление статистики за день",
+    "week": "обновление статистики за неделю",
+    "month": "обновление статистики за месяц"
+}
+
 
 @kpi_router.callback_query(MainMenu.filter(F.choice == "kpi"))
 async def kpi_check(callback: CallbackQuery):
     await callback.answer()
-    await callback.message.edit_text(
+    await editor.edit_callback(
+        callback,
         "📊 Выбери процедуру для запуска",
         reply_markup=procedures_kb()
     )
 
 
+@kpi_router.callback_query(KpiMenu.filter(F.action == "completeness"))
+async def kpi_completeness_check(callback: CallbackQuery, config: Config):
+    await callback.answer()
+
+    days = config.checkers.kpi_check_days
+    await editor.edit_callback(callback, f"🔄 Проверяю заполненность KPI за {days} дн...")
+
+    try:
+        missing = await kpi_completeness.check_last_days(days)
+        if missing:
+            text = format_kpi_gaps(missing)
+        else:
+            text = f"✅ Данные KPI всех отделов есть за последние {days} дн."
+    except Exception as e:
+        text = f"❌ Не удалось проверить KPI: {html.escape(str(e))}"
+
+    await editor.edit_callback(
+        callback,
+        text,
+        reply_markup=InlineKeyboardMarkup(inline_keyboard=[[
+            InlineKeyboardButton(text="🔙 К выбору процедур", callback_data=MainMenu(choice="kpi").pack())
+        ]]),
+        parse_mode="HTML"
+    )
+
+
 @kpi_router.callback_query(ProceduresMenu.filter())
 async def procedure_confirm(callback: CallbackQuery, callback_data: ProceduresMenu):
     await callback.answer()
 
     picked_variant = callback_data.procedure
 
-    # Map procedure codes to display names
-    procedure_names = {
-        "day": "обновление статистики за день",
-        "week": "обновление статистики за неделю",
-        "month": "обновление статистики за месяц"
-    }
-
-    procedure_name = procedure_names.get(picked_variant, "неизвестную процедуру")
+    procedure_name = PROCEDURE_NAMES.get(picked_variant, "неизвестную процедуру")
 
-    await callback.message.edit_text(
+    await editor.edit_callback(
+        callback,
         f"⚠️ <b>Подтверждение действия</b>\n\n"
         f"Ты уверен, что хочешь запустить процедуру:\n"
         f"<i>{procedure_name}</i>?\n\n"
@@ -48,42 +88,7 @@ async def procedure_execute(callback: CallbackQuery, callback_data: ProceduresCo
     await callback.answer()
 
     picked_variant = callback_data.procedure
-
-    # Show loading message
-    await callback.message.edit_text(
-        "⏳ <b>Выполняется процедура...</b>\n\n"
-        "Пожалуйста, подожди. Это может занять несколько минут."
-    )
-
-    try:
-        success, message = None, None
-
-        match picked_variant:
-            case "day":
-                success, message = await run_procedure("UpdateKPIStatsDay")
-            case "week":
-                success, message = await run_procedure("UpdateKPIStatsWeek")
-            case "month":
-                success, message = await run_procedure("UpdateKPIStatsMonth")
-            case _:
-                success, message = False, "Неизвестная процедура"
-
-        if success:
-            result_text = (
-                "✅ <b>Процедура выполнена успешно!</b>\n\n"
-                f"Результат: {message if message else 'Операция завершена'}"
-            )
-        else:
-            result_text = (
-                "❌ <b>Ошибка выполнения процедуры</b>\n\n"
-                f"Детали: {message if message else 'Неизвестная ошибка'}"
-            )
-
-    except Exception as e:
-        result_text = (
-            "❌ <b>Критическая ошибка</b>\n\n"
-            f"Не удалось выполнить процедуру: {str(e)}"
-        )
+    procedure = PROCEDURES.get(picked_variant)
 
     # Return to main KPI menu
     back_button = InlineKeyboardMarkup(inline_keyboard=[[
@@ -91,17 +96,51 @@ async def procedure_execute(callback: CallbackQuery, callback_data: ProceduresCo
                              callback_data=MainMenu(choice="kpi").pack())
     ]])
 
-    await callback.message.edit_text(
-        result_text,
-        reply_markup=back_button,
+    if procedure is None:
+        await editor.edit_callback(
+            callback,
+            "❌ <b>Ошибка выполнения процедуры</b>\n\nДетали: Неизвестная процедура",
+            reply_markup=back_button,
+            parse_mode="HTML"
+        )
+        return
+
+    # The procedure runs in the background, this message shows its progress
+    job, started = job_runner.submit(
+        callback.bot,
+        procedure,
+        PROCEDURE_NAMES[picked_variant],
+        callback.message.chat.id,
+        callback.message.message_id,
+        progress_markup=procedure_progress_kb(procedure),
+        done_markup=back_button,
+    )
+
+    text = job_runner.progress_text(job)
+    if not started:
+        text = "ℹ️ Процедура уже запущена, жду ее завершения.\n\n" + text
+
+    await editor.edit_callback(
+        callback,
+        text,
+        reply_markup=procedure_progress_kb(procedure),
         parse_mode="HTML"
     )
 
 
+@kpi_router.callback_query(JobMenu.filter(F.action == "stop"))
+async def procedure_stop(callback: CallbackQuery, callback_data: JobMenu):
+    if job_runner.cancel(callback_data.procedure):
+        await callback.answer("Процедура останавливается")
+    else:
+        await callback.answer("Процедура уже завершена")
+
+
 @kpi_router.callback_query(ProceduresConfirmMenu.filter(F.action == "cancel"))
 async def procedure_cancel(callback: CallbackQuery):
     await callback.answer()
-    await callback.message.edit_text(
+    await editor.edit_callback(
+        callback,
         "📊 Выбери процедуру для запуска",
         reply_markup=procedures_kb()
     )
\ No newline at end of file
@@ -1,88 +1,255 @@
 import asyncio
+import html
+import math
+from typing import Dict, List, Optional, Tuple
 
 from aiogram import Router, F
-from aiogram.filters import CommandStart
+from aiogram.exceptions import TelegramRetryAfter
+from aiogram.filters import Command, CommandStart
 from aiogram.types import Message, CallbackQuery, InlineKeyboardMarkup, InlineKeyboardButton
 
 from tgbot.filters.admin import AdminFilter
-from tgbot.keyboards.inline import main_kb, MainMenu, ServiceMenu, services_status_kb, service_detail_kb, BackMenu
-from tgbot.services.checker import ServiceChecker, SERVICES_CONFIG, checker
+from tgbot.keyboards.inline import main_kb, MainMenu, ServiceMenu, StatusMenu, services_status_kb, service_detail_kb, \
+    status_groups_kb, BackMenu, STATUS_PAGE_SIZE, BulkMenu, bulk_confirm_kb, bulk_done_kb
+from tgbot.services.actions import BulkAction, service_actions
+from tgbot.services.admins import admin_cache
+from tgbot.services.aggregator import aggregator
+from tgbot.services.checker import checker, snapshot
+from tgbot.services.discovery import discovery
+from tgbot.services.editor import editor
 
 status_router = Router()
 status_router.message.filter(AdminFilter())
 
+# Telegram message length limit
+MESSAGE_LIMIT = 4096
+
+# Min seconds between two live edits of a bulk action message
+BULK_PROGRESS_INTERVAL = 1
+
+
+def status_line(result: dict, display_name: str) -> str:
+    """Format one service line of the status list, `display_name` is escaped here"""
+    display_name = html.escape(display_name)
+    if result is None:
+        return f"⏳ <b>{display_name}</b> - нет данных\n"
+
+    if result.get('active'):
+        status_emoji = "✅"
+        status_text = "работает"
+    elif result.get('error'):
+        status_emoji = "⚠️"
+        status_text = "ошибка"
+    else:
+        status_emoji = "❌"
+        status_text = "остановлен"
+
+    return f"{status_emoji} <b>{display_name}</b> - {status_text}\n"
+
+
+def is_failing(result: dict) -> bool:
+    return result is not None and (not result.get('active') or result.get('error') is not None)
+
+
+def fit_lines(lines: List[str], budget: int) -> str:
+    """Join as many lines as fit into `budget` characters and note how many were left out"""
+    text = ""
+    for i, line in enumerate(lines):
+        # Leave room for the note about the rest
+        if len(text) + len(line) > budget - 30:
+            return text + f"… и ещё {len(lines) - i}\n"
+        text += line
+    return text
+
+
+def group_name(index: int) -> Optional[str]:
+    """Group of a menu index, None for all groups or an index out of range"""
+    return discovery.group_names[index] if 0 <= index < len(discovery.group_names) else None
+
+
+def needs_placeholder(services: List[str] = None) -> bool:
+    """Whether a view has to probe before it can be shown, so a loading message is worth an edit"""
+    return bool(aggregator.agents) or not snapshot.is_fresh(services)
+
+
+def status_entries(services: List[str], results: Dict[str, dict], remote_hosts: List[Dict]) -> List[Tuple]:
+    """
+    Rows of the status list as (host, service, result, display name), host is None for this server.
+
+    An unreachable agent is one row with the error as its result and no service.
+    """
+    entries = [(None, service, results.get(service), discovery.display_name(service)) for service in services]
+    for host in remote_hosts:
+        if host['error']:
+            entries.append((host['host'], None, {'error': host['error']}, host['host']))
+            continue
+        for result in host['services']:
+            display_name = host['display_names'].get(result['service'], result['service'])
+            entries.append((host['host'], result['service'], result, display_name))
+    return entries
+
+
+def entry_line(entry: Tuple) -> str:
+    host, service, result, display_name = entry
+    if service is None:
+        return f"⚠️ Агент недоступен: {html.escape(str(result['error']))}\n"
+    return status_line(result, display_name)
+
+
+async def show_status_page(callback: CallbackQuery, menu: StatusMenu, probe: bool, notice: str = ""):
+    """Show one page of the status list, probing stale services only if `probe` is set"""
+    services = discovery.units
+    if probe:
+        # Local services and agents on other hosts are checked concurrently
+        local, remote_hosts = await asyncio.gather(snapshot.get(), aggregator.poll())
+        results = {result['service']: result for result in local}
+    else:
+        # Page flips and filters are rendered from the snapshot without probes
+        results = {service: snapshot.peek(service) for service in services}
+        remote_hosts = aggregator.last
+        if not any(results.values()):
+            results = {result['service']: result for result in await snapshot.get()}
+
+    group = group_name(menu.group)
+    in_group = [service for service in services if group is None or discovery.groups.get(service) == group]
+    group_failing = sum(1 for service in in_group if is_failing(results.get(service)))
+
+    # Groups are local, other hosts are listed after this server only without a group
+    entries = status_entries(in_group, results, remote_hosts if group is None else [])
+    selected = [entry for entry in entries if not menu.failed or is_failing(entry[2])]
+
+    pages = max(math.ceil(len(selected) / STATUS_PAGE_SIZE), 1)
+    menu = StatusMenu(action="page", page=min(max(menu.page, 0), pages - 1), failed=menu.failed,
+                      group=menu.group if group else -1)
+    page_entries = selected[menu.page * STATUS_PAGE_SIZE:(menu.page + 1) * STATUS_PAGE_SIZE]
+    # Control is local only
+    page_services = [service for host, service, _, _ in page_entries if host is None]
+
+    # Create status message
+    header = notice + "🩹 <b>Статусы ботов</b>"
+    if group:
+        header += f" · {group}"
+    if menu.failed:
+        header += " · проблемные"
+    failing = sum(1 for entry in entries if is_failing(entry[2]))
+    header += f"\n✅ {len(entries) - failing}  ❌ {failing}"
+    if pages > 1:
+        header += f"  ·  стр. {menu.page + 1}/{pages}"
+    header += "\n\n"
+
+    lines = []
+    shown_host = ""
+    for entry in page_entries:
+        host = entry[0]
+        # Services are grouped by host when there are other hosts
+        if remote_hosts and group is None and host != shown_host:
+            if lines:
+                lines.append("\n")
+            lines.append(f"🖥 <b>{html.escape(host) if host else 'Этот сервер'}</b>\n")
+            shown_host = host
+        lines.append(entry_line(entry))
+    if not page_entries:
+        lines.append("🎉 Проблемных сервисов нет\n" if menu.failed else "Сервисы не найдены\n")
+
+    footer = "\n👇 Выберите сервис для управления:"
+    message = header + fit_lines(lines, MESSAGE_LIMIT - len(header) - len(footer)) + footer
+
+    await editor.edit_callback(callback, message, services_status_kb(page_services, results, menu, pages, group_failing))
+
 
 @status_router.message(CommandStart())
 async def admin_start(message: Message):
     await message.reply("Привет! Панель управления ботами.", reply_markup=main_kb())
 
 
+@status_router.message(Command("reload_admins"))
+async def reload_admins(message: Message):
+    """Apply role changes made in the DB without waiting for the cache to expire"""
+    if await admin_cache.reload():
+        await message.reply("✅ Список администраторов обновлен")
+    else:
+        await message.reply("⚠️ Не удалось загрузить администраторов из БД, используется прежний список")
+
+
 @status_router.callback_query(MainMenu.filter(F.choice == "status"))
 async def bots_check(callback: CallbackQuery):
     await callback.answer()
 
-    # Show loading message
-    await callback.message.edit_text("🔄 Проверяю статус сервисов...")
+    async def render():
+        if needs_placeholder():
+            await editor.edit_callback(callback, "🔄 Проверяю статус сервисов...")
+        await show_status_page(callback, StatusMenu(action="page"), probe=True)
 
-    service_checker = ServiceChecker(SERVICES_CONFIG)
-    results = service_checker.check_all_services()
+    await editor.run(callback, render)
 
-    # Create status message
-    message = "🩹 <b>Статусы ботов:</b>\n\n"
-    for result in results:
-        service_name = result['service']
-        if service_name in SERVICES_CONFIG:
-            display_name = SERVICES_CONFIG[service_name]['display_name']
 
-            if result.get('active'):
-                status_emoji = "✅"
-                status_text = "работает"
-            elif result.get('error'):
-                status_emoji = "⚠️"
-                status_text = "ошибка"
-            else:
-                status_emoji = "❌"
-                status_text = "остановлен"
+@status_router.callback_query(StatusMenu.filter(F.action == "refresh"))
+async def status_refresh(callback: CallbackQuery, callback_data: StatusMenu):
+    await callback.answer()
+    await editor.run(callback, lambda: show_status_page(callback, callback_data, probe=True))
+
+
+@status_router.callback_query(StatusMenu.filter(F.action == "page"))
+async def status_page(callback: CallbackQuery, callback_data: StatusMenu):
+    await callback.answer()
+    await editor.run(callback, lambda: show_status_page(callback, callback_data, probe=False))
+
+
+@status_router.callback_query(StatusMenu.filter(F.action == "groups"))
+async def status_groups(callback: CallbackQuery, callback_data: StatusMenu):
+    await callback.answer()
+    await editor.run(callback, lambda: editor.edit_callback(
+        callback, "🗂 <b>Выберите группу сервисов:</b>", status_groups_kb(callback_data)
+    ))
+
 
-            message += f"{status_emoji} <b>{display_name}</b> - {status_text}\n"
+async def show_units_changed(callback: CallbackQuery):
+    await show_status_page(callback, StatusMenu(action="page"), probe=False,
+                           notice="⚠️ Список сервисов изменился, выберите сервис заново.\n\n")
 
-    message += "\n👇 Выберите сервис для управления:"
 
-    await callback.message.edit_text(
-        message,
-        reply_markup=services_status_kb(results),
-        parse_mode="HTML"
-    )
+async def resolve_service(callback: CallbackQuery, callback_data: ServiceMenu):
+    """Get the unit of a service button, or show the list again if the unit list has changed"""
+    service_name = discovery.unit_at(callback_data.index, callback_data.version)
+    if service_name is None:
+        await show_units_changed(callback)
+    return service_name
 
 
 @status_router.callback_query(ServiceMenu.filter(F.action == "view"))
 async def service_detail(callback: CallbackQuery, callback_data: ServiceMenu):
     await callback.answer()
+    await editor.run(callback, lambda: show_service_detail(callback, callback_data))
+
 
-    service_name = callback_data.service_name
+async def show_service_detail(callback: CallbackQuery, callback_data: ServiceMenu):
+    service_name = await resolve_service(callback, callback_data)
+    if service_name is None:
+        return
 
     # Show loading message
-    await callback.message.edit_text("🔄 Загружаю детали сервиса...")
+    if needs_placeholder([service_name]):
+        await editor.edit_callback(callback, "🔄 Загружаю детали сервиса...")
 
     # Get service status for specific service
-    service_checker = ServiceChecker([service_name])
-    results = service_checker.check_all_services()
+    results = await snapshot.get([service_name])
 
     if results:
         result = results[0]
-        message = service_checker.format_service_message(service_name, result)
         keyboard = service_detail_kb(service_name, result)
+        if keyboard is None:
+            # Removed by a discovery refresh while it was probed
+            await show_units_changed(callback)
+            return
+        message = checker.format_service_message(service_name, result)
 
-        await callback.message.edit_text(
-            message,
-            reply_markup=keyboard,
-            parse_mode="HTML"
-        )
+        await editor.edit_callback(callback, message, reply_markup=keyboard)
     else:
-        await callback.message.edit_text(
+        await editor.edit_callback(
+            callback,
             "❌ Ошибка получения статуса сервиса",
             reply_markup=InlineKeyboardMarkup(inline_keyboard=[[
-                InlineKeyboardButton(text="🔙 Назад", callback_data=MainMenu(choice="status").pack())
+                InlineKeyboardButton(text="🔙 Назад", callback_data=StatusMenu(action="page").pack())
             ]])
         )
 
@@ -91,7 +258,9 @@ async def service_detail(callback: CallbackQuery, callback_data: ServiceMenu):
 async def service_control(callback: CallbackQuery, callback_data: ServiceMenu):
     await callback.answer()
 
-    service_name = callback_data.service_name
+    service_name = await resolve_service(callback, callback_data)
+    if service_name is None:
+        return
     action = callback_data.action
 
     # Action descriptions
@@ -102,49 +271,166 @@ async def service_control(callback: CallbackQuery, callback_data: ServiceMenu):
     }
 
     action_name = action_names.get(action, action)
-    display_name = SERVICES_CONFIG.get(service_name, {}).get('display_name', service_name)
+    display_name = discovery.display_name(service_name)
 
     # Show loading message
-    await callback.message.edit_text(f"🔄 Выполняю {action_name} сервиса {display_name}...")
+    await editor.edit_callback(callback, f"🔄 Выполняю {action_name} сервиса {display_name}...")
 
-    # Execute command
-    success, command_message = await checker.execute_service_command(service_name, action)
+    # Execute command and wait until the unit reaches the target state
+    outcome = await service_actions.apply(service_name, action)
 
-    if success:
+    if outcome.ok:
         result_message = f"✅ {action_name.capitalize()} сервиса {display_name} выполнен успешно!"
     else:
-        result_message = f"❌ Ошибка при выполнении {action_name} сервиса {display_name}:\n{command_message}"
-
-    # Return to service detail view
-    await asyncio.sleep(2)  # Give time for service to change state
+        result_message = (f"❌ Ошибка при выполнении {action_name} сервиса {display_name}:\n"
+                          f"{html.escape(outcome.message)}")
 
     # Get updated service status
-    service_checker = ServiceChecker([service_name])
-    results = service_checker.check_all_services()
+    results = await snapshot.get([service_name])
 
     if results:
         result = results[0]
+        keyboard = service_detail_kb(service_name, result)
+        if keyboard is None:
+            # Removed by a discovery refresh while the action was running
+            await show_units_changed(callback)
+            return
         updated_message = checker.format_service_message(service_name, result)
         updated_message = f"{result_message}\n\n{updated_message}"
-        keyboard = service_detail_kb(service_name, result)
 
-        await callback.message.edit_text(
-            updated_message,
-            reply_markup=keyboard,
-            parse_mode="HTML"
-        )
+        await editor.edit_callback(callback, updated_message, reply_markup=keyboard)
     else:
-        await callback.message.edit_text(
+        await editor.edit_callback(
+            callback,
             result_message,
             reply_markup=InlineKeyboardMarkup(inline_keyboard=[[
-                InlineKeyboardButton(text="🔙 Назад", callback_data=MainMenu(choice="status").pack())
+                InlineKeyboardButton(text="🔙 Назад", callback_data=StatusMenu(action="page").pack())
             ]])
         )
 
 
+def bulk_title(menu: BulkMenu) -> str:
+    group = group_name(menu.group)
+    if menu.action == "rolling":
+        return f"🔄 <b>Поочередный перезапуск группы {group}</b>"
+    return "🔁 <b>Перезапуск проблемных сервисов</b>" + (f" · {group}" if group else "")
+
+
+def bulk_targets(menu: BulkMenu, results: Dict[str, dict]) -> List[str]:
+    """Units a bulk action applies to: failed units of the group or the whole group"""
+    group = group_name(menu.group)
+    services = [service for service in discovery.units if group is None or discovery.groups.get(service) == group]
+    if menu.action == "failed":
+        services = [service for service in services if is_failing(results.get(service))]
+    return services
+
+
+def bulk_line(bulk: BulkAction, service_name: str) -> str:
+    """Format the progress line of one unit of a bulk action"""
+    display_name = discovery.display_name(service_name)
+    result = bulk.results.get(service_name)
+    if result is not None:
+        if result.ok:
+            return f"✅ <b>{display_name}</b> - {result.state} ({result.duration:.1f} с)\n"
+        return f"❌ <b>{display_name}</b> - {html.escape(result.message)}\n"
+    if service_name in bulk.running:
+        return f"🔄 <b>{display_name}</b> - выполняется\n"
+    if service_name in bulk.skipped:
+        return f"⏭ <b>{display_name}</b> - пропущен\n"
+    return f"⏳ <b>{display_name}</b> - в очереди\n"
+
+
+def bulk_message(bulk: BulkAction, title: str) -> str:
+    """Progress of a bulk action: failed and running units first, then queued and done ones"""
+    header = f"{title}\nГотово {bulk.done}/{len(bulk.services)}  ❌ {bulk.failed}\n\n"
+
+    def order(service_name: str) -> int:
+        result = bulk.results.get(service_name)
+        if result is not None:
+            return 3 if result.ok else 0
+        if service_name in bulk.running:
+            return 1
+        return 2
+
+    footer = ""
+    if bulk.finished:
+        footer = f"\n⏱ Завершено за {bulk.elapsed:.1f} с"
+        if bulk.skipped:
+            footer += "\n⚠️ Перезапуск остановлен после ошибки, оставшиеся сервисы пропущены."
+
+    lines = [bulk_line(bulk, service) for service in sorted(bulk.services, key=order)]
+    return header + fit_lines(lines, MESSAGE_LIMIT - len(header) - len(footer)) + footer
+
+
+async def follow_bulk(callback: CallbackQuery, bulk: BulkAction, title: str, group: int):
+    """Edit the message as units finish until the bulk action is done"""
+    while True:
+        finished = bulk.task.done()
+        try:
+            await editor.edit_callback(callback, bulk_message(bulk, title), bulk_done_kb(group) if finished else None)
+        except TelegramRetryAfter as e:
+            await asyncio.sleep(e.retry_after)
+            continue
+        if finished:
+            return
+        await asyncio.wait({bulk.task}, timeout=BULK_PROGRESS_INTERVAL)
+
+
+@status_router.callback_query(BulkMenu.filter())
+async def bulk_action(callback: CallbackQuery, callback_data: BulkMenu):
+    # Group indexes of an old unit list may point to another group
+    if callback_data.version != discovery.version or (
+            callback_data.action == "rolling" and group_name(callback_data.group) is None):
+        await callback.answer()
+        await show_status_page(callback, StatusMenu(action="page"), probe=False,
+                               notice="⚠️ Список сервисов изменился, выберите действие заново.\n\n")
+        return
+
+    if service_actions.current is not None and not service_actions.current.finished:
+        await callback.answer("⏳ Уже выполняется массовый перезапуск, дождитесь его завершения", show_alert=True)
+        return
+    await callback.answer()
+
+    title = bulk_title(callback_data)
+    if not callback_data.confirmed:
+        await editor.run(callback, lambda: show_bulk_confirm(callback, callback_data, title))
+        return
+
+    # Failed units are taken from a fresh probe, the ones recovered since the confirmation are left alone
+    results = {result['service']: result for result in await snapshot.get()}
+    services = bulk_targets(callback_data, results)
+    if not services:
+        await editor.edit_callback(callback, f"{title}\n\n🎉 Проблемных сервисов нет", bulk_done_kb(callback_data.group))
+        return
+
+    bulk = service_actions.start_bulk(services, "restart", rolling=callback_data.action == "rolling")
+    if bulk is None:
+        return
+    await editor.run(callback, lambda: follow_bulk(callback, bulk, title, callback_data.group))
+
+
+async def show_bulk_confirm(callback: CallbackQuery, menu: BulkMenu, title: str):
+    if needs_placeholder():
+        await editor.edit_callback(callback, "🔄 Проверяю статус сервисов...")
+    results = {result['service']: result for result in await snapshot.get()}
+    services = bulk_targets(menu, results)
+    if not services:
+        await editor.edit_callback(callback, f"{title}\n\n🎉 Проблемных сервисов нет", bulk_done_kb(menu.group))
+        return
+
+    if menu.action == "rolling":
+        header = (f"{title}\n\nСервисы перезапускаются по {service_actions.rolling_concurrency}, "
+                  f"при первой ошибке перезапуск останавливается. Будут перезапущены:\n\n")
+    else:
+        header = (f"{title}\n\nОдновременно перезапускается не больше {service_actions.bulk_concurrency} "
+                  f"сервисов. Будут перезапущены:\n\n")
+    lines = [status_line(results.get(service), discovery.display_name(service)) for service in services]
+    await editor.edit_callback(callback, header + fit_lines(lines, MESSAGE_LIMIT - len(header)), bulk_confirm_kb(menu))
+
+
 @status_router.callback_query(BackMenu.filter(F.to == "main"))
 async def back_to_main(callback: CallbackQuery):
     await callback.answer()
-    await callback.message.edit_text("Панель управления ботами.", reply_markup=main_kb())
+    await editor.edit_callback(callback, "Панель управления ботами.", reply_markup=main_kb())
 
 
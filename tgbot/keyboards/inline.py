@@ -1,8 +1,13 @@
+from typing import Dict, List, Optional, Tuple
+
 from aiogram.filters.callback_data import CallbackData
 from aiogram.types import InlineKeyboardButton, InlineKeyboardMarkup
 from aiogram.utils.keyboard import InlineKeyboardBuilder
 
-from tgbot.services.checker import SERVICES_CONFIG
+from tgbot.services.discovery import discovery
+
+# Service buttons per status page, Telegram allows at most 100 buttons per keyboard
+STATUS_PAGE_SIZE = 20
 
 
 class MainMenu(CallbackData, prefix='main'):
@@ -10,19 +15,52 @@ class MainMenu(CallbackData, prefix='main'):
 
 
 class ServiceMenu(CallbackData, prefix='service'):
-    service_name: str
+    # Unit position in discovery.units and the unit list version, unit names may not fit in 64 bytes
+    index: int
+    version: str
     action: str  # 'view', 'start', 'stop', 'restart'
 
+    @staticmethod
+    def of(service_name: str, action: str) -> Optional["ServiceMenu"]:
+        """Callback data of a unit button, None if a discovery refresh has removed the unit"""
+        index = discovery.indexes.get(service_name)
+        if index is None:
+            return None
+        return ServiceMenu(index=index, version=discovery.version, action=action)
+
+
+class StatusMenu(CallbackData, prefix='status'):
+    action: str  # 'page', 'refresh', 'groups'
+    page: int = 0
+    failed: bool = False
+    group: int = -1  # index in discovery.group_names, -1 - all groups
+
+
+class BulkMenu(CallbackData, prefix='bulk'):
+    action: str  # 'failed' - restart failed units, 'rolling' - rolling restart of a group
+    group: int = -1  # index in discovery.group_names, -1 - all groups
+    version: str = ""  # unit list version the group index belongs to
+    confirmed: bool = False
+
 
 class ProceduresMenu(CallbackData, prefix='procedure'):
     procedure: str
 
 
+class KpiMenu(CallbackData, prefix='kpi'):
+    action: str  # 'completeness'
+
+
 class ProceduresConfirmMenu(CallbackData, prefix='proc_confirm'):
     procedure: str
     action: str  # 'confirm', 'cancel'
 
 
+class JobMenu(CallbackData, prefix='job'):
+    procedure: str
+    action: str  # 'stop'
+
+
 class BackMenu(CallbackData, prefix='back'):
     to: str
 
@@ -42,45 +80,143 @@ def main_kb():
     return keyboard
 
 
-def services_status_kb(results):
-    """Create keyboard with service statuses"""
-    builder = InlineKeyboardBuilder()
+def status_emoji(result) -> str:
+    if result is None:
+        return "⏳"
+    if result.get('active'):
+        return "✅"
+    if result.get('error'):
+        return "⚠️"
+    return "❌"
+
 
-    # Add service status buttons
-    for result in results:
-        service_name = result['service']
-        if service_name in SERVICES_CONFIG:
-            # Determine status emoji
-            if result.get('active'):
-                status_emoji = "✅"
-            elif result.get('error'):
-                status_emoji = "⚠️"
-            else:
-                status_emoji = "❌"
+# Packed service buttons by (unit, emoji) for the unit list version in _buttons_version
+_service_buttons: Dict[Tuple[str, str], InlineKeyboardButton] = {}
+_buttons_version = None
 
-            display_name = SERVICES_CONFIG[service_name]['display_name']
-            button_text = f"{status_emoji} {display_name}"
 
-            builder.button(
-                text=button_text,
-                callback_data=ServiceMenu(service_name=service_name, action="view").pack()
-            )
+def service_button(service_name: str, emoji: str) -> InlineKeyboardButton:
+    """Get the view button of a service, packing its callback data only once per unit list version"""
+    global _buttons_version
+    if _buttons_version != discovery.version:
+        _service_buttons.clear()
+        _buttons_version = discovery.version
 
-    # Count service buttons to determine layout
-    service_count = len([r for r in results if r['service'] in SERVICES_CONFIG])
+    key = (service_name, emoji)
+    button = _service_buttons.get(key)
+    if button is None:
+        button = _service_buttons[key] = InlineKeyboardButton(
+            text=f"{emoji} {discovery.display_name(service_name)}",
+            callback_data=ServiceMenu.of(service_name, "view").pack(),
+        )
+    return button
+
+
+def services_status_kb(page_services: List[str], results: Dict[str, dict], menu: StatusMenu, pages: int,
+                       failing: int = 0):
+    """Create keyboard with the service statuses of one page, `failing` - failed units of the shown group"""
+    rows = []
+
+    # Service buttons, two per row
+    buttons = [service_button(service, status_emoji(results.get(service))) for service in page_services]
+    for i in range(0, len(buttons), 2):
+        rows.append(buttons[i:i + 2])
+
+    # Page navigation
+    if pages > 1:
+        navigation = []
+        if menu.page > 0:
+            navigation.append(InlineKeyboardButton(
+                text="◀️", callback_data=StatusMenu(action="page", page=menu.page - 1, failed=menu.failed,
+                                                    group=menu.group).pack()))
+        navigation.append(InlineKeyboardButton(
+            text=f"{menu.page + 1}/{pages}", callback_data=StatusMenu(action="page", page=menu.page,
+                                                                     failed=menu.failed, group=menu.group).pack()))
+        if menu.page < pages - 1:
+            navigation.append(InlineKeyboardButton(
+                text="▶️", callback_data=StatusMenu(action="page", page=menu.page + 1, failed=menu.failed,
+                                                    group=menu.group).pack()))
+        rows.append(navigation)
+
+    # Filters
+    filters = [InlineKeyboardButton(
+        text="📋 Все" if menu.failed else "❌ Проблемные",
+        callback_data=StatusMenu(action="page", failed=not menu.failed, group=menu.group).pack(),
+    )]
+    if discovery.group_names:
+        filters.append(InlineKeyboardButton(
+            text="🗂 Группы", callback_data=StatusMenu(action="groups", failed=menu.failed, group=menu.group).pack()))
+    rows.append(filters)
+
+    # Bulk actions on the shown group
+    actions = []
+    if failing:
+        actions.append(InlineKeyboardButton(text=f"🔁 Перезапустить проблемные ({failing})", callback_data=BulkMenu(
+            action="failed", group=menu.group, version=discovery.version).pack()))
+    if menu.group >= 0:
+        actions.append(InlineKeyboardButton(text="🔄 Перезапустить группу", callback_data=BulkMenu(
+            action="rolling", group=menu.group, version=discovery.version).pack()))
+    if actions:
+        rows.append(actions)
+
+    # Refresh and back buttons
+    rows.append([
+        InlineKeyboardButton(text="♻️ Обновить", callback_data=StatusMenu(
+            action="refresh", page=menu.page, failed=menu.failed, group=menu.group).pack()),
+        InlineKeyboardButton(text="🔙 Назад", callback_data=BackMenu(to="main").pack()),
+    ])
+
+    return InlineKeyboardMarkup(inline_keyboard=rows)
+
+
+def status_groups_kb(menu: StatusMenu):
+    """Create keyboard to choose the group shown in the status list"""
+    builder = InlineKeyboardBuilder()
 
-    # Add refresh and back buttons
-    builder.button(text="♻️ Обновить", callback_data=MainMenu(choice="status").pack())
-    builder.button(text="🔙 Назад", callback_data=BackMenu(to="main").pack())
+    builder.button(text=("• " if menu.group == -1 else "") + "📋 Все группы",
+                   callback_data=StatusMenu(action="page", failed=menu.failed).pack())
+    for i, group in enumerate(discovery.group_names):
+        builder.button(text=("• " if menu.group == i else "") + group,
+                       callback_data=StatusMenu(action="page", failed=menu.failed, group=i).pack())
 
-    # Adjust layout: 2 buttons per row for services, then 2 buttons in last row for refresh/back
-    builder.adjust(2, 2)  # Puts services in rows of 2, and last row with refresh/back buttons
+    builder.button(text="🔙 К списку", callback_data=StatusMenu(
+        action="page", page=menu.page, failed=menu.failed, group=menu.group).pack())
+    builder.adjust(1, 2)
 
     return builder.as_markup()
 
 
+def bulk_confirm_kb(menu: BulkMenu):
+    """Create confirmation keyboard for a bulk action"""
+    buttons = [
+        [
+            InlineKeyboardButton(text="✅ Перезапустить", callback_data=BulkMenu(
+                action=menu.action, group=menu.group, version=menu.version, confirmed=True).pack()),
+        ],
+        [
+            InlineKeyboardButton(text="🔙 К списку", callback_data=StatusMenu(action="page", group=menu.group).pack()),
+        ],
+    ]
+
+    return InlineKeyboardMarkup(inline_keyboard=buttons)
+
+
+def bulk_done_kb(group: int):
+    """Create keyboard shown when a bulk action has finished"""
+    buttons = [
+        [
+            InlineKeyboardButton(text="♻️ К списку", callback_data=StatusMenu(action="refresh", group=group).pack()),
+        ],
+    ]
+
+    return InlineKeyboardMarkup(inline_keyboard=buttons)
+
+
 def service_detail_kb(service_name, service_status):
-    """Create keyboard for individual service management"""
+    """Create keyboard for individual service management, None if the unit is no longer monitored"""
+    if service_name not in discovery.indexes:
+        return None
+
     builder = InlineKeyboardBuilder()
 
     is_active = service_status.get('active', False)
@@ -90,31 +226,32 @@ def service_detail_kb(service_name, service_status):
         # Service is running - show restart and stop
         builder.button(
             text="🔄 Перезапуск",
-            callback_data=ServiceMenu(service_name=service_name, action="restart").pack()
+            callback_data=ServiceMenu.of(service_name, "restart").pack()
         )
         builder.button(
             text="⏹️ Остановить",
-            callback_data=ServiceMenu(service_name=service_name, action="stop").pack()
+            callback_data=ServiceMenu.of(service_name, "stop").pack()
         )
     elif has_error:
         # Service has error - show restart and stop
         builder.button(
             text="🔄 Перезапуск",
-            callback_data=ServiceMenu(service_name=service_name, action="restart").pack()
+            callback_data=ServiceMenu.of(service_name, "restart").pack()
         )
         builder.button(
             text="⏹️ Остановить",
-            callback_data=ServiceMenu(service_name=service_name, action="stop").pack()
+            callback_data=ServiceMenu.of(service_name, "stop").pack()
         )
     else:
         # Service is stopped - show start
         builder.button(
             text="▶️ Запустить",
-            callback_data=ServiceMenu(service_name=service_name, action="start").pack()
+            callback_data=ServiceMenu.of(service_name, "start").pack()
         )
 
-    # Add back button
-    builder.button(text="🔙 К списку", callback_data=MainMenu(choice="status").pack())
+    # Back to the page of the full list with this service
+    page = discovery.indexes.get(service_name, 0) // STATUS_PAGE_SIZE
+    builder.button(text="🔙 К списку", callback_data=StatusMenu(action="page", page=page).pack())
     builder.adjust(2, 1)  # Two buttons in first row, one in second
 
     return builder.as_markup()
@@ -131,6 +268,10 @@ def procedures_kb():
             InlineKeyboardButton(text="🗓️ Месяц",
                                  callback_data=ProceduresMenu(procedure="month").pack()),
         ],
+        [
+            InlineKeyboardButton(text="🔎 Проверить заполненность",
+                                 callback_data=KpiMenu(action="completeness").pack()),
+        ],
         [
             InlineKeyboardButton(text="🔙 Назад", callback_data=BackMenu(to="main").pack()),
         ],
@@ -158,4 +299,19 @@ def procedures_confirm_kb(procedure: str):
     ]
 
     keyboard = InlineKeyboardMarkup(inline_keyboard=buttons)
-    return keyboard
\ No newline at end of file
+    return keyboard
+
+def procedure_progress_kb(procedure: str):
+    """Create keyboard for a running procedure"""
+    buttons = [
+        [
+            InlineKeyboardButton(text="⏹️ Остановить",
+                                 callback_data=JobMenu(procedure=procedure, action="stop").pack()),
+        ],
+        [
+            InlineKeyboardButton(text="🔙 К выбору процедур", callback_data=MainMenu(choice="kpi").pack()),
+        ],
+    ]
+
+    keyboard = InlineKeyboardMarkup(inline_keyboard=buttons)
+    return keyboard
@@ -0,0 +1,66 @@
+import logging
+import time
+from typing import Callable, Dict, Any, Awaitable
+
+from aiogram import BaseMiddleware
+from aiogram.types import TelegramObject, Update
+
+from tgbot.services.logs import update_id_var, handler_var
+
+# Updates handled slower than this are logged as warnings, without sampling
+SLOW_UPDATE_SECONDS = 1.0
+
+logger = logging.getLogger("tgbot.updates")
+
+
+class LogContextMiddleware(BaseMiddleware):
+    """
+    Outer update middleware: sets the update id for every record logged
+    while the update is handled and logs its duration. Successful updates
+    are sampled, slow and failed ones are always logged.
+    """
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: Update,
+        data: Dict[str, Any],
+    ) -> Any:
+        update_token = update_id_var.set(event.update_id)
+        handler_token = handler_var.set(None)
+        started = time.perf_counter()
+        try:
+            result = await handler(event, data)
+        except Exception:
+            # The traceback is logged by aiogram
+            logger.error("Update failed", extra={"duration_ms": self._elapsed(started)})
+            raise
+        else:
+            duration = time.perf_counter() - started
+            if duration > SLOW_UPDATE_SECONDS:
+                logger.warning("Slow update", extra={"duration_ms": self._elapsed(started)})
+            else:
+                logger.info("Update handled", extra={"duration_ms": self._elapsed(started), "sample": "update"})
+            return result
+        finally:
+            update_id_var.reset(update_token)
+            handler_var.reset(handler_token)
+
+    @staticmethod
+    def _elapsed(started: float) -> float:
+        return round((time.perf_counter() - started) * 1000, 1)
+
+
+class HandlerNameMiddleware(BaseMiddleware):
+    """Inner middleware: records the name of the handler chosen for the event."""
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any],
+    ) -> Any:
+        handler_object = data.get("handler")
+        if handler_object is not None:
+            handler_var.set(handler_object.callback.__name__)
+        return await handler(event, data)
@@ -0,0 +1,134 @@
+import asyncio
+import logging
+import time
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional
+
+from tgbot.services.checker import ACTION_TARGET_STATES, ServiceChecker, StatusSnapshot, checker, snapshot
+
+# Seconds to wait for a unit to reach the target state after an action
+ACTION_TIMEOUT = 30
+
+# Units handled at the same time by "restart failed" and by a rolling group restart
+BULK_CONCURRENCY = 4
+ROLLING_CONCURRENCY = 1
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class ActionResult:
+    """Outcome of an action on one unit."""
+
+    service: str
+    ok: bool
+    state: str
+    message: str
+    duration: float
+
+
+@dataclass
+class BulkAction:
+    """One action applied to several units, with the per-unit progress."""
+
+    action: str
+    services: List[str]
+    concurrency: int
+    # Rolling: no new units are started once one of them fails
+    stop_on_failure: bool = False
+    running: List[str] = field(default_factory=list)
+    results: Dict[str, ActionResult] = field(default_factory=dict)
+    skipped: List[str] = field(default_factory=list)
+    started_at: float = field(default_factory=time.monotonic)
+    finished_at: Optional[float] = None
+    task: Optional[asyncio.Task] = None
+
+    @property
+    def done(self) -> int:
+        return len(self.results) + len(self.skipped)
+
+    @property
+    def failed(self) -> int:
+        return sum(1 for result in self.results.values() if not result.ok)
+
+    @property
+    def finished(self) -> bool:
+        return self.done == len(self.services)
+
+    @property
+    def elapsed(self) -> float:
+        return (self.finished_at or time.monotonic()) - self.started_at
+
+
+class ServiceActions:
+    """
+    Runs start/stop/restart on local units and waits for the result.
+
+    After the systemctl call the unit is polled until it reaches the state
+    the action leads to, instead of sleeping for a fixed time. Bulk actions
+    run through a semaphore, only one of them at a time.
+    """
+
+    def __init__(self, checker: ServiceChecker, snapshot: StatusSnapshot, timeout: float = ACTION_TIMEOUT,
+                 bulk_concurrency: int = BULK_CONCURRENCY, rolling_concurrency: int = ROLLING_CONCURRENCY):
+        self.checker = checker
+        self.snapshot = snapshot
+        self.timeout = timeout
+        self.bulk_concurrency = bulk_concurrency
+        self.rolling_concurrency = rolling_concurrency
+        self.current: Optional[BulkAction] = None
+
+    async def apply(self, service_name: str, action: str) -> ActionResult:
+        """Run an action on a unit and wait until it reaches the target state or the timeout."""
+        started = time.monotonic()
+        success, command_message = await self.checker.execute_service_command(service_name, action)
+        self.snapshot.invalidate([service_name])
+        if not success:
+            return ActionResult(service_name, False, "unknown", command_message, time.monotonic() - started)
+
+        reached, state = await self.checker.wait_for_state(service_name, ACTION_TARGET_STATES[action], self.timeout)
+        self.snapshot.invalidate([service_name])
+        if reached:
+            message = "Команда выполнена успешно"
+        elif state == "failed":
+            message = "Сервис перешел в состояние failed"
+        else:
+            message = f"Сервис не перешел в нужное состояние за {self.timeout} с (сейчас {state})"
+        return ActionResult(service_name, reached, state, message, time.monotonic() - started)
+
+    def start_bulk(self, services: List[str], action: str, rolling: bool = False) -> Optional[BulkAction]:
+        """Start an action on several units in the background. Returns None if another bulk action is running."""
+        if self.current is not None and not self.current.finished:
+            return None
+
+        concurrency = self.rolling_concurrency if rolling else self.bulk_concurrency
+        bulk = self.current = BulkAction(action, list(services), max(concurrency, 1), stop_on_failure=rolling)
+        bulk.task = asyncio.create_task(self._run_bulk(bulk))
+        return bulk
+
+    async def _run_bulk(self, bulk: BulkAction):
+        semaphore = asyncio.Semaphore(bulk.concurrency)
+
+        async def run_one(service_name: str):
+            async with semaphore:
+                if bulk.stop_on_failure and bulk.failed:
+                    bulk.skipped.append(service_name)
+                    return
+                bulk.running.append(service_name)
+                try:
+                    result = await self.apply(service_name, bulk.action)
+                except Exception as e:
+                    logger.exception(f"Bulk {bulk.action} failed", extra={"unit": service_name})
+                    result = ActionResult(service_name, False, "unknown", str(e), 0.0)
+                finally:
+                    bulk.running.remove(service_name)
+                bulk.results[service_name] = result
+
+        await asyncio.gather(*(run_one(service) for service in bulk.services))
+        bulk.finished_at = time.monotonic()
+        logger.info(f"Bulk {bulk.action} finished: {len(bulk.results) - bulk.failed} ok, {bulk.failed} failed, "
+                    f"{len(bulk.skipped)} skipped", extra={"duration_ms": round(bulk.elapsed * 1000, 1)})
+
+
+# Timeouts and concurrency are set from the config in bot.py
+service_actions = ServiceActions(checker, snapshot)
@@ -0,0 +1,117 @@
+import asyncio
+import logging
+import time
+from collections import OrderedDict
+from typing import Dict, Optional, Set
+
+from tgbot.services import db
+
+logger = logging.getLogger(__name__)
+
+
+class AdminCache:
+    """
+    In-memory cache of admin roles for AdminFilter.
+
+    Admins are preloaded in bulk and refreshed periodically, other users are
+    looked up on first use and cached as non-admins for `negative_ttl`.
+    DB calls run in the default executor with a timeout; when the DB is slow
+    or down the last known role is used, and unknown users are denied.
+    """
+
+    def __init__(self, ttl: float = 300, negative_ttl: float = 60, max_size: int = 1024, timeout: float = 5):
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.max_size = max_size
+        self.timeout = timeout
+
+        # user_id -> (is_admin, expires_at), least recently used first
+        self._entries: "OrderedDict[int, tuple]" = OrderedDict()
+        self._in_flight: Dict[int, asyncio.Task] = {}
+
+    def _set(self, user_id: int, value: bool):
+        ttl = self.ttl if value else self.negative_ttl
+        self._entries[user_id] = (value, time.monotonic() + ttl)
+        self._entries.move_to_end(user_id)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+    def peek(self, user_id: int) -> Optional[bool]:
+        """Return the cached role if it has not expired."""
+        entry = self._entries.get(user_id)
+        if entry is None or entry[1] < time.monotonic():
+            return None
+        self._entries.move_to_end(user_id)
+        return entry[0]
+
+    async def _lookup(self, user_id: int) -> bool:
+        loop = asyncio.get_running_loop()
+        try:
+            value = await asyncio.wait_for(loop.run_in_executor(None, db.is_admin, user_id), self.timeout)
+        except Exception as e:
+            logger.warning(f"Admin lookup for [ID:{user_id}] failed: {e}")
+            entry = self._entries.get(user_id)
+            return entry[0] if entry else False
+        finally:
+            self._in_flight.pop(user_id, None)
+
+        self._set(user_id, value)
+        return value
+
+    async def is_admin(self, user_id: int) -> bool:
+        """Check the role of a user, going to the DB only on a cache miss."""
+        value = self.peek(user_id)
+        if value is not None:
+            return value
+
+        # Concurrent updates from the same user share one lookup
+        task = self._in_flight.get(user_id)
+        if task is None:
+            task = asyncio.create_task(self._lookup(user_id))
+            self._in_flight[user_id] = task
+        return await asyncio.shield(task)
+
+    async def _load_admin_ids(self) -> Optional[Set[int]]:
+        loop = asyncio.get_running_loop()
+        try:
+            return await asyncio.wait_for(loop.run_in_executor(None, db.get_admin_ids), self.timeout)
+        except Exception as e:
+            logger.warning(f"Admin preload failed: {e}")
+            return None
+
+    async def preload(self):
+        """Load all admins in one query, replacing cached positive entries."""
+        admin_ids = await self._load_admin_ids()
+        if admin_ids is None:
+            return
+
+        # Drop users who lost the admin role
+        for user_id, (value, _) in list(self._entries.items()):
+            if value and user_id not in admin_ids:
+                del self._entries[user_id]
+        for user_id in admin_ids:
+            self._set(user_id, True)
+
+    async def reload(self) -> bool:
+        """
+        Forget every cached role and load the admins again, after roles were changed in the DB.
+
+        The cache is kept as is if the DB cannot be read. Returns whether it was reloaded.
+        """
+        admin_ids = await self._load_admin_ids()
+        if admin_ids is None:
+            return False
+        self.invalidate()
+        for user_id in admin_ids:
+            self._set(user_id, True)
+        return True
+
+    def invalidate(self, user_id: int = None):
+        """Forget a single user or the whole cache."""
+        if user_id is None:
+            self._entries.clear()
+        else:
+            self._entries.pop(user_id, None)
+
+
+admin_cache = AdminCache()
@@ -0,0 +1,61 @@
+import asyncio
+import hmac
+import socket
+from typing import Optional
+
+from aiohttp import web
+
+from tgbot.services.checker import StatusSnapshot
+
+
+def create_agent_app(snapshot: StatusSnapshot, token: Optional[str] = None, host_name: str = None) -> web.Application:
+    """
+    Build the agent HTTP app.
+
+    GET /status returns the cached status of every unit of this host, probing
+    only units whose snapshot is stale. When `token` is set, requests must
+    send it as `Authorization: Bearer <token>`.
+    """
+    host_name = host_name or socket.gethostname()
+
+    async def status_handler(request: web.Request) -> web.Response:
+        if token:
+            expected = f"Bearer {token}"
+            if not hmac.compare_digest(request.headers.get("Authorization", ""), expected):
+                return web.json_response({"error": "unauthorized"}, status=401)
+
+        results = await snapshot.get()
+        return web.json_response({
+            "host": host_name,
+            "display_names": {
+                service: snapshot.checker.display_name(service) for service in snapshot.checker.services
+            },
+            "services": results,
+        })
+
+    app = web.Application()
+    app.router.add_get("/status", status_handler)
+    return app
+
+
+async def serve_agent(
+    snapshot: StatusSnapshot,
+    host: str = "127.0.0.1",
+    port: int = 9200,
+    socket_path: str = None,
+    token: str = None,
+    host_name: str = None,
+):
+    """Run the agent until cancelled, on a TCP port or a Unix socket."""
+    runner = web.AppRunner(create_agent_app(snapshot, token, host_name))
+    await runner.setup()
+    if socket_path:
+        site = web.UnixSite(runner, socket_path)
+    else:
+        site = web.TCPSite(runner, host, port)
+    await site.start()
+
+    try:
+        await asyncio.Event().wait()
+    finally:
+        await runner.cleanup()
@@ -0,0 +1,97 @@
+import asyncio
+import logging
+from dataclasses import dataclass
+from typing import Dict, List, Optional
+
+import aiohttp
+
+# Seconds to wait for a single agent
+AGENT_TIMEOUT = 5
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class Agent:
+    """A remote checker agent. `url` is http(s)://host:port or unix:/path/to.sock"""
+
+    name: str
+    url: str
+
+    @staticmethod
+    def parse(value: str) -> "Agent":
+        """Parse a `name=url` entry of the AGENTS variable."""
+        name, _, url = value.partition("=")
+        if not url:
+            url, name = name, name
+        return Agent(name=name.strip(), url=url.strip())
+
+
+class Aggregator:
+    """
+    Poll checker agents on other hosts concurrently and merge their results.
+
+    HTTP sessions are created on first use and kept between polls: one for
+    all TCP agents and one per unix socket, which needs its own connector.
+    """
+
+    def __init__(self, agents: List[Agent] = None, token: Optional[str] = None, timeout: float = AGENT_TIMEOUT):
+        self.agents = agents or []
+        self.token = token
+        self.timeout = timeout
+        # Results of the latest poll, for views that must not wait for the network
+        self.last: List[Dict] = []
+        # Socket path, or "" for TCP agents, to its session
+        self._sessions: Dict[str, aiohttp.ClientSession] = {}
+
+    def _session(self, socket_path: str = "") -> aiohttp.ClientSession:
+        session = self._sessions.get(socket_path)
+        if session is None or session.closed:
+            connector = aiohttp.UnixConnector(path=socket_path) if socket_path else None
+            session = self._sessions[socket_path] = aiohttp.ClientSession(connector=connector)
+        return session
+
+    async def close(self):
+        """Close the HTTP sessions, called on shutdown."""
+        sessions = list(self._sessions.values())
+        self._sessions.clear()
+        for session in sessions:
+            await session.close()
+
+    async def _poll_agent(self, agent: Agent) -> Dict:
+        headers = {"Authorization": f"Bearer {self.token}"} if self.token else {}
+        if agent.url.startswith("unix:"):
+            session = self._session(agent.url[len("unix:"):])
+            url = "http://localhost/status"
+        else:
+            session = self._session()
+            url = agent.url.rstrip("/") + "/status"
+
+        try:
+            async with session.get(
+                url, headers=headers, timeout=aiohttp.ClientTimeout(total=self.timeout)
+            ) as response:
+                response.raise_for_status()
+                data = await response.json()
+        except asyncio.TimeoutError:
+            return {"host": agent.name, "services": [], "display_names": {}, "error": "таймаут"}
+        except Exception as e:
+            logger.warning(f"Agent {agent.name} ({agent.url}) failed: {e}")
+            return {"host": agent.name, "services": [], "display_names": {}, "error": str(e)}
+
+        return {
+            "host": agent.name,
+            "services": data.get("services", []),
+            "display_names": data.get("display_names", {}),
+            "error": None,
+        }
+
+    async def poll(self) -> List[Dict]:
+        """Get results of all agents, in configuration order."""
+        if not self.agents:
+            return []
+        self.last = list(await asyncio.gather(*(self._poll_agent(agent) for agent in self.agents)))
+        return self.last
+
+
+aggregator = Aggregator()
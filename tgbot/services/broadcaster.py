@@ -1,11 +1,164 @@
 import asyncio
 import logging
-from typing import Union
+import time
+from typing import Dict, Union
 
 from aiogram import Bot
 from aiogram import exceptions
 from aiogram.types import InlineKeyboardMarkup
 
+from tgbot.services import metrics
+
+# Telegram limits: about 30 messages per second overall, 1 per second per chat
+GLOBAL_RATE = 30
+PER_CHAT_RATE = 1
+
+# Max number of messages being sent at the same time
+MAX_CONCURRENT_SENDS = 10
+
+# Max number of attempts for a message that hits flood control
+MAX_ATTEMPTS = 3
+
+
+class TokenBucket:
+    """Simple async token bucket: `rate` tokens per second, bursts up to `capacity`."""
+
+    def __init__(self, rate: float, capacity: float = None):
+        self.rate = rate
+        self.capacity = capacity or rate
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self):
+        """Wait until a token is available and take it."""
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+
+
+class Broadcaster:
+    """
+    Delivery engine for all outgoing notifications.
+
+    Sends run concurrently but are throttled by a global token bucket and a
+    bucket per chat. A RetryAfter from Telegram pauses every send until the
+    flood wait is over, then the message is retried up to `max_attempts` times.
+    """
+
+    def __init__(
+        self,
+        rate: float = GLOBAL_RATE,
+        per_chat_rate: float = PER_CHAT_RATE,
+        concurrency: int = MAX_CONCURRENT_SENDS,
+        max_attempts: int = MAX_ATTEMPTS,
+    ):
+        self.per_chat_rate = per_chat_rate
+        self.max_attempts = max_attempts
+
+        self._bucket = TokenBucket(rate)
+        self._chat_buckets: Dict[Union[int, str], TokenBucket] = {}
+        self._semaphore = asyncio.Semaphore(concurrency)
+        self._paused_until = 0.0
+
+    def _chat_bucket(self, user_id: Union[int, str]) -> TokenBucket:
+        bucket = self._chat_buckets.get(user_id)
+        if bucket is None:
+            bucket = self._chat_buckets[user_id] = TokenBucket(self.per_chat_rate, 1)
+        return bucket
+
+    async def _wait_for_pause(self):
+        while (delay := self._paused_until - time.monotonic()) > 0:
+            await asyncio.sleep(delay)
+
+    async def send(
+        self,
+        bot: Bot,
+        user_id: Union[int, str],
+        text: str,
+        disable_notification: bool = False,
+        reply_markup: InlineKeyboardMarkup = None,
+    ) -> bool:
+        """
+        Safe messages sender
+
+        :param bot: Bot instance.
+        :param user_id: user id. If str - must contain only digits.
+        :param text: text of the message.
+        :param disable_notification: disable notification or not.
+        :param reply_markup: reply markup.
+        :return: success.
+        """
+        async with self._semaphore:
+            for attempt in range(1, self.max_attempts + 1):
+                await self._chat_bucket(user_id).acquire()
+                await self._wait_for_pause()
+                await self._bucket.acquire()
+
+                started = time.perf_counter()
+                result = "error"
+                try:
+                    await bot.send_message(
+                        user_id,
+                        text,
+                        disable_notification=disable_notification,
+                        reply_markup=reply_markup,
+                    )
+                    result = "success"
+                except exceptions.TelegramRetryAfter as e:
+                    metrics.TELEGRAM_RETRY_AFTER.inc()
+                    result = "retry_after"
+                    logging.error(
+                        f"Target [ID:{user_id}]: Flood limit is exceeded. "
+                        f"Sleep {e.retry_after} seconds (attempt {attempt}/{self.max_attempts})."
+                    )
+                    self._paused_until = max(self._paused_until, time.monotonic() + e.retry_after)
+                    continue
+                except exceptions.TelegramBadRequest:
+                    logging.error("Telegram server says - Bad Request: chat not found")
+                except exceptions.TelegramForbiddenError:
+                    logging.error(f"Target [ID:{user_id}]: got TelegramForbiddenError")
+                except exceptions.TelegramAPIError:
+                    logging.exception(f"Target [ID:{user_id}]: failed")
+                finally:
+                    metrics.TELEGRAM_SEND_DURATION.observe(time.perf_counter() - started, result=result)
+                if result == "success":
+                    logging.info(f"Target [ID:{user_id}]: success", extra={"sample": "send_success"})
+                    return True
+                return False
+
+        logging.error(f"Target [ID:{user_id}]: gave up after {self.max_attempts} attempts")
+        return False
+
+    async def broadcast(
+        self,
+        bot: Bot,
+        users: list[Union[str, int]],
+        text: str,
+        disable_notification: bool = False,
+        reply_markup: InlineKeyboardMarkup = None,
+    ) -> Dict[Union[str, int], bool]:
+        """
+        Send a message to all users concurrently.
+
+        :return: Delivery result per user.
+        """
+        results = await asyncio.gather(
+            *(self.send(bot, user_id, text, disable_notification, reply_markup) for user_id in users)
+        )
+        report = dict(zip(users, results))
+        logging.info(f"{sum(results)} of {len(report)} messages successful sent.")
+        return report
+
+
+broadcaster = Broadcaster()
+
 
 async def send_message(
     bot: Bot,
@@ -15,7 +168,7 @@ async def send_message(
     reply_markup: InlineKeyboardMarkup = None,
 ) -> bool:
     """
-    Safe messages sender
+    Safe messages sender through the shared broadcaster.
 
     :param bot: Bot instance.
     :param user_id: user id. If str - must contain only digits.
@@ -24,31 +177,7 @@ async def send_message(
     :param reply_markup: reply markup.
     :return: success.
     """
-    try:
-        await bot.send_message(
-            user_id,
-            text,
-            disable_notification=disable_notification,
-            reply_markup=reply_markup,
-        )
-    except exceptions.TelegramBadRequest as e:
-        logging.error("Telegram server says - Bad Request: chat not found")
-    except exceptions.TelegramForbiddenError:
-        logging.error(f"Target [ID:{user_id}]: got TelegramForbiddenError")
-    except exceptions.TelegramRetryAfter as e:
-        logging.error(
-            f"Target [ID:{user_id}]: Flood limit is exceeded. Sleep {e.retry_after} seconds."
-        )
-        await asyncio.sleep(e.retry_after)
-        return await send_message(
-            bot, user_id, text, disable_notification, reply_markup
-        )  # Recursive call
-    except exceptions.TelegramAPIError:
-        logging.exception(f"Target [ID:{user_id}]: failed")
-    else:
-        logging.info(f"Target [ID:{user_id}]: success")
-        return True
-    return False
+    return await broadcaster.send(bot, user_id, text, disable_notification, reply_markup)
 
 
 async def broadcast(
@@ -57,7 +186,7 @@ async def broadcast(
     text: str,
     disable_notification: bool = False,
     reply_markup: InlineKeyboardMarkup = None,
-) -> int:
+) -> Dict[Union[str, int], bool]:
     """
     Simple broadcaster.
     :param bot: Bot instance.
@@ -65,19 +194,6 @@ async def broadcast(
     :param text: Text of the message.
     :param disable_notification: Disable notification or not.
     :param reply_markup: Reply markup.
-    :return: Count of messages.
+    :return: Delivery result per user.
     """
-    count = 0
-    try:
-        for user_id in users:
-            if await send_message(
-                bot, user_id, text, disable_notification, reply_markup
-            ):
-                count += 1
-            await asyncio.sleep(
-                0.05
-            )  # 20 messages per second (Limit: 30 messages per second)
-    finally:
-        logging.info(f"{count} messages successful sent.")
-
-    return count
+    return await broadcaster.broadcast(bot, users, text, disable_notification, reply_markup)
@@ -1,154 +1,550 @@
 import asyncio
-import concurrent.futures
-import subprocess
+import json
+import logging
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+from dataclasses import dataclass
 from datetime import datetime
-from typing import Dict, List
-
-SERVICES_CONFIG = {
-    "adaptive.service": {"name": "👶🏻 Адаптационки", "display_name": "Адаптационки"},
-    "achievmentbot.service": {"name": "🏆 НТП Ачивер", "display_name": "НТП Ачивер"},
-    "nckachievenmentbot.service": {
-        "name": "🏆 НЦК Ачивер",
-        "display_name": "НЦК Ачивер",
-    },
-    "ntposchedule.service": {"name": "🕞 НТП График", "display_name": "НТП График"},
-    "nckschedule.service": {"name": "🕞 НЦК График", "display_name": "НЦК График"},
-    "gifter.service": {"name": "🎁 Гифтер", "display_name": "Гифтер"},
-    "nckteach.service": {"name": "🎓 NCKTeach", "display_name": "NCKTeach"},
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from tgbot.services import metrics
+from tgbot.services.timeseries import ResourceHistory, sparkline
+
+try:
+    # Optional, parses journal lines several times faster
+    import orjson
+
+    json_loads = orjson.loads
+except ImportError:
+    json_loads = json.loads
+
+logger = logging.getLogger(__name__)
+
+# Default timeout for a single systemctl/journalctl call, in seconds
+COMMAND_TIMEOUT = 10
+
+# Max number of systemctl/journalctl processes running at the same time
+MAX_CONCURRENT_COMMANDS = 8
+
+_command_semaphore = asyncio.Semaphore(MAX_CONCURRENT_COMMANDS)
+
+# Number of recent log messages kept per unit for the detail view
+LOG_TAIL_SIZE = 5
+
+# Max number of new journal entries read per unit in one probe
+MAX_JOURNAL_DELTA = 1000
+
+# Max length of a single journal line
+STREAM_LIMIT = 1024 * 1024
+
+ERROR_KEYWORDS = ("error", "failed", "exception")
+
+# syslog priority "err", entries of this or a more severe priority are errors
+ERROR_PRIORITY = 3
+
+# Journal fields needed to build entries, the rest is not exported
+JOURNAL_FIELDS = [
+    "MESSAGE",
+    "PRIORITY",
+    "_SYSTEMD_UNIT",
+    "UNIT",
+    "OBJECT_SYSTEMD_UNIT",
+    "SYSLOG_IDENTIFIER",
+    "_COMM",
+    "_PID",
+    "_HOSTNAME",
+]
+
+# ActiveState that ends the wait after each action
+ACTION_TARGET_STATES = {
+    "start": ("active",),
+    "restart": ("active",),
+    "stop": ("inactive", "failed"),
 }
 
+STATUS_PROPERTIES = [
+    "Id",
+    "Names",
+    "ActiveState",
+    "SubState",
+    "LoadState",
+    "MainPID",
+    "MemoryCurrent",
+    "CPUUsageNSec",
+    "NRestarts",
+]
 
-class ServiceChecker:
-    def __init__(self, services: List[str]):
-        self.services = services
 
-    def get_service_status(self, service_name: str) -> Dict:
-        """Get the status of a single service and its last 5 log messages."""
+@asynccontextmanager
+async def command_slot(cmd: List[str], unit: str = ""):
+    """Wait for a free command slot and time the command run inside the block."""
+    metrics.COMMANDS_WAITING.inc()
+    try:
+        await _command_semaphore.acquire()
+    finally:
+        metrics.COMMANDS_WAITING.dec()
+
+    metrics.COMMANDS_RUNNING.inc()
+    try:
+        with metrics.PROBE_DURATION.time(command=cmd[0], unit=unit):
+            yield
+    finally:
+        metrics.COMMANDS_RUNNING.dec()
+        _command_semaphore.release()
+
+
+async def run_command(cmd: List[str], timeout: float = COMMAND_TIMEOUT, unit: str = "") -> Tuple[int, str, str]:
+    """Run a command without blocking the event loop.
+
+    Raises asyncio.TimeoutError if the command does not finish in time;
+    the process is killed in that case. `unit` only labels the metrics.
+    """
+    async with command_slot(cmd, unit):
+        process = await asyncio.create_subprocess_exec(
+            *cmd, stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.PIPE
+        )
         try:
-            # Get service status
-            status_result = subprocess.run(
-                ["systemctl", "is-active", service_name],
-                capture_output=True,
-                text=True,
-                timeout=10,
-            )
+            stdout, stderr = await asyncio.wait_for(process.communicate(), timeout)
+        except asyncio.TimeoutError:
+            metrics.PROBE_TIMEOUTS.inc(command=cmd[0], unit=unit)
+            process.kill()
+            await process.wait()
+            raise
+
+    return process.returncode, stdout.decode(errors="replace"), stderr.decode(errors="replace")
+
+
+def parse_systemctl_show(output: str, services: List[str]) -> Dict[str, Dict[str, str]]:
+    """Split multi-unit `systemctl show` output into per-unit property dicts.
+
+    systemctl prints one block per unit separated by an empty line. Blocks
+    are matched to units by `Id`, or by `Names` for a unit requested by an
+    alias, so a skipped unit does not shift the states of the others.
+    """
+    wanted = set(services)
+    states = {}
+    current = {}
+    for line in output.split("\n") + [""]:
+        line = line.strip()
+        if not line:
+            if current:
+                names = [current.get("Id", "")] + current.get("Names", "").split()
+                service = next((name for name in names if name in wanted), None)
+                if service is not None:
+                    states[service] = current
+                current = {}
+            continue
+        if "=" in line:
+            key, value = line.split("=", 1)
+            current[key] = value
+
+    return states
+
+
+def format_journal_entry(entry: Dict) -> str:
+    """Format a journal entry like `journalctl --output=short` does."""
+    message = entry.get("MESSAGE", "")
+    # Non-UTF-8 messages are exported as a list of byte values
+    if isinstance(message, list):
+        message = bytes(message).decode(errors="replace")
+
+    timestamp = entry.get("__REALTIME_TIMESTAMP")
+    if timestamp:
+        timestamp = datetime.fromtimestamp(int(timestamp) / 1_000_000).strftime("%b %d %H:%M:%S")
+    else:
+        timestamp = ""
+
+    identifier = entry.get("SYSLOG_IDENTIFIER") or entry.get("_COMM", "")
+    pid = entry.get("_PID")
+    source = f"{identifier}[{pid}]" if pid else identifier
+
+    prefix = " ".join(part for part in (timestamp, entry.get("_HOSTNAME", ""), source) if part)
+    return f"{prefix}: {message}" if prefix else message
+
+
+def is_error_message(message: str) -> bool:
+    """Check whether a log line looks like an error."""
+    message = message.lower()
+    return any(keyword in message for keyword in ERROR_KEYWORDS)
+
 
-            # Get detailed service info
-            show_result = subprocess.run(
-                ["systemctl", "show", service_name, "--no-page"],
-                capture_output=True,
-                text=True,
-                timeout=10,
+@dataclass
+class JournalEntry:
+    """One journal entry of a monitored unit."""
+
+    unit: str
+    # Seconds since the epoch
+    timestamp: float
+    # syslog priority, 0 (emerg) to 7 (debug), None if not set
+    priority: Optional[int]
+    message: str
+    # The entry formatted like `journalctl --output=short`
+    text: str
+    cursor: Optional[str] = None
+
+    @property
+    def is_error(self) -> bool:
+        # Services logging to stdout get one priority for every line, so keywords still count
+        return (self.priority is not None and self.priority <= ERROR_PRIORITY) or is_error_message(self.message)
+
+
+def journal_unit(raw: Dict, units) -> Optional[str]:
+    """Find the monitored unit a raw journal entry belongs to."""
+    # Messages systemd writes about a unit carry UNIT instead of _SYSTEMD_UNIT
+    for key in ("_SYSTEMD_UNIT", "UNIT", "OBJECT_SYSTEMD_UNIT"):
+        unit = raw.get(key)
+        if unit in units:
+            return unit
+    return None
+
+
+def parse_journal_entry(raw: Dict, unit: str) -> JournalEntry:
+    """Build an entry from one object of `journalctl --output=json`."""
+    message = raw.get("MESSAGE", "")
+    if isinstance(message, list):
+        message = bytes(message).decode(errors="replace")
+
+    priority = raw.get("PRIORITY")
+    try:
+        priority = int(priority) if priority is not None else None
+    except ValueError:
+        priority = None
+
+    return JournalEntry(
+        unit=unit,
+        timestamp=int(raw.get("__REALTIME_TIMESTAMP") or 0) / 1_000_000,
+        priority=priority,
+        message=message,
+        text=format_journal_entry(raw),
+        cursor=raw.get("__CURSOR"),
+    )
+
+
+class LogSource:
+    """Base class for sources of new journal entries per unit."""
+
+    async def read(self, services: Iterable[str], watched: Iterable[str] = ()) -> Dict[str, List[JournalEntry]]:
+        """Return entries written since the previous read of each unit."""
+        raise NotImplementedError
+
+    def forget(self, unit: str):
+        """Drop the state of a unit that is no longer monitored."""
+
+
+class NoLogs(LogSource):
+    """Log source without entries, for running the checker without a journal."""
+
+    async def read(self, services: Iterable[str], watched: Iterable[str] = ()) -> Dict[str, List[JournalEntry]]:
+        return {}
+
+
+class JournalReader(LogSource):
+    """
+    Reads new journal entries of all units with one `journalctl -o json` call.
+
+    The output is streamed and demultiplexed by unit; every unit keeps at most
+    `budget` entries per read, so a chatty unit cannot push out the others.
+    Reads cover all watched units and continue from one journal cursor.
+    Entries of units that were not asked for are kept until they are.
+
+    Units seen for the first time get their last `tail` entries. On the first
+    read that is part of the combined query; units it leaves empty, and units
+    added later, get a one-off query of their own.
+    """
+
+    def __init__(self, timeout: float = COMMAND_TIMEOUT, budget: int = MAX_JOURNAL_DELTA, tail: int = LOG_TAIL_SIZE):
+        self.timeout = timeout
+        self.budget = budget
+        self.tail = tail
+
+        self._cursor: Optional[str] = None
+        # Units whose recent history has been read
+        self._known = set()
+        self._pending: Dict[str, deque] = {}
+        self._lock = asyncio.Lock()
+
+    async def _stream(self, units: List[str], budget: int, cursor: str = None) -> Tuple[Dict[str, deque], Optional[str]]:
+        """Run journalctl for `units`; returns the last `budget` entries per unit and the last cursor."""
+        cmd = ["journalctl", "--no-pager", "--output=json", f"--output-fields={','.join(JOURNAL_FIELDS)}",
+               "-n", str(budget * len(units))]
+        if cursor:
+            cmd.append(f"--after-cursor={cursor}")
+        for unit in units:
+            cmd += ["-u", unit]
+
+        found = {unit: deque(maxlen=budget) for unit in units}
+        last_cursor = None
+
+        async def consume(stream):
+            nonlocal last_cursor
+            while True:
+                try:
+                    line = await stream.readline()
+                except ValueError:
+                    # Line longer than STREAM_LIMIT, the reader has dropped it
+                    continue
+                if not line:
+                    return
+                try:
+                    raw = json_loads(line)
+                except ValueError:
+                    continue
+                last_cursor = raw.get("__CURSOR") or last_cursor
+                unit = journal_unit(raw, found)
+                if unit is not None:
+                    found[unit].append(parse_journal_entry(raw, unit))
+
+        label = units[0] if len(units) == 1 else "all"
+        async with command_slot(cmd, label):
+            process = await asyncio.create_subprocess_exec(
+                *cmd, stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.DEVNULL, limit=STREAM_LIMIT
             )
+            async def read_all():
+                await consume(process.stdout)
+                # EOF: journalctl is exiting, reap it before returning
+                await process.wait()
+
+            try:
+                await asyncio.wait_for(read_all(), self.timeout)
+            except asyncio.TimeoutError:
+                metrics.PROBE_TIMEOUTS.inc(command=cmd[0], unit=label)
+                raise
+            finally:
+                # Only on timeout or cancellation, the process is still running
+                if process.returncode is None:
+                    process.kill()
+                    await process.wait()
+
+        return found, last_cursor
+
+    async def _tail(self, unit: str) -> deque:
+        found, _ = await self._stream([unit], self.tail)
+        return found[unit]
 
-            # Get last 5 log messages
-            log_result = subprocess.run(
-                [
-                    "journalctl",
-                    "-u",
-                    service_name,
-                    "-n",
-                    "5",
-                    "--no-pager",
-                    "--output=short",
-                ],
-                capture_output=True,
-                text=True,
-                timeout=10,
+    async def _poll(self, units: List[str]):
+        new = [unit for unit in units if unit not in self._known]
+        if self._cursor is None:
+            found, cursor = await self._stream(units, self.tail)
+            # Chatty units may have filled the combined tail
+            missing = [unit for unit in new if not found[unit]]
+            tails = await asyncio.gather(*(self._tail(unit) for unit in missing))
+        else:
+            # Units added since the cursor was taken have no history yet
+            missing = new
+            (found, cursor), *tails = await asyncio.gather(
+                self._stream(units, self.budget, self._cursor), *(self._tail(unit) for unit in missing)
             )
 
-            # Parse service info
-            service_info = {}
-            for line in show_result.stdout.strip().split("\n"):
-                if "=" in line:
-                    key, value = line.split("=", 1)
-                    service_info[key] = value
-
-            # Format log messages
-            log_messages = []
-            if log_result.stdout.strip():
-                log_lines = log_result.stdout.strip().split("\n")
-                for line in log_lines:
-                    if line.strip():
-                        log_messages.append(line)
-
-            # Check for errors in logs
-            has_error = any(
-                "error" in log.lower()
-                or "failed" in log.lower()
-                or "exception" in log.lower()
-                for log in log_messages
+        for unit, tail in zip(missing, tails):
+            # The tail may overlap with the entries read after the cursor
+            seen = {entry.cursor for entry in found[unit]}
+            found[unit].extendleft(reversed([entry for entry in tail if entry.cursor not in seen]))
+
+        if cursor:
+            self._cursor = cursor
+        self._known = set(units)
+        for unit in list(self._pending):
+            if unit not in self._known:
+                del self._pending[unit]
+        for unit, entries in found.items():
+            self._pending.setdefault(unit, deque(maxlen=self.budget)).extend(entries)
+
+    def forget(self, unit: str):
+        """Drop the state of a unit that is no longer monitored."""
+        self._known.discard(unit)
+        self._pending.pop(unit, None)
+
+    async def read(self, services: Iterable[str], watched: Iterable[str] = ()) -> Dict[str, List[JournalEntry]]:
+        """
+        Get entries of `services` written since their previous read.
+
+        The journal is read for `watched` and `services` together.
+        Raises asyncio.TimeoutError if journalctl does not finish in time.
+        """
+        services = list(services)
+        units = list(dict.fromkeys([*watched, *services]))
+        async with self._lock:
+            if units:
+                await self._poll(units)
+            return {service: list(self._pending.pop(service, ())) for service in services}
+
+
+def error_result(service_name: str, status: str, error: str) -> Dict:
+    """Build a result for a service that could not be checked."""
+    return {
+        "service": service_name,
+        "status": status,
+        "active": False,
+        "error": error,
+        "checked_at": datetime.now().isoformat(),
+    }
+
+
+class StatusBackend:
+    """Base class for service state backends."""
+
+    async def fetch(self, services: List[str]) -> Dict[str, Dict[str, str]]:
+        """Return systemd properties for every requested unit."""
+        raise NotImplementedError
+
+
+class SystemctlBackend(StatusBackend):
+    """Query every unit with a single `systemctl show` call."""
+
+    def __init__(self, timeout: float = COMMAND_TIMEOUT):
+        self.timeout = timeout
+
+    async def fetch(self, services: List[str]) -> Dict[str, Dict[str, str]]:
+        if not services:
+            return {}
+
+        returncode, stdout, stderr = await run_command(
+            [
+                "systemctl",
+                "show",
+                *services,
+                "-p",
+                ",".join(STATUS_PROPERTIES),
+                "--no-pager",
+            ],
+            self.timeout,
+            unit="all",
+        )
+        states = parse_systemctl_show(stdout, services)
+        # systemctl still prints the units it could read when one of them fails
+        if returncode != 0 and not states:
+            raise RuntimeError(stderr.strip() or f"systemctl show exited with code {returncode}")
+        return states
+
+
+class FakeBackend(StatusBackend):
+    """In-memory backend for running the checker without systemd."""
+
+    def __init__(self, states: Dict[str, Dict[str, str]] = None):
+        self.states = states or {}
+        self.calls = 0
+
+    async def fetch(self, services: List[str]) -> Dict[str, Dict[str, str]]:
+        self.calls += 1
+        return {
+            service: dict(
+                self.states.get(
+                    service,
+                    {"ActiveState": "inactive", "SubState": "dead", "LoadState": "not-found"},
+                )
             )
+            for service in services
+        }
+
+
+class ServiceChecker:
+    def __init__(self, services: List[str], backend: StatusBackend = None, timeout: float = COMMAND_TIMEOUT,
+                 logs: LogSource = None):
+        self.services = services
+        # Unit name to the name shown in messages, filled by unit discovery
+        self.display_names: Dict[str, str] = {}
+        self.backend = backend or SystemctlBackend(timeout)
+        self.timeout = timeout
+
+        # New journal entries and recent history per unit
+        self.journal = logs or JournalReader(timeout)
+        self._log_tails: Dict[str, deque] = {}
+        self._log_error_counts: Dict[str, int] = {}
+
+        # Optional JournalFollower; when set, logs are read from its buffers
+        self.follower = None
+
+        # CPU and memory samples from every probe
+        self.history = ResourceHistory()
+
+    def display_name(self, service_name: str) -> str:
+        return self.display_names.get(service_name, service_name)
+
+    def forget(self, service_name: str):
+        """Drop the logs and resource history of a unit that is no longer monitored."""
+        self._log_tails.pop(service_name, None)
+        self._log_error_counts.pop(service_name, None)
+        self.journal.forget(service_name)
+        self.history.forget(service_name)
+
+    async def read_logs(self, services: List[str]) -> Dict[str, List[JournalEntry]]:
+        """Get journal entries written since the previous call, per unit.
+
+        The first call for a unit returns its last LOG_TAIL_SIZE entries.
+        """
+        if self.follower is not None:
+            return {service: self.follower.drain(service) for service in services}
+        return await self.journal.read(services, self.services)
+
+    def build_result(self, service_name: str, service_info: Dict[str, str], entries: List[JournalEntry]) -> Dict:
+        """Build a status result from unit properties and new journal entries."""
+        # Count errors among the new entries only
+        new_errors = sum(1 for entry in entries if entry.is_error)
+        self._log_error_counts[service_name] = self._log_error_counts.get(service_name, 0) + new_errors
+
+        tail = self._log_tails.setdefault(service_name, deque(maxlen=LOG_TAIL_SIZE))
+        tail.extend(entry.text for entry in entries)
+
+        self.history.record(service_name, service_info.get("MemoryCurrent"), service_info.get("CPUUsageNSec"))
+
+        status = service_info.get("ActiveState", "unknown")
+        return {
+            "service": service_name,
+            "status": status,
+            "active": status == "active",
+            "load_state": service_info.get("LoadState", "unknown"),
+            "sub_state": service_info.get("SubState", "unknown"),
+            "main_pid": service_info.get("MainPID", "unknown"),
+            "memory_usage": service_info.get("MemoryCurrent", "unknown"),
+            "cpu_usage": service_info.get("CPUUsageNSec", "unknown"),
+            # Automatic restarts by systemd (Restart=) since the unit was started by hand
+            "restarts": int(service_info["NRestarts"]) if service_info.get("NRestarts", "").isdigit() else None,
+            "last_logs": list(tail),
+            "has_log_errors": new_errors > 0,
+            "new_log_errors": new_errors,
+            "total_log_errors": self._log_error_counts[service_name],
+            "error": None,
+            "checked_at": datetime.now().isoformat(),
+        }
+
+    async def get_service_status(self, service_name: str) -> Dict:
+        """Get the status of a single service and its last 5 log messages."""
+        results = await self.check_services([service_name])
+        return results[0]
+
+    async def check_services(self, services: List[str]) -> List[Dict]:
+        """Check the given services: one backend call for states, one journal read for logs.
+
+        Services are reported as errors only when their states could not be read.
+        """
+        services = list(services)
+        try:
+            states = await self.backend.fetch(services)
+        except asyncio.TimeoutError:
+            return [error_result(service, "timeout", "Command timed out") for service in services]
+        except Exception as e:
+            return [error_result(service, "error", str(e)) for service in services]
 
-            return {
-                "service": service_name,
-                "status": status_result.stdout.strip(),
-                "active": status_result.stdout.strip() == "active",
-                "load_state": service_info.get("LoadState", "unknown"),
-                "sub_state": service_info.get("SubState", "unknown"),
-                "main_pid": service_info.get("MainPID", "unknown"),
-                "memory_usage": service_info.get("MemoryCurrent", "unknown"),
-                "cpu_usage": service_info.get("CPUUsageNSec", "unknown"),
-                "last_logs": log_messages,
-                "has_log_errors": has_error,
-                "error": None,
-                "checked_at": datetime.now().isoformat(),
-            }
-
-        except subprocess.TimeoutExpired:
-            return {
-                "service": service_name,
-                "status": "timeout",
-                "active": False,
-                "error": "Command timed out",
-                "checked_at": datetime.now().isoformat(),
-            }
+        # The states are known, a failed journal read only leaves the logs out
+        try:
+            logs = await self.read_logs(services)
+        except asyncio.TimeoutError:
+            logger.warning("Journal read timed out, checking states without logs")
+            logs = {}
         except Exception as e:
-            return {
-                "service": service_name,
-                "status": "error",
-                "active": False,
-                "error": str(e),
-                "checked_at": datetime.now().isoformat(),
-            }
-
-    def check_all_services(self) -> List[Dict]:
-        """Check all services in parallel."""
-        results = []
-
-        with concurrent.futures.ThreadPoolExecutor(
-            max_workers=len(self.services)
-        ) as executor:
-            # Submit all tasks
-            future_to_service = {
-                executor.submit(self.get_service_status, service): service
-                for service in self.services
-            }
-
-            # Collect results
-            for future in concurrent.futures.as_completed(future_to_service):
-                try:
-                    result = future.result()
-                    results.append(result)
-                except Exception as e:
-                    service = future_to_service[future]
-                    results.append(
-                        {
-                            "service": service,
-                            "status": "error",
-                            "active": False,
-                            "error": f"Future execution failed: {str(e)}",
-                            "checked_at": datetime.now().isoformat(),
-                        }
-                    )
-
-        return results
+            logger.warning(f"Journal read failed, checking states without logs: {e}")
+            logs = {}
+
+        return [self.build_result(service, states.get(service, {}), logs.get(service, [])) for service in services]
+
+    async def check_all_services(self) -> List[Dict]:
+        """Check all configured services."""
+        return await self.check_services(self.services)
 
     def format_service_message(self, service_name, result):
         """Format service status message"""
-        display_name = SERVICES_CONFIG.get(service_name, {}).get(
-            "display_name", service_name
-        )
+        display_name = self.display_name(service_name)
 
         # Status emoji and text
         if result.get("active"):
@@ -170,8 +566,17 @@ class ServiceChecker:
                 message += f"PID: {result.get('main_pid')}\n"
             if result.get("sub_state") != "unknown":
                 message += f"Состояние: {result.get('sub_state')}\n"
+            if result.get("total_log_errors"):
+                message += (
+                    f"Ошибок в логе: {result['total_log_errors']}"
+                    f" (новых: {result.get('new_log_errors', 0)})\n"
+                )
             message += "\n"
 
+            trend = self.format_resource_trend(service_name)
+            if trend:
+                message += trend + "\n"
+
         # Add last 5 log messages
         logs = result.get("last_logs", [])
         if logs:
@@ -189,6 +594,58 @@ class ServiceChecker:
 
         return message
 
+    def format_resource_trend(self, service_name: str, window: float = 3600) -> str:
+        """Format CPU and memory trend lines for the last `window` seconds"""
+        lines = []
+
+        cpu = [value for _, value in self.history.cpu_percent(service_name, window)]
+        if cpu:
+            lines.append(
+                f"CPU: <code>{sparkline(cpu)}</code> {cpu[-1]:.1f}% (макс {max(cpu):.1f}%)"
+            )
+
+        memory = self.history.memory_values(service_name, window)
+        if len(memory) > 1:
+            stats = self.history.memory_stats(service_name, window)
+            mb = 1024 * 1024
+            lines.append(
+                f"Память: <code>{sparkline(memory)}</code> {memory[-1] / mb:.1f} МБ "
+                f"(мин {stats['min'] / mb:.1f}, сред {stats['avg'] / mb:.1f}, макс {stats['max'] / mb:.1f} МБ)"
+            )
+
+        if not lines:
+            return ""
+        return "📈 <b>Ресурсы за час:</b>\n" + "\n".join(lines) + "\n"
+
+    async def wait_for_state(self, service_name: str, targets: Iterable[str], timeout: float,
+                             delay: float = 0.25, max_delay: float = 2.0) -> Tuple[bool, str]:
+        """Poll the ActiveState of a unit until it is one of `targets`, doubling the delay between polls.
+
+        Returns whether a target state was reached and the last seen state. Waiting
+        for "active" ends early on "failed", the unit does not get out of it by itself.
+        """
+        targets = set(targets)
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout
+        state = "unknown"
+        while True:
+            try:
+                info = await self.backend.fetch([service_name])
+                state = info.get(service_name, {}).get("ActiveState", "unknown")
+            except Exception as e:
+                logger.warning(f"Unit state poll failed: {e}", extra={"unit": service_name})
+
+            if state in targets:
+                return True, state
+            if state == "failed" and "active" in targets:
+                return False, state
+
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                return False, state
+            await asyncio.sleep(min(delay, remaining))
+            delay = min(delay * 2, max_delay)
+
     async def execute_service_command(self, service_name, action):
         """Execute systemctl command asynchronously"""
         try:
@@ -201,20 +658,120 @@ class ServiceChecker:
             else:
                 return False, "Неизвестная команда"
 
+            started = time.perf_counter()
             process = await asyncio.create_subprocess_exec(
                 *cmd, stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.PIPE
             )
 
             stdout, stderr = await process.communicate()
+            log_fields = {"unit": service_name, "duration_ms": round((time.perf_counter() - started) * 1000, 1)}
 
             if process.returncode == 0:
+                logger.info(f"systemctl {action} succeeded", extra=log_fields)
                 return True, "Команда выполнена успешно"
             else:
+                logger.warning(f"systemctl {action} failed: {stderr.decode().strip()}", extra=log_fields)
                 return False, f"Ошибка: {stderr.decode()}"
 
         except Exception as e:
+            logger.exception(f"systemctl {action} failed", extra={"unit": service_name})
             return False, f"Ошибка выполнения: {str(e)}"
 
 
-services = list(SERVICES_CONFIG.keys())
-checker = ServiceChecker(services)
+class StatusSnapshot:
+    """Last known status per unit, shared by the scheduler and all handlers.
+
+    Results younger than `ttl` seconds are served from memory. Stale units
+    are probed in one batch, and concurrent readers of a unit that is already
+    being probed wait for that probe instead of starting another one.
+    """
+
+    def __init__(self, checker: ServiceChecker, ttl: float = 15):
+        self.checker = checker
+        self.ttl = ttl
+        self._results: Dict[str, Dict] = {}
+        self._updated: Dict[str, float] = {}
+        self._in_flight: Dict[str, asyncio.Task] = {}
+        self._generation: Dict[str, int] = {}
+
+    def _is_fresh(self, service_name: str, max_age: float, now: float) -> bool:
+        updated = self._updated.get(service_name)
+        return updated is not None and now - updated <= max_age
+
+    async def _probe(self, services: List[str], generations: Dict[str, int]) -> Dict[str, Dict]:
+        task = asyncio.current_task()
+        try:
+            results = await self.checker.check_services(services)
+        finally:
+            for service in services:
+                if self._in_flight.get(service) is task:
+                    del self._in_flight[service]
+
+        now = time.monotonic()
+        by_service = {result["service"]: result for result in results}
+        for service, result in by_service.items():
+            # Skip units invalidated while this probe was running
+            if self._generation.get(service, 0) != generations.get(service):
+                continue
+            self._results[service] = result
+            self._updated[service] = now
+        return by_service
+
+    async def get(self, services: List[str] = None, max_age: float = None) -> List[Dict]:
+        """Get results for the given services (all configured by default)."""
+        services = list(self.checker.services if services is None else services)
+        max_age = self.ttl if max_age is None else max_age
+        now = time.monotonic()
+
+        tasks = set()
+        stale = []
+        for service in services:
+            if service in self._in_flight:
+                tasks.add(self._in_flight[service])
+            elif not self._is_fresh(service, max_age, now):
+                stale.append(service)
+
+        if stale:
+            generations = {service: self._generation.get(service, 0) for service in stale}
+            task = asyncio.create_task(self._probe(stale, generations))
+            for service in stale:
+                self._in_flight[service] = task
+            tasks.add(task)
+
+        probed = {}
+        for by_service in await asyncio.gather(*(asyncio.shield(task) for task in tasks)):
+            probed.update(by_service)
+
+        return [
+            probed.get(service) or self._results[service]
+            for service in services
+            if service in probed or service in self._results
+        ]
+
+    def is_fresh(self, services: List[str] = None, max_age: float = None) -> bool:
+        """Whether get() would answer from memory, without probing or waiting for a probe."""
+        services = self.checker.services if services is None else services
+        max_age = self.ttl if max_age is None else max_age
+        now = time.monotonic()
+        return all(
+            service not in self._in_flight and self._is_fresh(service, max_age, now)
+            for service in services
+        )
+
+    def peek(self, service_name: str) -> Dict:
+        """Return the cached result of a service without probing, if any."""
+        return self._results.get(service_name)
+
+    def invalidate(self, services: List[str] = None):
+        """Drop cached results so that the next read probes again."""
+        if services is None:
+            services = set(self._updated) | set(self._in_flight)
+        for service in services:
+            self._generation[service] = self._generation.get(service, 0) + 1
+            self._updated.pop(service, None)
+            self._in_flight.pop(service, None)
+
+
+# Units are set by tgbot.services.discovery
+checker = ServiceChecker([])
+snapshot = StatusSnapshot(checker)
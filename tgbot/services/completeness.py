@@ -0,0 +1,113 @@
+import asyncio
+import time
+from datetime import date, timedelta
+from typing import Dict, FrozenSet, List, Optional
+
+from tgbot.services.db import get_kpi_divisions, get_reference_divisions
+
+# Divisions expected to have KPI rows every day, unless configured otherwise
+DEFAULT_DIVISIONS = [
+    'НТП1Д', 'НТП1М', 'НТП1Н',
+    'НТП2Д', 'НТП2М', 'НТП2Н',
+    'НЦК1Д', 'НЦК1М', 'НЦК1Н',
+]
+
+# Divisions that never have to be complete
+DEFAULT_EXCLUDED = ['НЦК2Д', 'НЦК2Н', 'НЦК2М']
+
+# Format of the DATA column
+DATE_FORMAT = "%d.%m.%Y"
+
+# Max days checked at once, keeps the IN list of the query short
+MAX_RANGE_DAYS = 366
+
+
+class KpiCompleteness:
+    """
+    Checks which divisions have no KPI rows for a range of days.
+
+    All days not known to be complete are checked with one grouped query.
+    Past days found complete are remembered together with the divisions
+    they were checked against and are not queried again. Expected divisions
+    come from the configured list, or from a reference table when one is
+    set; the table is re-read every `reference_ttl` seconds.
+    """
+
+    def __init__(
+        self,
+        divisions: List[str] = None,
+        excluded: List[str] = None,
+        table: str = None,
+        reference_ttl: float = 3600,
+    ):
+        self.divisions = divisions or DEFAULT_DIVISIONS
+        self.excluded = DEFAULT_EXCLUDED if excluded is None else excluded
+        self.table = table
+        self.reference_ttl = reference_ttl
+
+        self._reference: Optional[List[str]] = None
+        self._reference_loaded = 0.0
+        # Complete past day -> divisions it was complete for
+        self._complete_days: Dict[date, FrozenSet[str]] = {}
+
+    def expected_divisions(self) -> List[str]:
+        """Divisions that must have rows for every day."""
+        if not self.table:
+            divisions = self.divisions
+        else:
+            if self._reference is None or time.monotonic() - self._reference_loaded > self.reference_ttl:
+                self._reference = sorted(get_reference_divisions(self.table))
+                self._reference_loaded = time.monotonic()
+            divisions = self._reference
+        return [division for division in divisions if division not in self.excluded]
+
+    def _check(self, days: List[date]) -> Dict[date, List[str]]:
+        expected = self.expected_divisions()
+        expected_set = frozenset(expected)
+        pending = [day for day in days if not expected_set <= self._complete_days.get(day, frozenset())]
+
+        found = get_kpi_divisions([day.strftime(DATE_FORMAT) for day in pending])
+
+        today = date.today()
+        missing = {}
+        for day in pending:
+            divisions = found.get(day.strftime(DATE_FORMAT), set())
+            gaps = [division for division in expected if division not in divisions]
+            if gaps:
+                missing[day] = gaps
+            elif day < today:
+                # Today may still change, past complete days are final
+                self._complete_days[day] = expected_set
+        return missing
+
+    async def check(self, start: date, end: date = None) -> Dict[date, List[str]]:
+        """
+        Find divisions without KPI rows for every day from `start` to `end` inclusive.
+
+        Returns:
+            Dict[date, List[str]]: missing divisions of incomplete days, empty if all days are complete
+        """
+        end = end or start
+        count = min((end - start).days + 1, MAX_RANGE_DAYS)
+        days = [start + timedelta(days=i) for i in range(count)]
+
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(None, self._check, days)
+
+    async def check_last_days(self, days: int = 1) -> Dict[date, List[str]]:
+        """Check today and the `days - 1` days before it."""
+        today = date.today()
+        return await self.check(today - timedelta(days=max(days, 1) - 1), today)
+
+
+def format_kpi_gaps(missing: Dict[date, List[str]]) -> str:
+    """Format missing divisions per day"""
+    message = "⚠️ Обнаружено несоответствие в датах KPI для следующих отделов:\n"
+    for day, divisions in sorted(missing.items()):
+        message += f"\n📅 {day.strftime('%d.%m.%Y')}:\n"
+        for division in divisions:
+            message += f"- {division}\n"
+    return message
+
+
+kpi_completeness = KpiCompleteness()
@@ -1,36 +1,309 @@
 import asyncio
-from datetime import datetime
-from typing import Tuple, List
+import math
+import re
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from typing import Dict, Tuple, List, Set, Optional
+
+from tgbot.config import DbConfig
+from tgbot.services import metrics
+from tgbot.services.executors import MonitoredExecutor
+
+# Set by configure() from the config loaded in bot.py, the pool is created on first use
+_db_config: Optional[DbConfig] = None
+_pool: Optional["ConnectionPool"] = None
+_pool_lock = threading.Lock()
+
+
+def configure(db_config: DbConfig):
+    """Set the DB settings. No connection is opened until the first query."""
+    global _db_config, _pool
+    with _pool_lock:
+        old_pool, _pool = _pool, None
+        _db_config = db_config
+    if old_pool is not None:
+        old_pool.close()
+
+
+def connection_string() -> str:
+    if _db_config is None:
+        raise RuntimeError("База данных не настроена, вызовите db.configure()")
+    return f"""
+    DRIVER={{ODBC Driver 17 for SQL Server}};
+    SERVER={_db_config.host};
+    DATABASE={_db_config.database};
+    UID={_db_config.user};
+    PWD={_db_config.password};
+    """
 
-import pyodbc
 
-from tgbot.config import load_config
+class PoolTimeout(Exception):
+    """No connection became available within the checkout timeout."""
 
-config = load_config(".env")
 
-connection_string = f"""
-    DRIVER={{ODBC Driver 17 for SQL Server}};
-    SERVER={config.db.host};
-    DATABASE={config.db.database};
-    UID={config.db.user};
-    PWD={config.db.password};
+class ConnectionPool:
     """
+    Thread-safe pool of pyodbc connections.
 
-conn = pyodbc.connect(connection_string)
+    Every connection is used by one thread at a time. Connections idle for
+    longer than `check_after` seconds are pinged on checkout, broken or too
+    old connections are closed and replaced.
 
+    Nothing is opened before the first checkout. Whenever a checkout has to
+    open a connection, a background thread opens more until `min_size` are
+    open, and idle connections are never pruned below `min_size`.
+    """
 
-def is_admin(user_id: int):
-    cursor = conn.cursor()
+    def __init__(
+        self,
+        dsn: str,
+        min_size: int = 1,
+        max_size: int = 5,
+        timeout: float = 10,
+        max_lifetime: float = 3600,
+        max_idle: float = 600,
+        check_after: float = 30,
+    ):
+        self.dsn = dsn
+        self.min_size = min_size
+        self.max_size = max_size
+        self.timeout = timeout
+        self.max_lifetime = max_lifetime
+        self.max_idle = max_idle
+        self.check_after = check_after
+
+        self._cond = threading.Condition()
+        # Idle connections as (connection, released_at), last released on the right
+        self._idle = deque()
+        self._created_at = {}
+        self._size = 0
+        self._waiting = 0
+        self._warming = False
+
+        self._stats = {
+            "checkouts": 0,
+            "waits": 0,
+            "wait_time_total": 0.0,
+            "wait_time_max": 0.0,
+            "timeouts": 0,
+            "recycled": 0,
+        }
+
+    def _connect(self):
+        # Imported on first use, so the bot starts even without the ODBC driver
+        import pyodbc
+
+        conn = pyodbc.connect(self.dsn)
+        self._created_at[id(conn)] = time.monotonic()
+        return conn
+
+    @staticmethod
+    def _is_healthy(conn) -> bool:
+        try:
+            cursor = conn.cursor()
+            cursor.execute("SELECT 1")
+            cursor.fetchone()
+            cursor.close()
+            return True
+        except Exception:
+            return False
+
+    def _discard(self, conn):
+        """Close a connection and free its slot. Must be called without the lock."""
+        self._created_at.pop(id(conn), None)
+        try:
+            conn.close()
+        except Exception:
+            pass
+        with self._cond:
+            self._size -= 1
+            self._stats["recycled"] += 1
+            self._cond.notify()
+
+    def _prune(self):
+        """Close connections above min_size that were idle for too long."""
+        expired = []
+        with self._cond:
+            now = time.monotonic()
+            while len(self._idle) > self.min_size and now - self._idle[0][1] > self.max_idle:
+                expired.append(self._idle.popleft()[0])
+        for conn in expired:
+            self._discard(conn)
+
+    def _warm(self):
+        """Open idle connections until min_size are open. Runs in its own thread."""
+        try:
+            while True:
+                with self._cond:
+                    if self._size >= self.min_size:
+                        return
+                    self._size += 1
+                try:
+                    conn = self._connect()
+                except Exception:
+                    with self._cond:
+                        self._size -= 1
+                        self._cond.notify()
+                    return
+                with self._cond:
+                    self._idle.appendleft((conn, time.monotonic()))
+                    self._cond.notify()
+        finally:
+            with self._cond:
+                self._warming = False
+
+    def _start_warming(self):
+        with self._cond:
+            if self._warming or self._size >= self.min_size:
+                return
+            self._warming = True
+        threading.Thread(target=self._warm, name="db-pool-warm", daemon=True).start()
+
+    def acquire(self, timeout: float = None):
+        """Take a connection from the pool, opening a new one if allowed."""
+        timeout = self.timeout if timeout is None else timeout
+        started = time.monotonic()
+        deadline = started + timeout
+        self._prune()
+
+        while True:
+            conn = None
+            released_at = None
+            create = False
+            with self._cond:
+                while True:
+                    if self._idle:
+                        conn, released_at = self._idle.pop()
+                        break
+                    if self._size < self.max_size:
+                        self._size += 1
+                        create = True
+                        break
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        self._stats["timeouts"] += 1
+                        raise PoolTimeout(f"Нет свободного соединения с БД за {timeout} сек.")
+                    self._waiting += 1
+                    try:
+                        self._cond.wait(remaining)
+                    finally:
+                        self._waiting -= 1
+
+            if create:
+                try:
+                    conn = self._connect()
+                except Exception:
+                    with self._cond:
+                        self._size -= 1
+                        self._cond.notify()
+                    raise
+                self._start_warming()
+            else:
+                now = time.monotonic()
+                too_old = now - self._created_at.get(id(conn), now) > self.max_lifetime
+                if too_old or (now - released_at > self.check_after and not self._is_healthy(conn)):
+                    self._discard(conn)
+                    continue
+
+            waited = time.monotonic() - started
+            with self._cond:
+                self._stats["checkouts"] += 1
+                self._stats["wait_time_total"] += waited
+                self._stats["wait_time_max"] = max(self._stats["wait_time_max"], waited)
+                if waited > 0.001:
+                    self._stats["waits"] += 1
+            metrics.DB_POOL_WAIT.observe(waited)
+            return conn
+
+    def release(self, conn, broken: bool = False):
+        """Return a connection to the pool, or close it if it is broken."""
+        if not broken:
+            try:
+                # End the implicit transaction left by reads
+                conn.rollback()
+            except Exception:
+                broken = True
+
+        if broken:
+            self._discard(conn)
+            return
 
+        with self._cond:
+            self._idle.append((conn, time.monotonic()))
+            self._cond.notify()
+
+    @contextmanager
+    def connection(self, timeout: float = None):
+        """Check out a connection for the duration of the block."""
+        import pyodbc
+
+        conn = self.acquire(timeout)
+        broken = False
+        try:
+            yield conn
+        except pyodbc.Error:
+            # Statement errors leave the connection usable, link failures do not
+            broken = not self._is_healthy(conn)
+            raise
+        finally:
+            self.release(conn, broken)
+
+    def stats(self) -> dict:
+        """Pool usage counters, including time spent waiting for a connection."""
+        with self._cond:
+            return {
+                **self._stats,
+                "size": self._size,
+                "idle": len(self._idle),
+                "in_use": self._size - len(self._idle),
+                "waiting": self._waiting,
+            }
+
+    def close(self):
+        """Close all idle connections."""
+        with self._cond:
+            idle, self._idle = list(self._idle), deque()
+        for conn, _ in idle:
+            self._discard(conn)
+
+
+def get_pool() -> ConnectionPool:
+    """The connection pool, created on first use."""
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ConnectionPool(
+                connection_string(),
+                min_size=_db_config.pool_min_size,
+                max_size=_db_config.pool_max_size,
+                timeout=_db_config.pool_timeout,
+            )
+        return _pool
+
+
+def pool_stat(name: str) -> float:
+    """Pool counter for metrics, 0 while the pool does not exist"""
+    return _pool.stats()[name] if _pool is not None else 0
+
+
+metrics.DB_POOL_WAITING.set_function(lambda: pool_stat("waiting"))
+metrics.DB_POOL_IN_USE.set_function(lambda: pool_stat("in_use"))
+
+
+def is_admin(user_id: int):
     query = """
             SELECT Role
             FROM dbo.RegisteredUsers
             WHERE ChatId = ?
             """
 
-    cursor.execute(query, (user_id,))
-    user_role = cursor.fetchone()
-    cursor.close()
+    with get_pool().connection() as conn, metrics.DB_QUERY_DURATION.time(query="is_admin"):
+        cursor = conn.cursor()
+        cursor.execute(query, (user_id,))
+        user_role = cursor.fetchone()
+        cursor.close()
 
     if user_role and user_role[0] == 10:
         return True
@@ -38,31 +311,73 @@ def is_admin(user_id: int):
         return False
 
 
-async def run_procedure(procedure: str) -> Tuple[bool, str]:
-    """
-    Execute a stored procedure asynchronously with proper error handling.
+def get_admin_ids() -> Set[int]:
+    """Get chat ids of all users with the admin role."""
+    query = """
+            SELECT ChatId
+            FROM dbo.RegisteredUsers
+            WHERE Role = 10
+            """
 
-    Args:
-        procedure (str): Name of the procedure to execute
+    with get_pool().connection() as conn, metrics.DB_QUERY_DURATION.time(query="get_admin_ids"):
+        cursor = conn.cursor()
+        cursor.execute(query)
+        admin_ids = {row[0] for row in cursor.fetchall()}
+        cursor.close()
 
-    Returns:
-        Tuple[bool, str]: (success, message)
+    return admin_ids
+
+
+class ProcedureRun:
+    """
+    One stored procedure call on its own connection, outside of the pool.
+
+    Heavy procedures would otherwise hold a pooled connection for minutes.
+    `timeout` is passed to the driver as the query timeout; cancel() may be
+    called from another thread and aborts the running statement.
     """
 
-    def _execute_procedure():
-        """Execute procedure in a separate thread"""
-        cursor = None
+    def __init__(self, procedure: str, timeout: float = None):
+        self.procedure = procedure
+        self.timeout = timeout
+        self._cursor = None
+        self._cancelled = False
+
+    def cancel(self):
+        self._cancelled = True
+        cursor = self._cursor
+        if cursor is not None:
+            try:
+                cursor.cancel()
+            except Exception:
+                pass
+
+    def execute(self) -> Tuple[bool, str]:
+        """Run the procedure in the calling thread."""
+        import pyodbc
+
+        procedure = self.procedure
         try:
-            cursor = conn.cursor()
+            conn = pyodbc.connect(connection_string())
+        except Exception as e:
+            return False, f"Ошибка выполнения процедуры {procedure}: {str(e)}"
+
+        try:
+            if self.timeout:
+                # 0 means no timeout for pyodbc, so never round down to it
+                conn.timeout = max(1, math.ceil(self.timeout))
+            self._cursor = conn.cursor()
+            if self._cancelled:
+                return False, f"Процедура {procedure} отменена"
 
             # Execute the procedure
-            cursor.execute(f"EXEC {procedure}")
+            self._cursor.execute(f"EXEC {procedure}")
 
             # Commit the transaction
             conn.commit()
 
             # Get affected rows count if available
-            rowcount = cursor.rowcount if hasattr(cursor, 'rowcount') else 0
+            rowcount = self._cursor.rowcount if hasattr(self._cursor, 'rowcount') else 0
 
             return True, f"Процедура {procedure} выполнена успешно. Обработано записей: {rowcount}"
 
@@ -70,9 +385,12 @@ async def run_procedure(procedure: str) -> Tuple[bool, str]:
             # Rollback transaction on error
             try:
                 conn.rollback()
-            except:
+            except Exception:
                 pass
 
+            if self._cancelled:
+                return False, f"Процедура {procedure} отменена"
+
             error_msg = str(e)
             if hasattr(e, 'args') and len(e.args) > 1:
                 error_msg = e.args[1] if e.args[1] else str(e)
@@ -83,25 +401,64 @@ async def run_procedure(procedure: str) -> Tuple[bool, str]:
             # Rollback transaction on any other error
             try:
                 conn.rollback()
-            except:
+            except Exception:
                 pass
 
             return False, f"Неожиданная ошибка при выполнении процедуры {procedure}: {str(e)}"
 
         finally:
+            cursor, self._cursor = self._cursor, None
             if cursor:
                 try:
                     cursor.close()
-                except:
+                except Exception:
                     pass
+            try:
+                conn.close()
+            except Exception:
+                pass
+
+
+# Threads for stored procedures, so that they never occupy the default executor
+procedure_executor = MonitoredExecutor("procedure", max_workers=3)
+
+
+async def run_procedure(procedure: str, timeout: float = None) -> Tuple[bool, str]:
+    """
+    Execute a stored procedure asynchronously on a dedicated connection.
 
-    # Run the procedure in a thread pool to avoid blocking the event loop
-    loop = asyncio.get_event_loop()
+    Args:
+        procedure (str): Name of the procedure to execute
+        timeout (float): Seconds after which the procedure is cancelled
+
+    Returns:
+        Tuple[bool, str]: (success, message)
+
+    Cancelling the awaiting task cancels the statement on the server.
+    """
+    run = ProcedureRun(procedure, timeout)
+    loop = asyncio.get_running_loop()
+    future = loop.run_in_executor(procedure_executor, run.execute)
+    started = time.perf_counter()
     try:
-        success, message = await loop.run_in_executor(None, _execute_procedure)
-        return success, message
+        success, message = await asyncio.wait_for(asyncio.shield(future), timeout)
+    except asyncio.TimeoutError:
+        run.cancel()
+        await asyncio.wait([future])
+        success, message = False, f"Процедура {procedure} прервана по таймауту ({timeout:.0f} сек.)"
+    except asyncio.CancelledError:
+        run.cancel()
+        metrics.DB_PROCEDURE_DURATION.observe(
+            time.perf_counter() - started, procedure=procedure, result="cancelled"
+        )
+        raise
     except Exception as e:
-        return False, f"Ошибка выполнения в потоке: {str(e)}"
+        success, message = False, f"Ошибка выполнения в потоке: {str(e)}"
+
+    metrics.DB_PROCEDURE_DURATION.observe(
+        time.perf_counter() - started, procedure=procedure, result="success" if success else "error"
+    )
+    return success, message
 
 
 def get_connection_status() -> Tuple[bool, str]:
@@ -112,90 +469,68 @@ def get_connection_status() -> Tuple[bool, str]:
         Tuple[bool, str]: (is_connected, message)
     """
     try:
-        cursor = conn.cursor()
-        cursor.execute("SELECT 1")
-        cursor.fetchone()
-        cursor.close()
+        with get_pool().connection() as conn, metrics.DB_QUERY_DURATION.time(query="connection_status"):
+            cursor = conn.cursor()
+            cursor.execute("SELECT 1")
+            cursor.fetchone()
+            cursor.close()
         return True, "Соединение с базой данных активно"
     except Exception as e:
         return False, f"Ошибка соединения с БД: {str(e)}"
 
 
-async def check_kpi_data_completeness() -> Tuple[bool, List[str]]:
+def get_kpi_divisions(dates: List[str]) -> Dict[str, Set[str]]:
     """
-    Check KPI data completeness for current date.
+    Get divisions that have KPI rows, per date, with one grouped query.
 
-    Excludes divisions: НЦК2Д, НЦК2Н, НЦК2М
-    Checks if all remaining 9 divisions have data for current date.
+    Args:
+        dates (List[str]): Dates in DD.MM.YYYY format (matching the DATA column)
 
     Returns:
-        Tuple[bool, List[str]]: (all_complete, missing_divisions)
-        - True if all 9 expected divisions have data for current date
-        - List of division names that are missing data for current date
+        Dict[str, Set[str]]: date -> divisions with data, every requested date is present
     """
+    found = {data: set() for data in dates}
+    if not dates:
+        return found
+
+    placeholders = ", ".join("?" for _ in dates)
+    query = f"""
+            SELECT DATA, Division
+            FROM [STPMain].[dbo].[KPIROW]
+            WHERE DATA IN ({placeholders})
+            GROUP BY DATA, Division
+            """
 
-    def _execute_check():
-        """Execute the KPI check in a separate thread"""
-        cursor = None
-        try:
-            conn = pyodbc.connect(connection_string)
-            cursor = conn.cursor()
-
-            # Get current date in DD.MM.YYYY format (matching your data format)
-            current_date = datetime.now().strftime("%d.%m.%Y")
+    with get_pool().connection() as conn, metrics.DB_QUERY_DURATION.time(query="kpi_divisions"):
+        cursor = conn.cursor()
+        cursor.execute(query, dates)
+        rows = cursor.fetchall()
+        cursor.close()
 
-            # Expected divisions (all divisions except excluded ones)
-            expected_divisions = [
-                'НТП1Д', 'НТП1М', 'НТП1Н',
-                'НТП2Д', 'НТП2М', 'НТП2Н',
-                'НЦК1Д', 'НЦК1М', 'НЦК1Н'
-            ]
+    for data, division in rows:
+        found.setdefault(str(data), set()).add(division)
+    return found
 
-            # Get divisions that have data for current date
-            query = """
-                    SELECT DISTINCT Division
-                    FROM [STPMain].[dbo].[KPIROW]
-                    WHERE DATA = ?
-                      AND Division NOT IN ('НЦК2Д' \
-                        , 'НЦК2Н' \
-                        , 'НЦК2М') \
-                    """
 
-            cursor.execute(query, (current_date,))
-            found_divisions = [row[0] for row in cursor.fetchall()]
+# Table name from the config, optionally with schema and database: [db.]schema.table
+TABLE_NAME = re.compile(r"^[A-Za-z_][A-Za-z0-9_]*(\.[A-Za-z_][A-Za-z0-9_]*){0,2}$")
 
-            # Find missing divisions
-            missing_divisions = [div for div in expected_divisions if div not in found_divisions]
 
-            return len(missing_divisions) == 0, missing_divisions
+def quote_table(table: str) -> str:
+    """Quote a configured table name with [], raising ValueError for anything but plain identifiers."""
+    if not TABLE_NAME.match(table):
+        raise ValueError(f"Invalid table name: {table!r}")
+    return ".".join(f"[{part}]" for part in table.split("."))
 
-        except Exception as e:
-            # Return False and empty list on any error
-            return False, []
 
-        finally:
-            if cursor:
-                try:
-                    cursor.close()
-                except:
-                    pass
-            try:
-                conn.close()
-            except:
-                pass
+def get_reference_divisions(table: str) -> Set[str]:
+    """Get all divisions listed in a reference table with a Division column."""
+    query = f"SELECT DISTINCT Division FROM {quote_table(table)}"
 
-    # Run the check in a thread pool to avoid blocking the event loop
-    loop = asyncio.get_event_loop()
-    try:
-        all_complete, wrong_divisions = await loop.run_in_executor(None, _execute_check)
-        return all_complete, wrong_divisions
-    except Exception as e:
-        return False, []
+    with get_pool().connection() as conn, metrics.DB_QUERY_DURATION.time(query="reference_divisions"):
+        cursor = conn.cursor()
+        cursor.execute(query)
+        divisions = {row[0] for row in cursor.fetchall()}
+        cursor.close()
 
-    # Run the check in a thread pool to avoid blocking the event loop
-    loop = asyncio.get_event_loop()
-    try:
-        all_complete, wrong_divisions = await loop.run_in_executor(None, _execute_check)
-        return all_complete, wrong_divisions
-    except Exception as e:
-        return False, []
\ No newline at end of file
+    return divisions
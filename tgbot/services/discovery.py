@@ -0,0 +1,214 @@
+import asyncio
+import fnmatch
+import json
+import logging
+import os
+import zlib
+from typing import Awaitable, Callable, Dict, List, Optional, Set, Tuple
+
+from tgbot.services.checker import COMMAND_TIMEOUT, ServiceChecker, checker, run_command
+
+# Units monitored when there is no units file
+DEFAULT_UNITS = [
+    {"unit": "adaptive.service", "display_name": "👶🏻 Адаптационки"},
+    {"unit": "achievmentbot.service", "display_name": "🏆 НТП Ачивер"},
+    {"unit": "nckachievenmentbot.service", "display_name": "🏆 НЦК Ачивер"},
+    {"unit": "ntposchedule.service", "display_name": "🕞 НТП График"},
+    {"unit": "nckschedule.service", "display_name": "🕞 НЦК График"},
+    {"unit": "gifter.service", "display_name": "🎁 Гифтер"},
+    {"unit": "nckteach.service", "display_name": "🎓 NCKTeach"},
+]
+
+# Seconds between two discovery runs
+REFRESH_INTERVAL = 300
+
+logger = logging.getLogger(__name__)
+
+
+def is_pattern(unit: str) -> bool:
+    return any(char in unit for char in "*?[")
+
+
+def default_display_name(unit: str) -> str:
+    """Display name of a unit matched by a pattern: its name without the suffix."""
+    return unit[:-len(".service")] if unit.endswith(".service") else unit
+
+
+def parse_list_units(output: str) -> List[str]:
+    """Get unit names from `systemctl list-units --output=json` output. Raises ValueError on invalid output."""
+    units = json.loads(output)
+    if not isinstance(units, list):
+        raise ValueError(f"Unexpected systemctl list-units output: {output[:100]!r}")
+    return [unit["unit"] for unit in units if isinstance(unit, dict) and unit.get("unit")]
+
+
+def resolve_units(rules: List[Dict], exclude: List[str],
+                  listed: List[str]) -> Tuple[Dict[str, str], Dict[str, str], Set[str]]:
+    """
+    Expand unit rules into ordered mappings of unit name to display name and to group,
+    and the set of units opted in to automatic restarts.
+
+    Exact names are kept even if systemd does not know them, so that a missing
+    unit shows up as not found. Pattern matches come from `listed` and are
+    sorted per rule. A display name, group or remediate flag given for an exact
+    name wins over the ones of a pattern match.
+    """
+    display_names: Dict[str, str] = {}
+    groups: Dict[str, str] = {}
+    remediated: Set[str] = set()
+    remediate_exact: Dict[str, bool] = {}
+    for rule in rules:
+        unit = rule["unit"]
+        if is_pattern(unit):
+            for name in sorted(name for name in listed if fnmatch.fnmatchcase(name, unit)):
+                display_names.setdefault(name, default_display_name(name))
+                if rule.get("group"):
+                    groups.setdefault(name, rule["group"])
+                if rule.get("remediate"):
+                    remediated.add(name)
+        else:
+            if rule.get("display_name"):
+                display_names[unit] = rule["display_name"]
+            else:
+                display_names.setdefault(unit, default_display_name(unit))
+            if rule.get("group"):
+                groups[unit] = rule["group"]
+            if "remediate" in rule:
+                remediate_exact[unit] = bool(rule["remediate"])
+
+    remediated.update(unit for unit, remediate in remediate_exact.items() if remediate)
+    remediated.difference_update(unit for unit, remediate in remediate_exact.items() if not remediate)
+    excluded = {name for name in display_names if any(fnmatch.fnmatchcase(name, pattern) for pattern in exclude)}
+    return (
+        {name: display_name for name, display_name in display_names.items() if name not in excluded},
+        {name: group for name, group in groups.items() if name not in excluded},
+        remediated - excluded,
+    )
+
+
+class UnitDiscovery:
+    """
+    Set of monitored units, built from the units file.
+
+    The file holds exact unit names and glob patterns such as `*bot.service`.
+    All patterns are resolved with one `systemctl list-units` call. The result
+    is cached until the next refresh() and applied to the checker in place, so
+    the snapshot, handlers and scheduler see the new set right away. Display
+    names are computed once per refresh.
+    """
+
+    def __init__(self, checker: ServiceChecker, path: str = "units.json", timeout: float = COMMAND_TIMEOUT):
+        self.checker = checker
+        self.path = path
+        self.timeout = timeout
+
+        # Awaited with (added, removed) unit lists after a refresh changed the set
+        self.on_change: List[Callable[[List[str], List[str]], Awaitable]] = []
+
+        self.display_names: Dict[str, str] = {}
+        self.groups: Dict[str, str] = {}
+        self.group_names: List[str] = []
+        # Units restarted automatically when they fail, see tgbot.services.remediation
+        self.remediated: Set[str] = set()
+        # Position of each unit in `units`, used as its id in callback data
+        self.indexes: Dict[str, int] = {}
+        # Checksum of the unit list; callback data from another version is stale
+        self.version = ""
+        self._task: Optional[asyncio.Task] = None
+        self.apply(*resolve_units(DEFAULT_UNITS, [], []))
+
+    @property
+    def units(self) -> List[str]:
+        return self.checker.services
+
+    def display_name(self, unit: str) -> str:
+        return self.display_names.get(unit, unit)
+
+    def __contains__(self, unit: str) -> bool:
+        return unit in self.display_names
+
+    def unit_at(self, index: int, version: str) -> Optional[str]:
+        """Resolve a unit index from callback data, None if the unit list has changed since."""
+        if version != self.version or not 0 <= index < len(self.units):
+            return None
+        return self.units[index]
+
+    def load_rules(self):
+        """Read unit rules and exclusions from the units file."""
+        if not os.path.exists(self.path):
+            return DEFAULT_UNITS, []
+
+        with open(self.path, encoding="utf-8") as f:
+            data = json.load(f)
+
+        # A plain list is a list of rules without exclusions
+        if isinstance(data, list):
+            data = {"units": data}
+        rules = [{"unit": rule} if isinstance(rule, str) else rule for rule in data.get("units", [])]
+        return rules, data.get("exclude", [])
+
+    async def list_units(self, patterns: List[str]) -> List[str]:
+        """Get names of units matching the patterns in one systemctl call. Raises if systemctl fails."""
+        returncode, stdout, stderr = await run_command(
+            ["systemctl", "list-units", "--all", "--type=service", "--output=json", "--no-pager", *patterns],
+            self.timeout,
+        )
+        # An empty list here would drop every unit matched by a pattern
+        if returncode != 0:
+            raise RuntimeError(stderr.strip() or f"systemctl list-units exited with code {returncode}")
+        return parse_list_units(stdout)
+
+    def apply(self, display_names: Dict[str, str], groups: Dict[str, str] = None, remediated: Set[str] = None):
+        """Replace the monitored set; the checker's list is updated in place."""
+        groups = groups or {}
+        self.display_names = display_names
+        self.groups = groups
+        self.remediated = remediated or set()
+        self.group_names = list(dict.fromkeys(groups[unit] for unit in display_names if unit in groups))
+        self.indexes = {unit: i for i, unit in enumerate(display_names)}
+        self.version = format(zlib.crc32("\n".join(display_names).encode()), "08x")
+        self.checker.services[:] = list(display_names)
+        self.checker.display_names = display_names
+
+    async def refresh(self) -> bool:
+        """Discover units again. Returns True if the monitored set changed."""
+        try:
+            rules, exclude = self.load_rules()
+            patterns = [rule["unit"] for rule in rules if is_pattern(rule["unit"])]
+            listed = await self.list_units(patterns) if patterns else []
+        except Exception:
+            # Keep monitoring the previous set
+            logger.exception(f"Unit discovery failed, keeping {len(self.units)} units")
+            return False
+
+        display_names, groups, remediated = resolve_units(rules, exclude, listed)
+        previous = list(self.units)
+        self.apply(display_names, groups, remediated)
+
+        previous_set = set(previous)
+        added = [unit for unit in display_names if unit not in previous_set]
+        removed = [unit for unit in previous if unit not in display_names]
+        if not added and not removed:
+            return False
+
+        logger.info(f"Monitored units changed: +{len(added)} -{len(removed)}, {len(display_names)} total")
+        for callback in self.on_change:
+            try:
+                await callback(added, removed)
+            except Exception:
+                logger.exception("Unit discovery callback failed")
+        return True
+
+    async def run(self, interval: float = REFRESH_INTERVAL):
+        """Refresh periodically forever."""
+        while True:
+            await asyncio.sleep(interval)
+            await self.refresh()
+
+    def start(self, interval: float = REFRESH_INTERVAL):
+        """Start periodic refresh in a background task."""
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self.run(interval))
+
+
+discovery = UnitDiscovery(checker)
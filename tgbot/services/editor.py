@@ -0,0 +1,99 @@
+import asyncio
+import hashlib
+from collections import OrderedDict
+from typing import Awaitable, Callable, Dict, Optional, Tuple
+
+from aiogram import Bot
+from aiogram.exceptions import TelegramBadRequest
+from aiogram.types import CallbackQuery, InlineKeyboardMarkup
+
+# Messages whose last content is remembered
+MAX_TRACKED_MESSAGES = 1000
+
+MessageKey = Tuple[int, int]
+
+
+def content_hash(text: str, reply_markup: Optional[InlineKeyboardMarkup]) -> str:
+    markup = reply_markup.model_dump_json(exclude_none=True) if reply_markup else ""
+    return hashlib.blake2b(f"{text}\0{markup}".encode(), digest_size=16).hexdigest()
+
+
+class EditCoordinator:
+    """
+    Single path for editing bot messages.
+
+    edit() skips a request whose text and keyboard are the same as the last
+    content sent to that message. run() coalesces rapid callbacks on one
+    message: while a render for it is running, newer presses wait and only
+    the latest of them is rendered, the ones in between are dropped.
+    """
+
+    def __init__(self, max_tracked: int = MAX_TRACKED_MESSAGES):
+        self.max_tracked = max_tracked
+        self._hashes: "OrderedDict[MessageKey, str]" = OrderedDict()
+        self._locks: Dict[MessageKey, asyncio.Lock] = {}
+        self._tickets: Dict[MessageKey, int] = {}
+
+    def _remember(self, key: MessageKey, digest: str):
+        self._hashes[key] = digest
+        self._hashes.move_to_end(key)
+        while len(self._hashes) > self.max_tracked:
+            self._hashes.popitem(last=False)
+
+    async def edit(
+        self,
+        bot: Bot,
+        chat_id: int,
+        message_id: int,
+        text: str,
+        reply_markup: InlineKeyboardMarkup = None,
+        parse_mode: Optional[str] = "HTML",
+    ) -> bool:
+        """Edit a message unless it already shows this content. Returns True if a request was sent."""
+        key = (chat_id, message_id)
+        digest = content_hash(text, reply_markup)
+        if self._hashes.get(key) == digest:
+            return False
+
+        try:
+            await bot.edit_message_text(
+                text, chat_id=chat_id, message_id=message_id, reply_markup=reply_markup, parse_mode=parse_mode
+            )
+        except TelegramBadRequest as e:
+            # Edited to the same content outside of the coordinator
+            if "message is not modified" not in str(e):
+                raise
+        self._remember(key, digest)
+        return True
+
+    async def edit_callback(
+        self,
+        callback: CallbackQuery,
+        text: str,
+        reply_markup: InlineKeyboardMarkup = None,
+        parse_mode: Optional[str] = "HTML",
+    ) -> bool:
+        """Edit the message a callback button belongs to."""
+        message = callback.message
+        return await self.edit(callback.bot, message.chat.id, message.message_id, text, reply_markup, parse_mode)
+
+    async def run(self, callback: CallbackQuery, render: Callable[[], Awaitable]) -> bool:
+        """Render for a callback unless a newer callback on the same message supersedes it."""
+        key = (callback.message.chat.id, callback.message.message_id)
+        ticket = self._tickets[key] = self._tickets.get(key, 0) + 1
+        lock = self._locks.setdefault(key, asyncio.Lock())
+
+        try:
+            async with lock:
+                if self._tickets[key] != ticket:
+                    return False
+                await render()
+                return True
+        finally:
+            # The last request of a burst cleans up
+            if self._tickets.get(key) == ticket and not lock.locked():
+                self._locks.pop(key, None)
+                self._tickets.pop(key, None)
+
+
+editor = EditCoordinator()
@@ -0,0 +1,35 @@
+from concurrent.futures import Future, ThreadPoolExecutor
+
+from tgbot.services import metrics
+
+
+class MonitoredExecutor(ThreadPoolExecutor):
+    """
+    ThreadPoolExecutor that exports the number of tasks waiting for a free thread.
+
+    The count is kept in submit() and when a task starts, so it does not
+    depend on the executor internals. `name` labels the metric and the threads.
+    """
+
+    def __init__(self, name: str, max_workers: int = None):
+        super().__init__(max_workers=max_workers, thread_name_prefix=name)
+        self.name = name
+        metrics.EXECUTOR_QUEUED.set(0, executor=name)
+
+    def submit(self, fn, /, *args, **kwargs) -> Future:
+        def run():
+            metrics.EXECUTOR_QUEUED.dec(executor=self.name)
+            return fn(*args, **kwargs)
+
+        metrics.EXECUTOR_QUEUED.inc(executor=self.name)
+        try:
+            future = super().submit(run)
+        except Exception:
+            metrics.EXECUTOR_QUEUED.dec(executor=self.name)
+            raise
+
+        # A task cancelled before it started never runs
+        future.add_done_callback(
+            lambda done: metrics.EXECUTOR_QUEUED.dec(executor=self.name) if done.cancelled() else None
+        )
+        return future
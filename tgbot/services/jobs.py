@@ -0,0 +1,156 @@
+import asyncio
+import html
+import logging
+import time
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Tuple
+
+from aiogram import Bot
+from aiogram.exceptions import TelegramAPIError, TelegramRetryAfter
+from aiogram.types import InlineKeyboardMarkup
+
+from tgbot.services.broadcaster import broadcast
+from tgbot.services.db import run_procedure
+from tgbot.services.editor import editor
+
+# Seconds after which a procedure is cancelled
+JOB_TIMEOUT = 1800
+
+# Min seconds between two progress edits of the same message
+PROGRESS_INTERVAL = 10
+
+logger = logging.getLogger(__name__)
+
+
+def format_elapsed(seconds: float) -> str:
+    minutes, seconds = divmod(int(seconds), 60)
+    return f"{minutes}:{seconds:02d}"
+
+
+@dataclass
+class Job:
+    """A running stored procedure and the messages that follow it."""
+
+    procedure: str
+    title: str
+    started_at: float = field(default_factory=time.monotonic)
+    # (chat_id, message_id) of the progress messages of everyone who requested the job
+    watchers: List[Tuple[int, int]] = field(default_factory=list)
+    progress_markup: Optional[InlineKeyboardMarkup] = None
+    done_markup: Optional[InlineKeyboardMarkup] = None
+    task: Optional[asyncio.Task] = None
+    result: Optional[Tuple[bool, str]] = None
+
+    @property
+    def elapsed(self) -> float:
+        return time.monotonic() - self.started_at
+
+
+class JobRunner:
+    """
+    Runs KPI stored procedures in the background.
+
+    submit() returns right away. A request for a procedure that is already
+    running joins that job instead of starting it twice. While a job runs,
+    its progress messages show the elapsed time, edited at most once per
+    `progress_interval` seconds. When it finishes, the messages show the
+    result and every requester gets a separate notification.
+    """
+
+    def __init__(self, timeout: float = JOB_TIMEOUT, progress_interval: float = PROGRESS_INTERVAL):
+        self.timeout = timeout
+        self.progress_interval = progress_interval
+        self.jobs: Dict[str, Job] = {}
+        # Telegram asked to slow down until this time
+        self._edits_paused_until = 0.0
+
+    def submit(self, bot: Bot, procedure: str, title: str, chat_id: int, message_id: int,
+               progress_markup: InlineKeyboardMarkup = None,
+               done_markup: InlineKeyboardMarkup = None) -> Tuple[Job, bool]:
+        """Start a procedure or join its running job. Returns the job and whether it was started."""
+        job = self.jobs.get(procedure)
+        if job is not None:
+            if (chat_id, message_id) not in job.watchers:
+                job.watchers.append((chat_id, message_id))
+            return job, False
+
+        job = self.jobs[procedure] = Job(procedure, title, watchers=[(chat_id, message_id)],
+                                         progress_markup=progress_markup, done_markup=done_markup)
+        job.task = asyncio.create_task(self._run(bot, job))
+        return job, True
+
+    def cancel(self, procedure: str) -> bool:
+        """Cancel a running job; the statement is cancelled on the server as well."""
+        job = self.jobs.get(procedure)
+        if job is None or job.task is None or job.task.done():
+            return False
+        job.task.cancel()
+        return True
+
+    def progress_text(self, job: Job) -> str:
+        return (
+            f"⏳ <b>Выполняется {job.title}</b>\n\n"
+            f"Прошло: {format_elapsed(job.elapsed)}\n"
+            f"Процедура может занять несколько минут, по завершении придет уведомление."
+        )
+
+    async def _edit(self, bot: Bot, job: Job, text: str, reply_markup: InlineKeyboardMarkup = None,
+                    final: bool = False):
+        """Edit all progress messages of a job. Progress edits are skipped during a flood wait, the final one waits."""
+        for chat_id, message_id in list(job.watchers):
+            while True:
+                delay = self._edits_paused_until - time.monotonic()
+                if delay > 0:
+                    if not final:
+                        return
+                    await asyncio.sleep(delay)
+                try:
+                    await editor.edit(bot, chat_id, message_id, text, reply_markup)
+                except TelegramRetryAfter as e:
+                    self._edits_paused_until = time.monotonic() + e.retry_after
+                    continue
+                except TelegramAPIError as e:
+                    logger.debug(f"Job {job.procedure}: edit of {chat_id}/{message_id} failed: {e}")
+                break
+
+    async def _progress(self, bot: Bot, job: Job):
+        while True:
+            await asyncio.sleep(self.progress_interval)
+            await self._edit(bot, job, self.progress_text(job), job.progress_markup)
+
+    async def _run(self, bot: Bot, job: Job):
+        progress = asyncio.create_task(self._progress(bot, job))
+        try:
+            job.result = await run_procedure(job.procedure, self.timeout)
+        except asyncio.CancelledError:
+            job.result = (False, "Процедура отменена")
+        except Exception as e:
+            logger.exception(f"Job {job.procedure} failed")
+            job.result = (False, str(e))
+        finally:
+            progress.cancel()
+            self.jobs.pop(job.procedure, None)
+
+        success, message = job.result
+        # Database errors may contain <, > and & that break the HTML message
+        message = html.escape(message) if message else message
+        if success:
+            text = (
+                "✅ <b>Процедура выполнена успешно!</b>\n\n"
+                f"Результат: {message if message else 'Операция завершена'}"
+            )
+        else:
+            text = (
+                "❌ <b>Ошибка выполнения процедуры</b>\n\n"
+                f"Детали: {message if message else 'Неизвестная ошибка'}"
+            )
+        text += f"\n\n⏱ Время выполнения: {format_elapsed(job.elapsed)}"
+
+        await self._edit(bot, job, text, job.done_markup, final=True)
+
+        # Edits do not notify, a new message does
+        chat_ids = list(dict.fromkeys(chat_id for chat_id, _ in job.watchers))
+        await broadcast(bot, chat_ids, f"{'✅' if success else '❌'} Завершено {job.title}")
+
+
+job_runner = JobRunner()
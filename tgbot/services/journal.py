@@ -0,0 +1,209 @@
+import asyncio
+import logging
+import time
+from collections import deque
+from typing import Awaitable, Callable, Dict, List, Optional
+
+from tgbot.services.checker import JOURNAL_FIELDS, STREAM_LIMIT, JournalEntry, journal_unit, json_loads, \
+    parse_journal_entry
+
+# Number of recent log messages kept in memory per unit
+FOLLOWER_BUFFER_SIZE = 50
+
+# Error alerts waiting for delivery, newer ones are dropped while the queue is full
+ALERT_QUEUE_SIZE = 100
+
+# Restart delays for a died journalctl process, in seconds
+RESTART_DELAY = 1
+MAX_RESTART_DELAY = 60
+
+logger = logging.getLogger(__name__)
+
+
+class JournalFollower:
+    """Follow the journal of all units with one long-running `journalctl -f`.
+
+    Entries are demultiplexed by unit into fixed-size ring buffers, so
+    recent logs can be read from memory instead of running journalctl on
+    every probe. `on_error(service_name, message)` is awaited for every new
+    error line by a separate task, so slow alert delivery never stops the
+    stream from being read.
+    """
+
+    def __init__(
+        self,
+        services: List[str],
+        buffer_size: int = FOLLOWER_BUFFER_SIZE,
+        on_error: Optional[Callable[[str, str], Awaitable]] = None,
+    ):
+        self.services = list(services)
+        self.buffer_size = buffer_size
+        self.on_error = on_error
+
+        self._buffers: Dict[str, deque] = {
+            service: deque(maxlen=buffer_size) for service in self.services
+        }
+        # Total lines written and drained per unit, used by drain()
+        self._written: Dict[str, int] = {service: 0 for service in self.services}
+        self._drained: Dict[str, int] = {service: 0 for service in self.services}
+
+        self._cursor: Optional[str] = None
+        self._started_at = time.time()
+        self._task: Optional[asyncio.Task] = None
+        self._process: Optional[asyncio.subprocess.Process] = None
+        # Set by set_services() when it stops journalctl to restart it with the new units
+        self._restart_requested = False
+
+        self._alerts: asyncio.Queue = asyncio.Queue(ALERT_QUEUE_SIZE)
+        self._alerts_task: Optional[asyncio.Task] = None
+        self.dropped_alerts = 0
+
+    def set_services(self, services: List[str]) -> None:
+        """Change the followed units; a running journalctl is restarted with the new set."""
+        self.services = list(services)
+        for service in self.services:
+            if service not in self._buffers:
+                self._buffers[service] = deque(maxlen=self.buffer_size)
+                self._written[service] = 0
+                self._drained[service] = 0
+        for service in set(self._buffers) - set(self.services):
+            del self._buffers[service], self._written[service], self._drained[service]
+
+        if self._process is not None and self._process.returncode is None:
+            self._restart_requested = True
+            self._process.kill()
+
+    def feed(self, line) -> Optional[Dict]:
+        """Parse one JSON line and store it in the buffer of its unit.
+
+        Returns a dict with `service`, `message` and `is_error`, or None if
+        the line is not an entry of a monitored unit.
+        """
+        line = line.strip()
+        if not line:
+            return None
+        try:
+            raw = json_loads(line)
+        except ValueError:
+            return None
+
+        if raw.get("__CURSOR"):
+            self._cursor = raw["__CURSOR"]
+
+        service_name = journal_unit(raw, self._buffers)
+        if service_name is None:
+            return None
+
+        entry = parse_journal_entry(raw, service_name)
+        self._buffers[service_name].append(entry)
+        self._written[service_name] += 1
+
+        # Backlog printed at startup is stored but does not raise alerts
+        is_error = entry.is_error and entry.timestamp >= self._started_at
+
+        return {"service": service_name, "message": entry.text, "is_error": is_error}
+
+    async def consume(self, stream) -> None:
+        """Read JSON lines from a stream until EOF."""
+        while True:
+            try:
+                line = await stream.readline()
+            except ValueError:
+                # Line longer than STREAM_LIMIT, the reader has dropped it
+                continue
+            if not line:
+                return
+
+            entry = self.feed(line)
+            if entry and entry["is_error"] and self.on_error:
+                try:
+                    self._alerts.put_nowait((entry["service"], entry["message"]))
+                except asyncio.QueueFull:
+                    self.dropped_alerts += 1
+                    logger.warning("Journal error alert dropped, delivery is behind", extra={"unit": entry["service"]})
+
+    async def deliver_alerts(self) -> None:
+        """Await on_error for queued error lines, one at a time."""
+        while True:
+            service_name, message = await self._alerts.get()
+            try:
+                await self.on_error(service_name, message)
+            except Exception:
+                logger.exception("Journal error callback failed", extra={"unit": service_name})
+
+    def drain(self, service_name: str) -> List[JournalEntry]:
+        """Get entries written since the previous drain of this unit."""
+        if service_name not in self._buffers:
+            return []
+
+        new = min(self._written[service_name] - self._drained[service_name], self.buffer_size)
+        self._drained[service_name] = self._written[service_name]
+        return list(self._buffers[service_name])[-new:] if new else []
+
+    async def _follow(self) -> None:
+        """Run journalctl once and consume its output until it exits."""
+        cmd = ["journalctl", "-f", "--output=json", f"--output-fields={','.join(JOURNAL_FIELDS)}", "--no-pager"]
+        # After a restart continue where the previous process stopped
+        if self._cursor:
+            cmd.append(f"--after-cursor={self._cursor}")
+        else:
+            cmd += ["-n", str(self.buffer_size)]
+        for service in self.services:
+            cmd += ["-u", service]
+
+        self._process = await asyncio.create_subprocess_exec(
+            *cmd,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.DEVNULL,
+            limit=STREAM_LIMIT,
+        )
+        try:
+            await self.consume(self._process.stdout)
+        finally:
+            if self._process.returncode is None:
+                self._process.kill()
+            await self._process.wait()
+
+    async def run(self) -> None:
+        """Follow the journal forever, restarting journalctl when it dies."""
+        delay = RESTART_DELAY
+        while True:
+            started = time.monotonic()
+            try:
+                await self._follow()
+                if self._restart_requested:
+                    # Stopped by set_services(), start again right away with the new units
+                    self._restart_requested = False
+                    delay = RESTART_DELAY
+                    continue
+                logger.warning("journalctl follower exited, restarting")
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception("journalctl follower failed, restarting")
+
+            # Reset the backoff if the process has been running for a while
+            if time.monotonic() - started > MAX_RESTART_DELAY:
+                delay = RESTART_DELAY
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, MAX_RESTART_DELAY)
+
+    def start(self) -> None:
+        """Start following in a background task."""
+        if self._task is None or self._task.done():
+            self._started_at = time.time()
+            self._task = asyncio.create_task(self.run())
+        if self.on_error and (self._alerts_task is None or self._alerts_task.done()):
+            self._alerts_task = asyncio.create_task(self.deliver_alerts())
+
+    async def stop(self) -> None:
+        """Stop the background tasks and the journalctl process."""
+        for task in (self._task, self._alerts_task):
+            if task is not None:
+                task.cancel()
+                try:
+                    await task
+                except asyncio.CancelledError:
+                    pass
+        self._task = None
+        self._alerts_task = None
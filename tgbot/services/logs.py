@@ -0,0 +1,135 @@
+import atexit
+import json
+import logging
+import queue
+import sys
+import time
+from contextvars import ContextVar
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener
+from typing import Dict, Optional, Tuple
+
+# Max records waiting for output, newer ones are dropped when the writer falls behind
+QUEUE_SIZE = 10000
+
+# Sampled records: at most SAMPLE_BURST per key every SAMPLE_INTERVAL seconds
+SAMPLE_BURST = 5
+SAMPLE_INTERVAL = 60
+
+# Set for the duration of an update by LogContextMiddleware
+update_id_var: ContextVar[Optional[int]] = ContextVar("update_id", default=None)
+handler_var: ContextVar[Optional[str]] = ContextVar("handler", default=None)
+
+# Record attributes written as separate JSON fields, passed with `extra=`
+FIELDS = ("update_id", "handler", "unit", "duration_ms", "suppressed")
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line with the structured fields of the record."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "time": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        for field in FIELDS:
+            value = getattr(record, field, None)
+            if value is not None:
+                entry[field] = value
+        if record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            entry["exc"] = record.exc_text
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class SampleFilter(logging.Filter):
+    """
+    Rate-limits records logged with `extra={"sample": key}`.
+
+    Every key passes at most `burst` records per `interval` seconds. The
+    first record let through after a drop carries the number of dropped
+    ones in `suppressed`. Records without a key and warnings pass always.
+    """
+
+    def __init__(self, burst: int = SAMPLE_BURST, interval: float = SAMPLE_INTERVAL):
+        super().__init__()
+        self.burst = burst
+        self.interval = interval
+        # key -> (window start, passed in window, dropped since last pass)
+        self._windows: Dict[str, Tuple[float, int, int]] = {}
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        key = getattr(record, "sample", None)
+        if key is None or record.levelno >= logging.WARNING:
+            return True
+
+        now = time.monotonic()
+        started, passed, dropped = self._windows.get(key, (now, 0, 0))
+        if now - started >= self.interval:
+            started, passed = now, 0
+        if passed >= self.burst:
+            self._windows[key] = (started, passed, dropped + 1)
+            return False
+
+        if dropped:
+            record.suppressed = dropped
+        self._windows[key] = (started, passed + 1, 0)
+        return True
+
+
+class ContextQueueHandler(QueueHandler):
+    """
+    Puts records on a queue for the listener thread, so logging never
+    waits for stdout or journald. The update context is attached here,
+    in the logging task, because the listener thread does not see it.
+    """
+
+    def __init__(self, log_queue: queue.Queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # Same process: the record is not pickled, only its message is frozen
+        record.msg = record.getMessage()
+        record.args = None
+        if getattr(record, "update_id", None) is None:
+            record.update_id = update_id_var.get()
+        if getattr(record, "handler", None) is None:
+            record.handler = handler_var.get()
+        return record
+
+    def enqueue(self, record: logging.LogRecord):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+def setup_queue_logging(level: int = logging.INFO, stream=None,
+                        sample_burst: int = SAMPLE_BURST, sample_interval: float = SAMPLE_INTERVAL) -> QueueListener:
+    """
+    Route all logging through a queue to a JSON stream handler in a separate thread.
+
+    Replaces the handlers of the root logger. The listener is stopped at exit,
+    writing out the records still in the queue.
+    """
+    log_queue = queue.Queue(QUEUE_SIZE)
+    queue_handler = ContextQueueHandler(log_queue)
+    queue_handler.addFilter(SampleFilter(sample_burst, sample_interval))
+
+    output = logging.StreamHandler(stream or sys.stdout)
+    output.setFormatter(JsonFormatter())
+
+    root = logging.getLogger()
+    for handler in root.handlers[:]:
+        root.removeHandler(handler)
+    root.addHandler(queue_handler)
+    root.setLevel(level)
+
+    listener = QueueListener(log_queue, output, respect_handler_level=True)
+    listener.start()
+    atexit.register(listener.stop)
+    return listener
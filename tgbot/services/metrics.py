@@ -0,0 +1,206 @@
+import functools
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, List, Sequence, Tuple
+
+# Histogram buckets in seconds, from fast subprocess calls to long KPI procedures
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 300)
+
+REGISTRY: List["Metric"] = []
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: Dict[str, str] = None) -> str:
+    pairs = list(zip(names, values)) + list((extra or {}).items())
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(str(value))}"' for name, value in pairs) + "}"
+
+
+class Metric:
+    """Base class for metrics in Prometheus text exposition format.
+
+    Values may be updated from executor threads, so every update takes a lock.
+    """
+
+    type = "untyped"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values: Dict[Tuple[str, ...], object] = {}
+        self._lock = threading.Lock()
+        REGISTRY.append(self)
+
+    def _key(self, labels: Dict[str, object]) -> Tuple[str, ...]:
+        return tuple(str(labels.get(name, "")) for name in self.labelnames)
+
+    def samples(self) -> List[str]:
+        raise NotImplementedError
+
+    def render(self) -> str:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.type}"]
+        lines += self.samples()
+        return "\n".join(lines)
+
+
+class Counter(Metric):
+    type = "counter"
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def samples(self) -> List[str]:
+        with self._lock:
+            items = list(self._values.items())
+        return [f"{self.name}{_format_labels(self.labelnames, key)} {value}" for key, value in items]
+
+
+class Gauge(Metric):
+    type = "gauge"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._function = None
+
+    def set(self, value: float, **labels):
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount: float = 1, **labels):
+        self.inc(-amount, **labels)
+
+    def set_function(self, function: Callable[[], float]):
+        """Compute the value on every scrape instead of storing it."""
+        self._function = function
+
+    def samples(self) -> List[str]:
+        if self._function is not None:
+            return [f"{self.name} {self._function()}"]
+        with self._lock:
+            items = list(self._values.items())
+        return [f"{self.name}{_format_labels(self.labelnames, key)} {value}" for key, value in items]
+
+
+class Histogram(Metric):
+    type = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            # Bucket counts are cumulative, as the exposition format expects
+            counts, total, count = self._values.get(key, ([0] * len(self.buckets), 0.0, 0))
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[i] += 1
+            self._values[key] = (counts, total + value, count + 1)
+
+    @contextmanager
+    def time(self, **labels):
+        """Observe the duration of the block, including failed runs."""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+    def samples(self) -> List[str]:
+        with self._lock:
+            items = [(key, list(counts), total, count) for key, (counts, total, count) in self._values.items()]
+
+        lines = []
+        for key, counts, total, count in items:
+            for bound, bucket_count in zip(self.buckets, counts):
+                lines.append(
+                    f"{self.name}_bucket{_format_labels(self.labelnames, key, {'le': str(bound)})} {bucket_count}"
+                )
+            lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, key, {'le': '+Inf'})} {count}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labelnames, key)} {total}")
+            lines.append(f"{self.name}_count{_format_labels(self.labelnames, key)} {count}")
+        return lines
+
+
+def timed(histogram: Histogram, **labels):
+    """Decorator observing the run time of a coroutine function."""
+
+    def decorator(func):
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs):
+            with histogram.time(**labels):
+                return await func(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+def render() -> str:
+    """Render all registered metrics."""
+    return "\n".join(metric.render() for metric in REGISTRY) + "\n"
+
+
+async def start_metrics_server(host: str, port: int):
+    """Serve /metrics over HTTP on the running event loop. Returns the aiohttp AppRunner."""
+    from aiohttp import web
+
+    async def metrics_handler(request: web.Request) -> web.Response:
+        return web.Response(text=render(), content_type="text/plain", charset="utf-8")
+
+    app = web.Application()
+    app.router.add_get("/metrics", metrics_handler)
+
+    runner = web.AppRunner(app)
+    await runner.setup()
+    await web.TCPSite(runner, host, port).start()
+    return runner
+
+
+# Service checker
+PROBE_DURATION = Histogram(
+    "checker_command_duration_seconds", "Duration of systemctl/journalctl calls.", ["command", "unit"]
+)
+PROBE_TIMEOUTS = Counter("checker_command_timeouts_total", "systemctl/journalctl calls that timed out.", ["command", "unit"])
+COMMANDS_WAITING = Gauge("checker_commands_waiting", "Commands waiting for a free subprocess slot.")
+COMMANDS_RUNNING = Gauge("checker_commands_running", "Commands currently running.")
+
+# Thread pools: "default" for run_in_executor(None, ...), "procedure" for stored procedures
+EXECUTOR_QUEUED = Gauge("executor_tasks_queued", "Tasks waiting for a free executor thread.", ["executor"])
+
+# Database
+DB_QUERY_DURATION = Histogram("db_query_duration_seconds", "Duration of DB queries.", ["query"])
+DB_PROCEDURE_DURATION = Histogram(
+    "db_procedure_duration_seconds", "Duration of stored procedure runs.", ["procedure", "result"]
+)
+DB_POOL_WAITING = Gauge("db_pool_waiting", "Threads waiting for a DB connection.")
+DB_POOL_IN_USE = Gauge("db_pool_in_use", "DB connections checked out.")
+DB_POOL_WAIT = Histogram("db_pool_wait_seconds", "Time spent waiting for a DB connection.")
+
+# Telegram
+TELEGRAM_SEND_DURATION = Histogram("telegram_send_duration_seconds", "Duration of bot.send_message calls.", ["result"])
+TELEGRAM_RETRY_AFTER = Counter("telegram_retry_after_total", "TelegramRetryAfter errors received.")
+
+# Scheduler
+JOB_DURATION = Histogram("scheduler_job_duration_seconds", "Run time of scheduler jobs.", ["job"])
+JOB_MISFIRES = Counter("scheduler_job_misfires_total", "Scheduler jobs that missed their run time.", ["job"])
+
+# Auto-remediation
+REMEDIATION_ATTEMPTS = Counter("remediation_attempts_total", "Automatic restarts of failed units.", ["unit", "result"])
+REMEDIATION_ESCALATIONS = Counter(
+    "remediation_escalations_total", "Failed units left to admins by auto-remediation.", ["unit", "reason"]
+)
@@ -0,0 +1,204 @@
+import asyncio
+import html
+import logging
+import time
+from collections import deque
+from dataclasses import dataclass, field
+from typing import Awaitable, Callable, Deque, Dict, List, Optional
+
+from tgbot.services import metrics
+from tgbot.services.actions import ServiceActions, service_actions
+from tgbot.services.checker import StatusSnapshot, snapshot
+from tgbot.services.discovery import UnitDiscovery, discovery
+
+# Restart attempts per outage before the unit is left to admins
+MAX_ATTEMPTS = 3
+
+# Seconds before the second attempt, doubled for every next one up to MAX_BACKOFF
+BACKOFF = 10
+MAX_BACKOFF = 300
+
+# A unit that failed or was restarted by systemd FLAP_THRESHOLD times within FLAP_WINDOW seconds is flapping
+FLAP_WINDOW = 600
+FLAP_THRESHOLD = 5
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class UnitHistory:
+    """Failures of one unit within the flap window and the state of its remediation."""
+
+    # Monotonic times of failures and of restarts done by systemd itself
+    events: Deque[float] = field(default_factory=deque)
+    # NRestarts seen in the previous probe
+    restarts: Optional[int] = None
+    failing: bool = False
+    attempts: int = 0
+    # Given up on, until the unit is seen running again and is not flapping
+    escalated: bool = False
+    task: Optional[asyncio.Task] = None
+
+
+class Remediator:
+    """
+    Restarts failed units opted in with "remediate" in the units file.
+
+    observe() gets the probe results of every status check. A unit in the
+    "failed" state is restarted through ServiceActions, which waits until it
+    is active again. A failed attempt is retried after `backoff` seconds,
+    doubled for every next attempt up to `max_backoff`, at most
+    `max_attempts` times per outage. Units stopped by hand are "inactive"
+    and are never touched.
+
+    Failures seen by the probes and restarts done by systemd (NRestarts) are
+    counted over `flap_window` seconds. A unit that reaches `flap_threshold`
+    is flapping: it is not restarted, and neither is a unit that is still
+    down after the last attempt. Both cases are escalated to admins, every
+    attempt and its outcome is reported through `report`.
+    """
+
+    def __init__(self, actions: ServiceActions, snapshot: StatusSnapshot, discovery: UnitDiscovery,
+                 max_attempts: int = MAX_ATTEMPTS, backoff: float = BACKOFF, max_backoff: float = MAX_BACKOFF,
+                 flap_window: float = FLAP_WINDOW, flap_threshold: int = FLAP_THRESHOLD):
+        self.actions = actions
+        self.snapshot = snapshot
+        self.discovery = discovery
+        self.enable = False
+        self.max_attempts = max_attempts
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.flap_window = flap_window
+        self.flap_threshold = flap_threshold
+
+        # Awaited with the HTML text of every report, set in bot.py
+        self.report: Optional[Callable[[str], Awaitable]] = None
+        self.units: Dict[str, UnitHistory] = {}
+
+    def _prune(self, history: UnitHistory, now: float):
+        while history.events and now - history.events[0] > self.flap_window:
+            history.events.popleft()
+
+    def is_flapping(self, history: UnitHistory) -> bool:
+        self._prune(history, time.monotonic())
+        return len(history.events) >= self.flap_threshold
+
+    def observe(self, results: List[Dict]):
+        """Update unit histories from probe results and start remediation of failed units."""
+        if not self.enable:
+            return
+
+        now = time.monotonic()
+        for result in results:
+            service_name = result["service"]
+            if service_name not in self.discovery.remediated:
+                continue
+            history = self.units.setdefault(service_name, UnitHistory())
+
+            restarts = result.get("restarts")
+            if restarts is not None:
+                if history.restarts is not None and restarts > history.restarts:
+                    history.events.extend([now] * (restarts - history.restarts))
+                history.restarts = restarts
+
+            failing = result.get("status") == "failed"
+            if failing and not history.failing:
+                history.events.append(now)
+            history.failing = failing
+            self._prune(history, now)
+
+            if history.task is not None and not history.task.done():
+                continue
+            if not failing:
+                if result.get("active"):
+                    history.attempts = 0
+                    # A flapping unit stays escalated until it has been quiet for the whole window
+                    if len(history.events) < self.flap_threshold:
+                        history.escalated = False
+                continue
+            if history.escalated or self._in_bulk(service_name):
+                continue
+            history.task = asyncio.create_task(self._remediate(service_name, history))
+
+        # Units no longer monitored or opted out
+        for service_name in list(self.units):
+            if service_name not in self.discovery.remediated and self.units[service_name].task is None:
+                del self.units[service_name]
+
+    def _in_bulk(self, service_name: str) -> bool:
+        bulk = self.actions.current
+        return bulk is not None and not bulk.finished and service_name in bulk.services
+
+    async def _remediate(self, service_name: str, history: UnitHistory):
+        try:
+            await self._restart_until_recovered(service_name, history)
+        except Exception:
+            logger.exception("Auto-remediation failed", extra={"unit": service_name})
+        finally:
+            history.task = None
+
+    async def _restart_until_recovered(self, service_name: str, history: UnitHistory):
+        display_name = html.escape(self.discovery.display_name(service_name))
+        while True:
+            if self.is_flapping(history):
+                await self._escalate(
+                    service_name, history, "flapping",
+                    f"🚨 <b>{display_name}</b> падает слишком часто: {len(history.events)} раз за последние "
+                    f"{self.flap_window:g} с. Автоперезапуск остановлен, нужна проверка вручную."
+                )
+                return
+            if history.attempts >= self.max_attempts:
+                await self._escalate(
+                    service_name, history, "attempts",
+                    f"🚨 <b>{display_name}</b> не запустился после {history.attempts} попыток автоперезапуска. "
+                    f"Автоперезапуск остановлен, нужна проверка вручную."
+                )
+                return
+
+            history.attempts += 1
+            attempt = f"{history.attempts}/{self.max_attempts}"
+            result = await self.actions.apply(service_name, "restart")
+            metrics.REMEDIATION_ATTEMPTS.inc(unit=service_name, result="ok" if result.ok else "failed")
+            logger.warning(f"Auto-restart {attempt}: {result.message}",
+                           extra={"unit": service_name, "duration_ms": round(result.duration * 1000, 1)})
+
+            if result.ok:
+                history.failing = False
+                history.attempts = 0
+                await self._report(f"🛠 <b>{display_name}</b> упал и перезапущен автоматически "
+                                   f"(попытка {attempt}), работает через {result.duration:.1f} с.")
+                return
+
+            if history.attempts >= self.max_attempts:
+                continue
+            delay = min(self.backoff * 2 ** (history.attempts - 1), self.max_backoff)
+            await self._report(f"⚠️ Автоперезапуск <b>{display_name}</b> не удался (попытка {attempt}): "
+                               f"{html.escape(result.message)}. Следующая попытка через {delay:g} с.")
+            await asyncio.sleep(delay)
+
+            # Recovered by itself or stopped by an admin meanwhile
+            results = await self.snapshot.get([service_name], max_age=0)
+            if not results or results[0].get("status") != "failed":
+                history.failing = False
+                history.attempts = 0
+                if results and results[0].get("active"):
+                    await self._report(f"✅ <b>{display_name}</b> снова работает.")
+                return
+
+    async def _escalate(self, service_name: str, history: UnitHistory, reason: str, text: str):
+        history.escalated = True
+        metrics.REMEDIATION_ESCALATIONS.inc(unit=service_name, reason=reason)
+        logger.error(f"Auto-remediation gave up: {reason}", extra={"unit": service_name})
+        await self._report(text)
+
+    async def _report(self, text: str):
+        if self.report is None:
+            return
+        try:
+            await self.report(text)
+        except Exception:
+            logger.exception("Auto-remediation report failed")
+
+
+# Policy is set from the config in bot.py
+remediator = Remediator(service_actions, snapshot, discovery)
@@ -1,46 +1,83 @@
+import asyncio
+import html
+import logging
+
 import pytz
 from datetime import datetime, timedelta
+from typing import Optional
 from aiogram import Bot
 from apscheduler.schedulers.asyncio import AsyncIOScheduler
 
-from tgbot.config import load_config
-from tgbot.services.db import check_kpi_data_completeness
-from tgbot.services.checker import ServiceChecker, SERVICES_CONFIG
+from tgbot.config import Config
+from tgbot.services import metrics
+from tgbot.services.broadcaster import broadcast
+from tgbot.services.checker import snapshot
+from tgbot.services.completeness import format_kpi_gaps, kpi_completeness
+from tgbot.services.discovery import discovery
+from tgbot.services.metrics import timed
+from tgbot.services.remediation import remediator
+from tgbot.services.state import AlertStateStore
 
 scheduler = AsyncIOScheduler(timezone=pytz.utc)
-config = load_config(".env")
 
-# Store last notification state to avoid spam
-last_offline_services = set()
-last_notification_time = {}
+# Set by configure() from the config loaded in bot.py
+config: Optional[Config] = None
+
+# Last notification state to avoid spam, kept across restarts
+alert_state = AlertStateStore("alert_state.sqlite3")
+
+# Interval job and unit watcher must not update the state concurrently
+status_check_lock = asyncio.Lock()
+
 
+def configure(bot_config: Config):
+    """Set the config used by the jobs and the alert state file"""
+    global config
+    config = bot_config
+    alert_state.path = config.checkers.alert_state_path
 
+
+@timed(metrics.JOB_DURATION, job="kpi_check")
 async def kpi_check(bot: Bot):
-    """Check KPI from DB"""
-    kpi_completeness, wrong_divisions = await check_kpi_data_completeness()
-    if kpi_completeness:
+    """Check KPI from DB for the last KPI_CHECK_DAYS days"""
+    admins = config.tg_bot.admin_ids
+    try:
+        missing = await kpi_completeness.check_last_days(config.checkers.kpi_check_days)
+    except Exception as e:
+        logging.exception("KPI completeness check failed")
+        await broadcast(bot, admins, f"⚠️ Не удалось проверить KPI: {html.escape(str(e))}")
         return
 
-    admins = config.tg_bot.admin_ids
-    message = "⚠️ Обнаружено несоответствие в датах KPI для следующих отделов:\n"
-    for division in wrong_divisions:
-        message += f"- {division}\n"
+    if not missing:
+        return
 
-    for admin in admins:
-        await bot.send_message(admin, message)
+    await broadcast(bot, admins, format_kpi_gaps(missing))
 
 
+@timed(metrics.JOB_DURATION, job="services_status_check")
 async def services_status_check(bot: Bot):
     """Check all services status and notify admins about offline services"""
-    global last_offline_services, last_notification_time
+    async with status_check_lock:
+        await _services_status_check(bot)
 
-    try:
-        # Get all services from config
-        services = list(SERVICES_CONFIG.keys())
-        service_checker = ServiceChecker(services)
 
+async def unit_state_changed(bot: Bot, changes: dict):
+    """Re-check services right away when the unit watcher sees a state change"""
+    snapshot.invalidate(list(changes))
+    await services_status_check(bot)
+
+
+async def _services_status_check(bot: Bot):
+    await alert_state.load()
+    last_offline_services = alert_state.offline_services
+    last_notification_time = alert_state.notification_time
+
+    try:
         # Check all services
-        results = service_checker.check_all_services()
+        results = await snapshot.get()
+
+        # Failed units opted in to auto-remediation are restarted in the background
+        remediator.observe(results)
 
         # Find currently offline services
         current_offline_services = set()
@@ -50,7 +87,7 @@ async def services_status_check(bot: Bot):
 
         for result in results:
             service_name = result['service']
-            display_name = SERVICES_CONFIG.get(service_name, {}).get('display_name', service_name)
+            display_name = discovery.display_name(service_name)
 
             # Consider service offline if not active or has errors
             is_offline = not result.get('active', False) or result.get('error') is not None
@@ -100,7 +137,7 @@ async def services_status_check(bot: Bot):
                 if newly_offline:
                     message += "<b>Новые проблемы:</b>\n"
                     for service_name in newly_offline:
-                        display_name = SERVICES_CONFIG.get(service_name, {}).get('display_name', service_name)
+                        display_name = discovery.display_name(service_name)
                         message += f"❌ {display_name}\n"
                         # Update notification time
                         last_notification_time[service_name] = current_time
@@ -109,7 +146,7 @@ async def services_status_check(bot: Bot):
                 if services_recovered:
                     message += "<b>Восстановленные сервисы:</b>\n"
                     for service_name in services_recovered:
-                        display_name = SERVICES_CONFIG.get(service_name, {}).get('display_name', service_name)
+                        display_name = discovery.display_name(service_name)
                         message += f"✅ {display_name}\n"
                         # Remove from notification tracking since it's recovered
                         last_notification_time.pop(service_name, None)
@@ -126,7 +163,7 @@ async def services_status_check(bot: Bot):
                 message = "✅ <b>Все сервисы восстановлены!</b>\n\n"
                 message += "Восстановленные сервисы:\n"
                 for service_name in services_recovered:
-                    display_name = SERVICES_CONFIG.get(service_name, {}).get('display_name', service_name)
+                    display_name = discovery.display_name(service_name)
                     message += f"✅ {display_name}\n"
                     # Clear notification tracking
                     last_notification_time.pop(service_name, None)
@@ -134,21 +171,51 @@ async def services_status_check(bot: Bot):
                 message += f"\n⏰ Проверено: {current_time.strftime('%H:%M:%S %d.%m.%Y')}"
 
             # Send notification to all admins
-            for admin_id in admins:
-                try:
-                    await bot.send_message(admin_id, message, parse_mode="HTML")
-                except Exception as e:
-                    print(f"Failed to send notification to admin {admin_id}: {e}")
+            await broadcast(bot, admins, message)
 
         # Update last state
-        last_offline_services = current_offline_services.copy()
+        alert_state.offline_services = current_offline_services.copy()
 
         # Clean up old notification times for recovered services
         for service_name in list(last_notification_time.keys()):
             if service_name not in current_offline_services:
                 last_notification_time.pop(service_name, None)
 
+        alert_state.save()
+
     except Exception as e:
-        print(f"Error in check_services_status: {e}")
-        # On error, reset the state to avoid getting stuck
-        last_offline_services = set()
\ No newline at end of file
+        # Keep the previous state, resetting it would re-alert on every offline service
+        logging.exception(f"Error in check_services_status: {e}")
+
+
+async def log_error_alert(bot: Bot, service_name: str, log_message: str):
+    """Notify admins about a new error line in a service log (journal follower callback)"""
+    current_time = datetime.now()
+    cooldown_minutes = config.checkers.services_check_cooldown
+
+    await alert_state.load()
+    last_notif_time = alert_state.log_error_notification_time.get(service_name)
+    if last_notif_time is not None and (current_time - last_notif_time).total_seconds() <= cooldown_minutes * 60:
+        return
+    alert_state.log_error_notification_time[service_name] = current_time
+    alert_state.save()
+
+    display_name = discovery.display_name(service_name)
+    if len(log_message) > 300:
+        log_message = log_message[:297] + "..."
+
+    message = f"⚠️ <b>Ошибка в логе сервиса {display_name}:</b>\n\n"
+    message += f"<code>{html.escape(log_message)}</code>"
+    message += f"\n\n⏰ {current_time.strftime('%H:%M:%S %d.%m.%Y')}"
+
+    await broadcast(bot, config.tg_bot.admin_ids, message)
+
+
+async def remediation_report(bot: Bot, text: str):
+    """Notify admins about an automatic restart or a unit left to them (remediator report)"""
+    await broadcast(bot, config.tg_bot.admin_ids, text)
+
+
+def job_missed(event):
+    """Count scheduler jobs that missed their run time or were skipped as still running"""
+    metrics.JOB_MISFIRES.inc(job=event.job_id)
@@ -0,0 +1,146 @@
+import asyncio
+import logging
+import sqlite3
+from datetime import datetime
+from typing import Dict, Optional, Set
+
+# Seconds to collect changes before they are written to disk
+FLUSH_DELAY = 2
+
+logger = logging.getLogger(__name__)
+
+
+class AlertStateStore:
+    """
+    Alert suppression state of services_status_check that survives restarts.
+
+    The state lives in memory and is loaded lazily from SQLite on first use.
+    save() only marks it dirty; the write happens in the default executor
+    after FLUSH_DELAY seconds, so several updates end up in one transaction
+    and probes never wait for the disk. Changes saved while a write is
+    running are written by the same flush task right after it, a failed
+    write is retried the same way. Writes never overlap, close() waits for
+    the running one before the final write.
+    """
+
+    def __init__(self, path: str, flush_delay: float = FLUSH_DELAY):
+        self.path = path
+        self.flush_delay = flush_delay
+
+        self.offline_services: Set[str] = set()
+        self.notification_time: Dict[str, datetime] = {}
+        self.log_error_notification_time: Dict[str, datetime] = {}
+
+        self._loaded = False
+        self._dirty = False
+        self._load_lock = asyncio.Lock()
+        self._write_lock = asyncio.Lock()
+        self._flush_task: Optional[asyncio.Task] = None
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.path)
+        conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS alert_state (
+                service TEXT PRIMARY KEY,
+                offline INTEGER NOT NULL DEFAULT 0,
+                notified_at TEXT,
+                log_error_notified_at TEXT
+            )
+            """
+        )
+        return conn
+
+    def _read(self):
+        conn = self._connect()
+        try:
+            return conn.execute(
+                "SELECT service, offline, notified_at, log_error_notified_at FROM alert_state"
+            ).fetchall()
+        finally:
+            conn.close()
+
+    def _write(self, rows):
+        conn = self._connect()
+        try:
+            with conn:
+                conn.execute("DELETE FROM alert_state")
+                conn.executemany(
+                    "INSERT INTO alert_state (service, offline, notified_at, log_error_notified_at) "
+                    "VALUES (?, ?, ?, ?)",
+                    rows,
+                )
+        finally:
+            conn.close()
+
+    async def load(self):
+        """Load the saved state once; later calls return immediately."""
+        if self._loaded:
+            return
+        async with self._load_lock:
+            if self._loaded:
+                return
+            loop = asyncio.get_running_loop()
+            try:
+                rows = await loop.run_in_executor(None, self._read)
+            except Exception:
+                logger.exception(f"Failed to load alert state from {self.path}")
+                rows = []
+
+            for service, offline, notified_at, log_error_notified_at in rows:
+                if offline:
+                    self.offline_services.add(service)
+                if notified_at:
+                    self.notification_time[service] = datetime.fromisoformat(notified_at)
+                if log_error_notified_at:
+                    self.log_error_notification_time[service] = datetime.fromisoformat(log_error_notified_at)
+            self._loaded = True
+
+    def _rows(self):
+        services = self.offline_services | set(self.notification_time) | set(self.log_error_notification_time)
+        rows = []
+        for service in sorted(services):
+            notified_at = self.notification_time.get(service)
+            log_error_notified_at = self.log_error_notification_time.get(service)
+            rows.append((
+                service,
+                int(service in self.offline_services),
+                notified_at.isoformat() if notified_at else None,
+                log_error_notified_at.isoformat() if log_error_notified_at else None,
+            ))
+        return rows
+
+    def save(self):
+        """Schedule a write of the current state."""
+        self._dirty = True
+        if self._flush_task is None or self._flush_task.done():
+            self._flush_task = asyncio.create_task(self._delayed_flush())
+
+    async def _delayed_flush(self):
+        # save() during a write only sets the flag, the change is written by the next round
+        while self._dirty:
+            await asyncio.sleep(self.flush_delay)
+            # Cancelling the task must not release the lock while the executor is still writing
+            await asyncio.shield(self.flush())
+
+    async def flush(self):
+        """Write the current state right away, after a write that is already running."""
+        async with self._write_lock:
+            self._dirty = False
+            rows = self._rows()
+            loop = asyncio.get_running_loop()
+            try:
+                await loop.run_in_executor(None, self._write, rows)
+            except Exception:
+                self._dirty = True
+                logger.exception(f"Failed to save alert state to {self.path}")
+
+    async def close(self):
+        """Stop the delayed flush and write the current state, used on shutdown."""
+        if self._flush_task is not None and not self._flush_task.done():
+            self._flush_task.cancel()
+            try:
+                await self._flush_task
+            except asyncio.CancelledError:
+                pass
+        await self.flush()
@@ -0,0 +1,126 @@
+import math
+import time
+from array import array
+from typing import Dict, List, Optional, Tuple
+
+# Samples kept per unit: one hour at a 5 second probe rate
+SERIES_CAPACITY = 720
+
+# systemd reports this value for counters that are not available
+UNSET_COUNTER = 2 ** 64 - 1
+
+SPARK_CHARS = "▁▂▃▄▅▆▇█"
+
+
+def parse_counter(value) -> float:
+    """Convert a systemd counter property to float, NaN if it is not set."""
+    try:
+        number = int(value)
+    except (TypeError, ValueError):
+        return math.nan
+    return math.nan if number == UNSET_COUNTER else float(number)
+
+
+class UnitSeries:
+    """Fixed-capacity ring buffers with the resource samples of one unit."""
+
+    def __init__(self, capacity: int = SERIES_CAPACITY):
+        self.capacity = capacity
+        self.timestamps = array("d", [0.0] * capacity)
+        self.cpu_nsec = array("d", [math.nan] * capacity)
+        self.memory = array("d", [math.nan] * capacity)
+        self._next = 0
+        self._size = 0
+
+    def append(self, timestamp: float, cpu_nsec: float, memory: float):
+        i = self._next
+        self.timestamps[i] = timestamp
+        self.cpu_nsec[i] = cpu_nsec
+        self.memory[i] = memory
+        self._next = (i + 1) % self.capacity
+        self._size = min(self._size + 1, self.capacity)
+
+    def indexes(self, since: float = 0.0) -> List[int]:
+        """Buffer positions of samples not older than `since`, oldest first."""
+        start = (self._next - self._size) % self.capacity
+        positions = ((start + i) % self.capacity for i in range(self._size))
+        return [i for i in positions if self.timestamps[i] >= since]
+
+    def __len__(self):
+        return self._size
+
+
+class ResourceHistory:
+    """
+    In-memory CPU and memory history per unit, fed by every probe.
+
+    Memory use is bounded by unit count × capacity: three float arrays per unit.
+    """
+
+    def __init__(self, capacity: int = SERIES_CAPACITY):
+        self.capacity = capacity
+        self._series: Dict[str, UnitSeries] = {}
+
+    def record(self, service_name: str, memory, cpu_nsec, timestamp: float = None):
+        """Store one sample of the MemoryCurrent and CPUUsageNSec properties."""
+        series = self._series.get(service_name)
+        if series is None:
+            series = self._series[service_name] = UnitSeries(self.capacity)
+        series.append(time.time() if timestamp is None else timestamp, parse_counter(cpu_nsec), parse_counter(memory))
+
+    def cpu_percent(self, service_name: str, window: float = 3600) -> List[Tuple[float, float]]:
+        """CPU usage in percent of one core between consecutive samples."""
+        series = self._series.get(service_name)
+        if series is None:
+            return []
+
+        points = []
+        previous = None
+        for i in series.indexes(time.time() - window):
+            if previous is not None:
+                elapsed = series.timestamps[i] - series.timestamps[previous]
+                used = series.cpu_nsec[i] - series.cpu_nsec[previous]
+                # Counter resets on restart, such deltas are skipped
+                if elapsed > 0 and used >= 0:
+                    points.append((series.timestamps[i], used / (elapsed * 1e9) * 100))
+            if not math.isnan(series.cpu_nsec[i]):
+                previous = i
+        return points
+
+    def memory_values(self, service_name: str, window: float = 3600) -> List[float]:
+        """Memory samples in bytes for the window, oldest first."""
+        series = self._series.get(service_name)
+        if series is None:
+            return []
+        values = (series.memory[i] for i in series.indexes(time.time() - window))
+        return [value for value in values if not math.isnan(value)]
+
+    def memory_stats(self, service_name: str, window: float = 3600) -> Optional[Dict[str, float]]:
+        """Min, avg and max memory in bytes for the window."""
+        values = self.memory_values(service_name, window)
+        if not values:
+            return None
+        return {"min": min(values), "avg": sum(values) / len(values), "max": max(values)}
+
+    def forget(self, service_name: str):
+        self._series.pop(service_name, None)
+
+
+def sparkline(values: List[float], width: int = 20) -> str:
+    """Render values as a line of block characters, averaging them into `width` columns."""
+    if not values:
+        return ""
+
+    if len(values) > width:
+        step = len(values) / width
+        values = [
+            sum(chunk) / len(chunk)
+            for chunk in (values[int(i * step):int((i + 1) * step)] for i in range(width))
+            if chunk
+        ]
+
+    low, high = min(values), max(values)
+    if high - low < 1e-9:
+        return SPARK_CHARS[0] * len(values)
+    scale = (len(SPARK_CHARS) - 1) / (high - low)
+    return "".join(SPARK_CHARS[int((value - low) * scale)] for value in values)
@@ -0,0 +1,177 @@
+import asyncio
+import json
+import logging
+import time
+from typing import Awaitable, Callable, Dict, List, Optional
+
+# Unit states worth reacting to; transitional ones are followed by one of these
+SETTLED_STATES = ("active", "inactive", "failed")
+
+# Changes arriving within this many seconds are reported together
+DEBOUNCE_DELAY = 0.5
+
+# Restart delays for a died busctl process, in seconds
+RESTART_DELAY = 1
+MAX_RESTART_DELAY = 60
+
+UNIT_PATH_PREFIX = "/org/freedesktop/systemd1/unit/"
+
+MONITOR_MATCH = (
+    "type='signal',"
+    "sender='org.freedesktop.systemd1',"
+    "interface='org.freedesktop.DBus.Properties',"
+    "member='PropertiesChanged'"
+)
+
+logger = logging.getLogger(__name__)
+
+
+def unit_object_path(service_name: str) -> str:
+    """Build the D-Bus object path systemd uses for a unit."""
+    escaped = ""
+    for i, char in enumerate(service_name):
+        if char.isascii() and char.isalnum() and not (i == 0 and char.isdigit()):
+            escaped += char
+        else:
+            escaped += "".join(f"_{byte:02x}" for byte in char.encode())
+    return UNIT_PATH_PREFIX + escaped
+
+
+class UnitWatcher:
+    """Watch unit state changes through a `busctl monitor` stream.
+
+    systemd publishes `PropertiesChanged` signals for units on the system
+    bus. The watcher picks ActiveState changes of monitored units out of
+    the stream and awaits `on_change(changes)` with a dict of unit name to
+    its new settled state.
+    """
+
+    def __init__(
+        self,
+        services: List[str],
+        on_change: Optional[Callable[[Dict[str, str]], Awaitable]] = None,
+        debounce: float = DEBOUNCE_DELAY,
+    ):
+        self.on_change = on_change
+        self.debounce = debounce
+        self.states: Dict[str, str] = {}
+
+        self._paths = {unit_object_path(service): service for service in services}
+        self._pending: Dict[str, str] = {}
+        self._flush_task: Optional[asyncio.Task] = None
+        self._task: Optional[asyncio.Task] = None
+
+    def set_services(self, services: List[str]) -> None:
+        """Change the watched units; the monitor stream covers all units, so no restart is needed."""
+        watched = set(services)
+        self._paths = {unit_object_path(service): service for service in watched}
+        self.states = {service: state for service, state in self.states.items() if service in watched}
+
+    def feed(self, line: str) -> Optional[Dict]:
+        """Parse one `busctl monitor --json=short` message.
+
+        Returns a dict with `service` and `state` for a settled ActiveState
+        change of a monitored unit, otherwise None.
+        """
+        line = line.strip()
+        if not line:
+            return None
+        try:
+            message = json.loads(line)
+        except ValueError:
+            return None
+
+        service_name = self._paths.get(message.get("path"))
+        if service_name is None or message.get("member") != "PropertiesChanged":
+            return None
+
+        try:
+            interface, changed, _ = message["payload"]["data"]
+        except (KeyError, TypeError, ValueError):
+            return None
+        if interface != "org.freedesktop.systemd1.Unit" or "ActiveState" not in changed:
+            return None
+
+        state = changed["ActiveState"].get("data")
+        if state not in SETTLED_STATES or self.states.get(service_name) == state:
+            return None
+
+        self.states[service_name] = state
+        return {"service": service_name, "state": state}
+
+    async def _flush(self) -> None:
+        await asyncio.sleep(self.debounce)
+        changes, self._pending = self._pending, {}
+        self._flush_task = None
+        if changes and self.on_change:
+            try:
+                await self.on_change(changes)
+            except Exception:
+                logger.exception("Unit state change callback failed")
+
+    async def consume(self, stream) -> None:
+        """Read monitor messages from a stream until EOF."""
+        while True:
+            try:
+                line = await stream.readline()
+            except ValueError:
+                continue
+            if not line:
+                return
+
+            if isinstance(line, bytes):
+                line = line.decode(errors="replace")
+
+            change = self.feed(line)
+            if change:
+                self._pending[change["service"]] = change["state"]
+                if self._flush_task is None:
+                    self._flush_task = asyncio.create_task(self._flush())
+
+    async def _monitor(self) -> None:
+        """Run busctl monitor once and consume its output until it exits."""
+        process = await asyncio.create_subprocess_exec(
+            "sudo", "busctl", "monitor", "--system", "--json=short", f"--match={MONITOR_MATCH}",
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.DEVNULL,
+            limit=1024 * 1024,
+        )
+        try:
+            await self.consume(process.stdout)
+        finally:
+            if process.returncode is None:
+                process.kill()
+            await process.wait()
+
+    async def run(self) -> None:
+        """Watch forever, restarting busctl when it dies."""
+        delay = RESTART_DELAY
+        while True:
+            started = time.monotonic()
+            try:
+                await self._monitor()
+                logger.warning("busctl monitor exited, restarting")
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception("busctl monitor failed, restarting")
+
+            if time.monotonic() - started > MAX_RESTART_DELAY:
+                delay = RESTART_DELAY
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, MAX_RESTART_DELAY)
+
+    def start(self) -> None:
+        """Start watching in a background task."""
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self.run())
+
+    async def stop(self) -> None:
+        """Stop the background task and the busctl process."""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
@@ -0,0 +1,145 @@
+import asyncio
+import logging
+import signal
+from typing import Any, Optional, Set
+
+from aiogram import Bot, Dispatcher
+from aiogram.methods import TelegramMethod
+from aiogram.webhook.aiohttp_server import SimpleRequestHandler, setup_application
+from aiohttp import web
+
+from tgbot.config import WebhookConfig
+
+# Updates processed at the same time, the rest wait for a free slot
+MAX_CONCURRENT_UPDATES = 20
+
+# Updates accepted and not processed yet, above it new ones get 503 and are delivered again later
+MAX_PENDING_UPDATES = 200
+
+SECRET_HEADER = "X-Telegram-Bot-Api-Secret-Token"
+
+# Range of max_connections accepted by setWebhook
+MIN_WEBHOOK_CONNECTIONS = 1
+MAX_WEBHOOK_CONNECTIONS = 100
+
+logger = logging.getLogger(__name__)
+
+
+class BoundedRequestHandler(SimpleRequestHandler):
+    """
+    Webhook handler that answers Telegram right away and processes updates
+    in the background, at most `max_concurrent` of them at a time. When
+    `max_pending` updates are already waiting, new ones get 503 and
+    Telegram retries them later, so a slow backend does not pile up tasks.
+
+    After close_intake() new updates get 503, so Telegram delivers them
+    again to another replica or after restart, and drain() waits for the
+    accepted ones to finish.
+    """
+
+    def __init__(self, dispatcher: Dispatcher, bot: Bot, secret_token: Optional[str] = None,
+                 max_concurrent: int = MAX_CONCURRENT_UPDATES, max_pending: int = MAX_PENDING_UPDATES,
+                 **data: Any):
+        super().__init__(dispatcher, bot, handle_in_background=True, secret_token=secret_token, **data)
+        self._slots = asyncio.Semaphore(max_concurrent)
+        self._tasks: Set[asyncio.Task] = set()
+        self.max_pending = max(max_pending, max_concurrent)
+        self._accepting = True
+
+    @property
+    def pending(self) -> int:
+        """Updates accepted and not processed yet"""
+        return len(self._tasks)
+
+    async def handle(self, request: web.Request) -> web.Response:
+        bot = await self.resolve_bot(request)
+        if not self.verify_secret(request.headers.get(SECRET_HEADER, ""), bot):
+            return web.Response(body="Unauthorized", status=401)
+        if not self._accepting:
+            return web.Response(body="Shutting down", status=503)
+        if len(self._tasks) >= self.max_pending:
+            logger.warning(f"Webhook backlog is full ({len(self._tasks)} updates), rejecting update")
+            return web.Response(body="Too many pending updates", status=503)
+
+        update = await request.json(loads=bot.session.json_loads)
+        task = asyncio.create_task(self._process(bot, update))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return web.json_response({}, dumps=bot.session.json_dumps)
+
+    async def _process(self, bot: Bot, update: dict):
+        async with self._slots:
+            try:
+                result = await self.dispatcher.feed_raw_update(bot, update, **self.data)
+                if isinstance(result, TelegramMethod):
+                    await self.dispatcher.silent_call_request(bot, result)
+            except Exception:
+                logger.exception(f"Update {update.get('update_id')} failed")
+
+    def close_intake(self):
+        self._accepting = False
+
+    async def drain(self, timeout: float):
+        """Wait for accepted updates, cancel the ones still running after `timeout` seconds"""
+        if not self._tasks:
+            return
+        logger.info(f"Waiting for {len(self._tasks)} updates")
+        _, running = await asyncio.wait(set(self._tasks), timeout=timeout)
+        for task in running:
+            task.cancel()
+        if running:
+            logger.warning(f"Cancelled {len(running)} updates on shutdown")
+            await asyncio.gather(*running, return_exceptions=True)
+
+
+def create_app(dp: Dispatcher, bot: Bot, path: str, secret: Optional[str] = None,
+               max_concurrent: int = MAX_CONCURRENT_UPDATES,
+               max_pending: int = MAX_PENDING_UPDATES) -> web.Application:
+    """Build the aiohttp application serving updates on `path`. The handler is kept in app["handler"]."""
+    app = web.Application()
+    handler = BoundedRequestHandler(dp, bot, secret_token=secret, max_concurrent=max_concurrent,
+                                    max_pending=max_pending)
+    handler.register(app, path=path)
+    # Runs the dispatcher startup and shutdown hooks with the app
+    setup_application(app, dp, bot=bot)
+    app["handler"] = handler
+    return app
+
+
+async def run_webhook(dp: Dispatcher, bot: Bot, config: WebhookConfig):
+    """Serve updates until SIGINT/SIGTERM, then finish the accepted ones and stop."""
+    app = create_app(dp, bot, config.path, config.secret, config.max_concurrent_updates,
+                     config.max_pending_updates)
+    handler: BoundedRequestHandler = app["handler"]
+
+    runner = web.AppRunner(app)
+    await runner.setup()
+    await web.TCPSite(runner, config.host, config.port).start()
+    logger.info(f"Webhook is listening on {config.host}:{config.port}{config.path}")
+
+    # Without a URL the webhook is expected to be set already, e.g. by another replica
+    if config.url:
+        await bot.set_webhook(
+            config.url,
+            secret_token=config.secret,
+            allowed_updates=dp.resolve_used_update_types(),
+            max_connections=min(max(config.max_concurrent_updates, MIN_WEBHOOK_CONNECTIONS),
+                                MAX_WEBHOOK_CONNECTIONS),
+        )
+
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        try:
+            loop.add_signal_handler(sig, stop.set)
+        except NotImplementedError:
+            pass
+
+    try:
+        await stop.wait()
+    finally:
+        logger.info("Stopping webhook")
+        handler.close_intake()
+        await handler.drain(config.shutdown_timeout)
+        # The webhook is not deleted, other replicas keep serving it
+        await runner.cleanup()